@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Vercel Serverless Function for paged YouTube playlist and channel listing
+"""
+
+import os
+import sys
+import json
+import logging
+from http.server import BaseHTTPRequestHandler
+
+# Make the shared project modules importable from the serverless function
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.admission import ConcurrencyLimiter, RateLimiter, TooManyRequests
+from core.backends import create_backend
+from core.downloader import EXTRACTION_CONFIGS
+from core.playlist import PlaylistPager
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+playlist_pager = PlaylistPager(EXTRACTION_CONFIGS[0][1], limiter=ConcurrencyLimiter.from_env())
+# Per-client token buckets; Vercel's proxy puts the client IP in X-Forwarded-For
+rate_limiter = RateLimiter.from_env(backend=create_backend())
+
+class handler(BaseHTTPRequestHandler):
+    def _set_headers(self, status_code=200, extra_headers=None):
+        self.send_response(status_code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-API-Key')
+        self.send_header('Access-Control-Expose-Headers', 'Retry-After')
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def do_OPTIONS(self):
+        self._set_headers()
+        self.wfile.write(b'')
+
+    def do_POST(self):
+        try:
+            content_length = int(self.headers['Content-Length'])
+            post_data = self.rfile.read(content_length)
+            data = json.loads(post_data.decode('utf-8'))
+            
+            if not data or 'url' not in data:
+                self._set_headers(400)
+                self.wfile.write(json.dumps({'error': 'URL is required'}).encode('utf-8'))
+                return
+            
+            rate_limiter.acquire(rate_limiter.client_key(self.client_address[0], self.headers, trust_forwarded=True))
+            page = playlist_pager.page(data['url'], data.get('cursor'), data.get('page_size'))
+            logger.info(f"Listed {len(page['entries'])} entries of playlist {page['playlist_id']}")
+            
+            self._set_headers(200)
+            self.wfile.write(json.dumps(page).encode('utf-8'))
+            
+        except TooManyRequests as e:
+            logger.warning(f"Request shed: {str(e)}")
+            self._set_headers(429, {'Retry-After': e.retry_after_header})
+            self.wfile.write(json.dumps({'error': str(e), 'retry_after': int(e.retry_after_header)}).encode('utf-8'))
+        except ValueError as e:
+            logger.error(f"Validation error: {str(e)}")
+            self._set_headers(400)
+            self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
+        except Exception as e:
+            logger.error(f"Unexpected error: {str(e)}")
+            self._set_headers(500)
+            self.wfile.write(json.dumps({'error': 'Failed to list playlist entries'}).encode('utf-8'))
+
+    def do_GET(self):
+        self._set_headers(405)
+        self.wfile.write(json.dumps({'error': 'Method not allowed'}).encode('utf-8'))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Vercel Serverless Function for resized, cached video thumbnails
+"""
+
+import os
+import sys
+import json
+import logging
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Make the shared project modules importable from the serverless function
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.admission import RateLimiter, TooManyRequests
+from core.backends import create_backend
+from core.responses import etag_matches
+from core.thumbnails import DEFAULT_SIZE, ThumbnailNotFound, ThumbnailService
+from core.urls import VIDEO_ID_RE
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Module level, so variants in /tmp are reused by warm invocations
+thumbnails = ThumbnailService.from_env()
+# Per-client token buckets; Vercel's proxy puts the client IP in X-Forwarded-For
+rate_limiter = RateLimiter.from_env(backend=create_backend())
+
+class handler(BaseHTTPRequestHandler):
+    def _set_headers(self, status_code=200, extra_headers=None):
+        self.send_response(status_code)
+        extra_headers = extra_headers or {}
+        if 'Content-Type' not in extra_headers:
+            self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, If-None-Match')
+        self.send_header('Access-Control-Expose-Headers', 'ETag, Retry-After')
+        for name, value in extra_headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def do_OPTIONS(self):
+        self._set_headers()
+        self.wfile.write(b'')
+
+    def do_GET(self):
+        # /api/thumbnail/<video_id> is rewritten to /api/thumbnail?video_id=<video_id> (see vercel.json)
+        parsed = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        video_id = query.get('video_id') or parsed.path.rstrip('/').rsplit('/', 1)[-1]
+        if not VIDEO_ID_RE.fullmatch(video_id):
+            self._set_headers(400)
+            self.wfile.write(json.dumps({'error': 'Invalid video ID'}).encode('utf-8'))
+            return
+
+        try:
+            rate_limiter.acquire(rate_limiter.client_key(self.client_address[0], self.headers, trust_forwarded=True))
+            path, meta = thumbnails.get(video_id, query.get('size', DEFAULT_SIZE))
+            with open(path, 'rb') as f:
+                body = f.read()
+        except TooManyRequests as e:
+            logger.warning(f"Request shed: {str(e)}")
+            self._set_headers(429, {'Retry-After': e.retry_after_header})
+            self.wfile.write(json.dumps({'error': str(e), 'retry_after': int(e.retry_after_header)}).encode('utf-8'))
+            return
+        except ThumbnailNotFound as e:
+            self._set_headers(404)
+            self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
+            return
+        except ValueError as e:
+            self._set_headers(400)
+            self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
+            return
+        except Exception as e:
+            logger.error(f"Thumbnail error: {str(e)}")
+            self._set_headers(502)
+            self.wfile.write(json.dumps({'error': 'Failed to fetch thumbnail'}).encode('utf-8'))
+            return
+
+        etag = f'"{meta.get("etag", "")}"'
+        headers = {'ETag': etag, 'Cache-Control': f'public, max-age={thumbnails.max_age}'}
+        if etag_matches(self.headers.get('If-None-Match'), etag):
+            self._set_headers(304, {'Content-Type': meta.get('content_type', 'image/webp'), **headers})
+            return
+        self._set_headers(200, {'Content-Type': meta.get('content_type', 'image/webp'),
+                                'Content-Length': str(len(body)), **headers})
+        self.wfile.write(body)
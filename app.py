@@ -5,358 +5,246 @@ A Flask-based API for downloading YouTube videos using yt-dlp
 """
 
 import os
-import re
 import json
 import logging
-import tempfile
 import time
-import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, g, request, jsonify, send_file
 from flask_cors import CORS
-import yt_dlp
 from urllib.parse import urlparse, parse_qs
+from core import metrics
+from core.admission import Overloaded, RateLimited, RateLimiter, TooManyRequests
+from core.backends import create_backend
+from core.downloader import DOWNLOAD_DIR, EXTRACTION_CONFIGS, bot_signature, create_downloader
+from core.formats import filter_formats, parse_filters
+from core.jobs import JobManager, QueueFull
+from core.mux import CONTAINERS, MuxError, MuxLimitExceeded, MuxSourceExpired, MuxUnavailable, StreamMuxer, pick_tracks
+from core.playlist import PlaylistPager
+from core.refresh import URLRefresher
+from core.relay import StreamRelay, StreamLimitExceeded
+from core.responses import video_response
+from core.segmented import SegmentedDownloader
+from core.store import PROGRESS_SUFFIX, FileStore, StoreFull, make_key
+from core.thumbnails import DEFAULT_SIZE, ThumbnailNotFound, ThumbnailService
+from core.tracing import bind, end_trace, request_id, span, start_trace
+from core.urls import VIDEO_ID_RE, InvalidURLError, parse_many
+from core.ytdlp import ydl_pool
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__, static_folder='.', static_url_path='')
-CORS(app)  # Enable CORS for frontend integration
-
-# Configuration
-DOWNLOAD_DIR = os.path.join(tempfile.gettempdir(), 'youtube_downloads')
-os.makedirs(DOWNLOAD_DIR, exist_ok=True)
-
-class YouTubeVideoDownloader:
-    def __init__(self):
-        self.ydl_opts = {
-            'format': 'best[ext=mp4]/best',
-            'outtmpl': os.path.join(DOWNLOAD_DIR, '%(title)s.%(ext)s'),
-            'noplaylist': True,
-            'extract_flat': False,
-            'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'referer': 'https://www.youtube.com/',
-            'headers': {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                'Accept-Language': 'en-us,en;q=0.5',
-                'Accept-Encoding': 'gzip,deflate',
-                'Accept-Charset': 'ISO-8859-1,utf-8;q=0.7,*;q=0.7',
-                'Keep-Alive': '300',
-                'Connection': 'keep-alive',
-            },
-            'extractor_args': {
-                'youtube': {
-                    'skip': ['dash', 'hls'],
-                    'player_skip': ['configs', 'webpage']
-                }
-            },
-            'cookiefile': None,  # 可以后续添加cookie文件路径
-            'ignoreerrors': False,
-            'no_warnings': False,
-        }
-    
-    def normalize_youtube_url(self, url):
-        """Normalize YouTube URLs to ensure compatibility"""
-        url = url.strip()
-        
-        # Basic URL validation
-        if not url.startswith(('http://', 'https://')):
-            url = 'https://' + url
-        
-        # Convert various YouTube URL formats to standard format
-        # Handle youtu.be short links
-        if 'youtu.be/' in url:
-            video_id = url.split('youtu.be/')[1].split('?')[0].split('&')[0]
-            url = f'https://www.youtube.com/watch?v={video_id}'
-        
-        # Ensure www.youtube.com format (but avoid double www)
-        if 'youtube.com' in url and 'www.youtube.com' not in url:
-            url = url.replace('youtube.com', 'www.youtube.com')
-        if 'm.youtube.com' in url:
-            url = url.replace('m.youtube.com', 'www.youtube.com')
-        
-        return url
-    
-    def validate_youtube_url(self, url):
-        """Validate if the URL is a valid YouTube video URL"""
-        patterns = [
-            r'https?://(www\.)?youtube\.com/watch\?v=[\w-]+',
-            r'https?://youtu\.be/[\w-]+',
-            r'https?://(www\.)?youtube\.com/embed/[\w-]+',
-            r'https?://(www\.)?youtube\.com/v/[\w-]+',
-            r'https?://m\.youtube\.com/watch\?v=[\w-]+',
-            r'https?://(www\.)?youtube\.com/.+'
-        ]
-        
-        # Use search instead of match to find pattern anywhere in the string
-        return any(re.search(pattern, url) for pattern in patterns)
-    
-    def extract_video_info(self, url):
-        """Extract video information without downloading"""
-        try:
-            url = self.normalize_youtube_url(url)
-            
-            if not self.validate_youtube_url(url):
-                raise ValueError("Invalid YouTube URL")
-            
-            # Try different yt-dlp configurations to bypass bot detection
-            configs_to_try = [
-                # Configuration 1: Chrome-like headers without cookies
-                {
-                    'quiet': True,
-                    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'referer': 'https://www.youtube.com/',
-                    'headers': {
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-                        'Accept-Language': 'en-US,en;q=0.9',
-                        'Accept-Encoding': 'gzip, deflate, br',
-                        'DNT': '1',
-                        'Connection': 'keep-alive',
-                        'Upgrade-Insecure-Requests': '1',
-                        'Sec-Fetch-Dest': 'document',
-                        'Sec-Fetch-Mode': 'navigate',
-                        'Sec-Fetch-Site': 'none',
-                        'Cache-Control': 'max-age=0',
-                    },
-                    'extractor_args': {
-                        'youtube': {
-                            'skip': ['dash', 'hls'],
-                            'player_skip': ['configs', 'webpage']
-                        }
-                    }
-                },
-                # Configuration 2: Safari-like headers
-                {
-                    'quiet': True,
-                    'user_agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15',
-                    'referer': 'https://www.youtube.com/',
-                    'headers': {
-                        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15',
-                        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                        'Accept-Language': 'en-US,en;q=0.5',
-                        'Accept-Encoding': 'gzip, deflate, br',
-                        'DNT': '1',
-                        'Connection': 'keep-alive',
-                        'Upgrade-Insecure-Requests': '1',
-                    },
-                },
-                # Configuration 3: Firefox-like headers
-                {
-                    'quiet': True,
-                    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:120.0) Gecko/20100101 Firefox/120.0',
-                    'referer': 'https://www.youtube.com/',
-                    'headers': {
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:120.0) Gecko/20100101 Firefox/120.0',
-                        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
-                        'Accept-Language': 'en-US,en;q=0.5',
-                        'Accept-Encoding': 'gzip, deflate, br',
-                        'DNT': '1',
-                        'Connection': 'keep-alive',
-                        'Upgrade-Insecure-Requests': '1',
-                        'Sec-Fetch-Dest': 'document',
-                        'Sec-Fetch-Mode': 'navigate',
-                        'Sec-Fetch-Site': 'none',
-                    },
-                },
-                # Configuration 4: Mobile Chrome headers
-                {
-                    'quiet': True,
-                    'user_agent': 'Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Mobile Safari/537.36',
-                    'referer': 'https://m.youtube.com/',
-                    'headers': {
-                        'User-Agent': 'Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Mobile Safari/537.36',
-                        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-                        'Accept-Language': 'en-US,en;q=0.9',
-                        'Accept-Encoding': 'gzip, deflate, br',
-                        'DNT': '1',
-                        'Connection': 'keep-alive',
-                        'Upgrade-Insecure-Requests': '1',
-                    },
-                },
-                # Configuration 5: Minimal configuration
-                {
-                    'quiet': True,
-                    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                    'referer': 'https://www.youtube.com/',
-                }
-            ]
-            
-            info = None
-            last_error = None
-            
-            for i, config in enumerate(configs_to_try):
-                try:
-                    logger.info(f"Trying configuration {i+1}")
-                    
-                    # Add random delay between attempts to avoid rapid requests
-                    if i > 0:
-                        delay = random.uniform(1, 3)
-                        logger.info(f"Adding {delay:.1f}s delay before next attempt")
-                        time.sleep(delay)
-                    
-                    with yt_dlp.YoutubeDL(config) as ydl:
-                        info = ydl.extract_info(url, download=False)
-                        if info:
-                            logger.info(f"Successfully extracted info with configuration {i+1}")
-                            break
-                except Exception as e:
-                    last_error = str(e)
-                    logger.warning(f"Configuration {i+1} failed: {str(e)}")
-                    continue
-            
-            if not info:
-                # Provide more helpful error message
-                if "Sign in to confirm you're not a bot" in str(last_error):
-                    # Simplified, user-friendly error message that will trigger frontend special handling
-                    raise ValueError("Sign in to confirm you're not a bot")
-                elif "Unable to fetch GVS PO Token" in str(last_error):
-                    raise ValueError("Sign in to confirm you're not a bot")
-                elif "Missing required Visitor Data" in str(last_error):
-                    raise ValueError("Sign in to confirm you're not a bot")
-                elif "Operation not permitted" in str(last_error) and "Cookies" in str(last_error):
-                    raise ValueError("Sign in to confirm you're not a bot")
-                else:
-                    raise ValueError(f"Failed to extract video information. Please try a different video or try again later. ({str(last_error)[:100]}...)")
-                
-            if 'entries' in info:
-                video_info = info['entries'][0] if info['entries'] else None
-            else:
-                video_info = info
-            
-            if not video_info:
-                raise ValueError("No video found in the provided URL")
-            
-            # Extract available formats
-            formats = []
-            if 'formats' in video_info and video_info['formats']:
-                # 使用字典来存储每个分辨率的最佳格式
-                quality_formats = {}
-                for fmt in video_info['formats']:
-                    if fmt.get('vcodec') != 'none':  # Only video formats
-                        quality = self.get_quality_label(fmt)
-                        # 获取当前格式的文件大小，确保为数字
-                        try:
-                            current_size = int(fmt.get('filesize') or 0)
-                        except Exception:
-                            current_size = 0
-                        try:
-                            prev_size = int(quality_formats[quality].get('raw_filesize', 0)) if quality in quality_formats else 0
-                        except Exception:
-                            prev_size = 0
-                        # 如果这个分辨率还没有记录，或者当前格式的文件大小更大（质量更好），则更新
-                        if quality not in quality_formats or current_size > prev_size:
-                            quality_formats[quality] = {
-                                'format_id': fmt.get('format_id', ''),
-                                'url': fmt.get('url', ''),
-                                'ext': fmt.get('ext', 'mp4'),
-                                'quality': quality,
-                                'filesize': self.format_filesize(fmt.get('filesize')),
-                                'raw_filesize': current_size,
-                                'filename': f"{self.sanitize_filename(video_info.get('title', 'video'))}.{fmt.get('ext', 'mp4')}"
-                            }
-                
-                # 将去重后的格式添加到列表中（去掉raw_filesize字段）
-                formats = [{k: v for k, v in f.items() if k != 'raw_filesize'} for f in quality_formats.values()]
-            
-            # If no formats found, try the direct URL
-            if not formats and video_info.get('url'):
-                formats.append({
-                    'format_id': 'direct',
-                    'url': video_info['url'],
-                    'ext': video_info.get('ext', 'mp4'),
-                    'quality': 'Standard Quality',
-                    'filesize': self.format_filesize(video_info.get('filesize')),
-                    'filename': f"{self.sanitize_filename(video_info.get('title', 'video'))}.{video_info.get('ext', 'mp4')}"
-                })
-            
-            return {
-                'title': video_info.get('title', 'YouTube Video'),
-                'author': video_info.get('uploader', 'Unknown'),
-                'duration': self.format_duration(video_info.get('duration')),
-                'thumbnail': video_info.get('thumbnail', ''),
-                'formats': formats[:5] if formats else []  # Limit to 5 formats
-            }
-                
-        except Exception as e:
-            logger.error(f"Error extracting video info: {str(e)}")
-            raise ValueError(f"Failed to extract video information: {str(e)}")
-    
-    def get_quality_label(self, fmt):
-        """Generate a human-readable quality label"""
-        height = fmt.get('height')
-        width = fmt.get('width')
-        
-        if height:
-            if height >= 2160:
-                return "4K (2160p)"
-            elif height >= 1440:
-                return "1440p HD"
-            elif height >= 1080:
-                return "1080p HD"
-            elif height >= 720:
-                return "720p HD"
-            elif height >= 480:
-                return "480p"
-            elif height >= 360:
-                return "360p"
-            elif height >= 240:
-                return "240p"
-            else:
-                return f"{height}p"
-        elif width:
-            if width >= 3840:
-                return "4K (2160p)"
-            elif width >= 2560:
-                return "1440p HD"
-            elif width >= 1920:
-                return "1080p HD"
-            elif width >= 1280:
-                return "720p HD"
-            else:
-                return "Standard Quality"
-        else:
-            return "Standard Quality"
-    
-    def format_filesize(self, size):
-        """Format file size in human readable format"""
-        if not size:
-            return "Unknown size"
-        
-        for unit in ['B', 'KB', 'MB', 'GB']:
-            if size < 1024.0:
-                return f"{size:.1f} {unit}"
-            size /= 1024.0
-        return f"{size:.1f} TB"
-    
-    def format_duration(self, duration):
-        """Format duration in human readable format"""
-        if not duration:
-            return "Unknown"
-        
-        hours = int(duration // 3600)
-        minutes = int((duration % 3600) // 60)
-        seconds = int(duration % 60)
-        
-        if hours > 0:
-            return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-        else:
-            return f"{minutes:02d}:{seconds:02d}"
-    
-    def sanitize_filename(self, filename):
-        """Sanitize filename for safe download"""
-        if not filename:
-            return "video"
-        
-        # Remove or replace invalid characters
-        filename = re.sub(r'[<>:"/\\|?*]', '', filename)
-        filename = filename.strip().replace(' ', '_')
-        return filename[:50]  # Limit length
+CORS(app, expose_headers=['ETag', 'Retry-After', 'Server-Timing', 'X-Request-ID'])  # Enable CORS for frontend integration
+
+# Batch resolution limits
+BATCH_MAX_URLS = int(os.environ.get('BATCH_MAX_URLS', 500))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 8))
+# Longest a batch entry waits for a rate-limit token before it is reported as rate limited (seconds)
+BATCH_RATE_LIMIT_WAIT = float(os.environ.get('BATCH_RATE_LIMIT_WAIT', 30))
+# Longest a GET /api/jobs/<id> request may block waiting for a result
+JOB_MAX_WAIT = float(os.environ.get('JOB_MAX_WAIT', 30))
 
 # Initialize downloader
-downloader = YouTubeVideoDownloader()
+# Optional state shared with other workers and nodes (SHARED_BACKEND): video info, extraction locks, rate limits
+shared_backend = create_backend()
+downloader = create_downloader(shared_backend)
+# Re-resolves popular videos in the background before their cached format URLs expire
+downloader.refresher = URLRefresher.from_env(downloader, is_bot_error=bot_signature)
+
+def resolve_video(url, admit=None):
+    """Resolve a URL to video info, failing when nothing is downloadable"""
+    video_info = downloader.extract_video_info(url, admit)
+    if not video_info['formats']:
+        raise ValueError('No downloadable video formats found')
+    return video_info
+
+def resolve_queued_video(url, retries=3):
+    """Resolve for a background job, waiting out extraction overload instead of failing"""
+    for _ in range(retries):
+        try:
+            return resolve_video(url)
+        except Overloaded as e:
+            time.sleep(min(e.retry_after, JOB_MAX_WAIT))
+    return resolve_video(url)
+
+# Per-client token buckets for endpoints that can start upstream work (batches are charged per video, see download_batch)
+rate_limiter = RateLimiter.from_env(backend=shared_backend)
+RATE_LIMITED_ENDPOINTS = {'download_video', 'list_playlist', 'create_job', 'download_file', 'mux_video',
+                          'stream_format', 'thumbnail'}
+
+# Paged playlist/channel enumeration (formats are resolved per entry via /api/download)
+playlist_pager = PlaylistPager(EXTRACTION_CONFIGS[0][1], limiter=downloader.limiter)
+
+# Chunked relay of format URLs for clients that cannot reach googlevideo directly
+relay = StreamRelay.from_env()
+
+# ffmpeg jobs that mux the best adaptive video and audio into one streamed file
+muxer = StreamMuxer.from_env()
+
+# Server-side copies of formats, keyed by video and format ID, served from local disk
+download_store = FileStore.from_env(DOWNLOAD_DIR)
+
+# Parallel ranged fetches that fill the store, resumable after an interrupted download
+segmented = SegmentedDownloader.from_env()
+
+# Resized thumbnails served from local disk so clients never load images from YouTube
+thumbnails = ThumbnailService.from_env()
+
+# Background workers for the asynchronous job API
+jobs = JobManager.from_env(resolve_queued_video, backend=shared_backend)
+
+def collect_component_metrics():
+    """Expose cache, coalescing, job, relay and pool counters at scrape time"""
+    inflight = downloader.inflight.stats()
+    job_stats = jobs.stats()
+    relay_stats = relay.stats()
+    pool_stats = ydl_pool.stats()
+    store_stats = download_store.stats()
+    segmented_stats = segmented.stats()
+    thumbnail_stats = thumbnails.stats()
+    families = [
+        ('ytdl_singleflight_calls_total', 'counter', 'Extractions executed vs requests coalesced onto one already running',
+         [({'result': 'executed'}, inflight['executed']), ({'result': 'coalesced'}, inflight['coalesced'])]),
+        ('ytdl_singleflight_coalesced_ratio', 'gauge', 'Share of extraction requests served by joining one in flight',
+         [({}, inflight['coalesced_ratio'])]),
+        ('ytdl_extractions_in_flight', 'gauge', 'Distinct videos currently being extracted',
+         [({}, inflight['in_flight'])]),
+        ('ytdl_jobs_queued', 'gauge', 'Jobs waiting for a worker', [({}, job_stats['queue_depth'])]),
+        ('ytdl_jobs_running', 'gauge', 'Jobs currently being resolved', [({}, job_stats['running'])]),
+        ('ytdl_jobs_total', 'counter', 'Finished or rejected jobs, by result',
+         [({'result': 'completed'}, job_stats['completed']), ({'result': 'failed'}, job_stats['failed']),
+          ({'result': 'rejected'}, job_stats['rejected'])]),
+        ('ytdl_relay_streams_active', 'gauge', 'Streams currently being relayed', [({}, relay_stats['active'])]),
+        ('ytdl_relay_streams_total', 'counter', 'Relayed streams, by result',
+         [({'result': 'completed'}, relay_stats['completed']), ({'result': 'rejected'}, relay_stats['rejected'])]),
+        ('ytdl_relay_bytes_total', 'counter', 'Bytes relayed to clients', [({}, relay_stats['bytes_sent'])]),
+        ('ytdl_rate_limit_decisions_total', 'counter', 'Per-client rate limit decisions',
+         [({'result': 'allowed'}, rate_limiter.allowed), ({'result': 'rejected'}, rate_limiter.rejected)]),
+        ('ytdl_download_store_bytes', 'gauge', 'Bytes held in the download store', [({}, store_stats['bytes'])]),
+        ('ytdl_download_store_lookups_total', 'counter', 'Download store lookups, by result',
+         [({'result': 'hit'}, store_stats['hits']), ({'result': 'miss'}, store_stats['misses'])]),
+        ('ytdl_download_store_evictions_total', 'counter', 'Files evicted to stay within the quota',
+         [({}, store_stats['evictions'])]),
+        ('ytdl_segmented_downloads_total', 'counter', 'Segmented downloads into the store, by result',
+         [({'result': result}, segmented_stats[result]) for result in ('completed', 'failed', 'rejected', 'resumed')]),
+        ('ytdl_segmented_download_bytes_total', 'counter', 'Bytes fetched from upstream by segmented downloads',
+         [({}, segmented_stats['bytes_downloaded'])]),
+        ('ytdl_segmented_retries_total', 'counter', 'Segment retries and expired URLs resolved again mid-download',
+         [({'event': 'retry'}, segmented_stats['retried_segments']),
+          ({'event': 'reresolve'}, segmented_stats['reresolved_urls'])]),
+        ('ytdl_thumbnail_store_bytes', 'gauge', 'Bytes held in the thumbnail store',
+         [({}, thumbnail_stats['store']['bytes'])]),
+        ('ytdl_thumbnails_generated_total', 'counter', 'Thumbnails fetched from YouTube and resized',
+         [({}, thumbnail_stats['generated'])]),
+        ('ytdl_ydl_pool_instances_total', 'counter', 'YoutubeDL instances created, reused and discarded',
+         [({'event': event}, pool_stats[event]) for event in ('created', 'reused', 'discarded')]),
+    ]
+    if downloader.cache:
+        cache_stats = downloader.cache.stats()
+        families += [
+            ('ytdl_cache_lookups_total', 'counter', 'Video info cache lookups, by result',
+             [({'result': 'hit'}, cache_stats['hits']), ({'result': 'miss'}, cache_stats['misses'])]),
+            ('ytdl_cache_disk_hits_total', 'counter', 'Cache hits served from the disk tier',
+             [({}, cache_stats['disk_hits'])]),
+            ('ytdl_cache_shared_hits_total', 'counter', 'Cache hits served from the shared backend',
+             [({}, cache_stats['shared_hits'])]),
+            ('ytdl_cache_hit_ratio', 'gauge', 'Video info cache hit ratio', [({}, cache_stats['hit_ratio'])]),
+            ('ytdl_cache_entries', 'gauge', 'Entries held in the memory cache', [({}, cache_stats['entries'])]),
+        ]
+    if downloader.negative_cache:
+        families.append(('ytdl_negative_cache_entries', 'gauge', 'Videos remembered as failing, by reason',
+                         [({'reason': reason}, count)
+                          for reason, count in downloader.negative_cache.stats()['by_reason'].items()]))
+    if downloader.limiter:
+        slots = downloader.limiter.stats()
+        families += [
+            ('ytdl_extraction_slots_active', 'gauge', 'Upstream extractions holding a slot', [({}, slots['active'])]),
+            ('ytdl_extraction_slots_waiting', 'gauge', 'Extractions queued for a slot', [({}, slots['waiting'])]),
+        ]
+    if downloader.refresher:
+        refresh_stats = downloader.refresher.stats()
+        families += [
+            ('ytdl_url_refresh_tracked_videos', 'gauge', 'Videos whose popularity and URL expiry are tracked',
+             [({}, refresh_stats['tracked'])]),
+            ('ytdl_url_refresh_hot_videos', 'gauge', 'Tracked videos popular enough to be refreshed',
+             [({}, refresh_stats['hot'])]),
+        ]
+    if shared_backend:
+        families += [
+            ('ytdl_shared_backend_errors_total', 'counter', 'Failed calls to the shared state backend',
+             [({'backend': shared_backend.kind}, shared_backend.stats()['errors'])]),
+            ('ytdl_shared_extraction_waits_total', 'counter', 'Extractions that waited on another process holding the lock',
+             [({}, downloader.shared_waits)]),
+        ]
+    if downloader.config_stats:
+        configs = downloader.config_stats.snapshot()
+        families.append(('ytdl_config_success_rate', 'gauge', 'Recent success rate per extraction configuration',
+                         [({'config_index': c['index'], 'config': c['name']}, c['success_rate']) for c in configs]))
+        families.append(('ytdl_config_breaker_open', 'gauge', '1 while a configuration is skipped by its breaker',
+                         [({'config_index': c['index'], 'config': c['name']}, int(c['state'] == 'open')) for c in configs]))
+    return families
+
+metrics.registry.register_collector(collect_component_metrics)
+
+@app.before_request
+def start_request_trace():
+    # Registered first so admission and every later hook fall inside the trace
+    g.request_id = request_id(request.headers.get('X-Request-ID'))
+    g.trace = start_trace(f'{request.method} {request.path}', g.request_id)
+
+@app.after_request
+def finish_request_trace(response):
+    if 'request_id' not in g:
+        return response
+    response.headers['X-Request-ID'] = g.request_id
+    if g.trace:
+        # Streaming responses are timed until their headers are ready, like the request metrics
+        g.trace.finish(method=request.method, endpoint=g.get('metrics_endpoint'), status=response.status_code)
+        response.headers['Server-Timing'] = g.trace.server_timing()
+        response.headers['Timing-Allow-Origin'] = '*'
+    return response
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_start = time.perf_counter()
+    metrics.http_in_flight.inc(endpoint=g.metrics_endpoint)
+
+@app.after_request
+def record_request_metrics(response):
+    # Streaming responses are timed until their headers are ready
+    if 'metrics_start' in g:
+        labels = {'endpoint': g.metrics_endpoint, 'method': request.method, 'status': response.status_code}
+        metrics.http_requests.inc(**labels)
+        metrics.http_request_duration.observe(time.perf_counter() - g.metrics_start, **labels)
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    if 'metrics_start' in g:
+        metrics.http_in_flight.dec(endpoint=g.metrics_endpoint)
+    end_trace()
+
+def too_many_requests(error):
+    """429 response telling the client how long to back off"""
+    metrics.admission_rejections.inc(reason='rate_limited' if isinstance(error, RateLimited) else 'overloaded')
+    response = jsonify({'error': str(error), 'retry_after': int(error.retry_after_header)})
+    response.headers['Retry-After'] = error.retry_after_header
+    return response, 429
+
+@app.before_request
+def admit_request():
+    """Shed requests over the client's rate before they reach a handler"""
+    if request.endpoint not in RATE_LIMITED_ENDPOINTS or request.method == 'OPTIONS':
+        return None
+    try:
+        with span('admission'):
+            rate_limiter.acquire(rate_limiter.client_key(request.remote_addr, request.headers))
+    except TooManyRequests as e:
+        return too_many_requests(e)
+    return None
 
 @app.route('/')
 def home():
@@ -373,29 +261,41 @@ def debug_page():
     """Serve the debug page"""
     return app.send_static_file('debug.html')
 
-@app.route('/api/download', methods=['POST'])
+@app.route('/api/download', methods=['GET', 'POST'])
 def download_video():
     """API endpoint to process video download requests"""
     try:
-        data = request.get_json()
+        data = request.get_json() if request.method == 'POST' else request.args.to_dict()
         if not data or 'url' not in data:
             return jsonify({'error': 'URL is required'}), 400
         
         url = data['url']
         format_type = data.get('format', 'mp4')
+        # Optional ladder filters (max_height, vcodec, ext, kind, audio_only) from query or body
+        filters = parse_filters({**request.args.to_dict(), **data})
         
         logger.info(f"Processing download request for: {url}")
         
         # Extract video information
         video_info = downloader.extract_video_info(url)
+        if filters:
+            video_info = dict(video_info, formats=filter_formats(video_info['formats'], **filters))
         
         if not video_info['formats']:
             return jsonify({'error': 'No downloadable video formats found'}), 404
         
         logger.info(f"Successfully extracted video info: {video_info['title']}")
         
-        return jsonify(video_info)
+        # ETag/If-None-Match, Cache-Control tied to URL expiry, gzip/brotli and fast JSON
+        status, headers, body = video_response(
+            video_info, filters,
+            if_none_match=request.headers.get('If-None-Match'),
+            accept_encoding=request.headers.get('Accept-Encoding'),
+        )
+        return Response(body, status=status, headers=headers)
         
+    except TooManyRequests as e:
+        return too_many_requests(e)
     except ValueError as e:
         logger.error(f"Validation error: {str(e)}")
         return jsonify({'error': str(e)}), 400
@@ -403,10 +303,349 @@ def download_video():
         logger.error(f"Unexpected error: {str(e)}")
         return jsonify({'error': 'Internal server error occurred'}), 500
 
+@app.route('/api/download/batch', methods=['POST'])
+def download_batch():
+    """Resolve many URLs concurrently, streaming one NDJSON line per video as it completes"""
+    data = request.get_json(silent=True)
+    urls = data.get('urls') if isinstance(data, dict) else None
+    if not isinstance(urls, list) or not urls:
+        return jsonify({'error': 'A non-empty list of URLs is required'}), 400
+    if len(urls) > BATCH_MAX_URLS:
+        return jsonify({'error': f'At most {BATCH_MAX_URLS} URLs are allowed per batch'}), 400
+    try:
+        filters = parse_filters({**request.args.to_dict(), **data})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Group inputs by video ID so duplicates are resolved only once
+    urls = [url if isinstance(url, str) else str(url) for url in urls]
+    groups = {}
+    for index, (url, parsed) in enumerate(zip(urls, parse_many(urls))):
+        key = url if isinstance(parsed, InvalidURLError) else parsed.video_id
+        groups.setdefault(key, {'url': url, 'parsed': parsed, 'indexes': []})['indexes'].append(index)
+    
+    logger.info(f"Processing batch of {len(urls)} URLs ({len(groups)} unique)")
+    # Read here: the generator below runs after the request context is gone
+    client = rate_limiter.client_key(request.remote_addr, request.headers)
+    
+    def admit():
+        # One token per video that goes upstream, so a batch costs what the same requests made one by one
+        # would; cache hits are free, and entries wait for their token rather than failing at once
+        deadline = time.monotonic() + BATCH_RATE_LIMIT_WAIT
+        with span('admission'):
+            while True:
+                try:
+                    return rate_limiter.acquire(client)
+                except RateLimited as e:
+                    if time.monotonic() + e.retry_after > deadline:
+                        raise
+                    time.sleep(e.retry_after)
+    
+    def resolve_item(group):
+        item = {'indexes': group['indexes'], 'url': group['url']}
+        if isinstance(group['parsed'], InvalidURLError):
+            item['error'] = str(group['parsed'])
+            return item
+        try:
+            video_info = resolve_video(group['url'], admit)
+            if filters:
+                video_info = dict(video_info, formats=filter_formats(video_info['formats'], **filters))
+            item['result'] = video_info
+        except TooManyRequests as e:
+            item['error'] = str(e)
+            item['retry_after'] = int(e.retry_after_header)
+        except ValueError as e:
+            item['error'] = str(e)
+        except Exception as e:
+            logger.error(f"Unexpected error in batch item {group['url']}: {str(e)}")
+            item['error'] = 'Internal server error occurred'
+        return item
+    
+    def generate():
+        executor = ThreadPoolExecutor(max_workers=max(1, min(BATCH_CONCURRENCY, len(groups))))
+        try:
+            futures = [executor.submit(bind(resolve_item), group) for group in groups.values()]
+            for future in as_completed(futures):
+                yield json.dumps(future.result()) + '\n'
+        finally:
+            # Stop queued work if the client disconnects mid-stream
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@app.route('/api/playlist', methods=['POST'])
+def list_playlist():
+    """Return one page of lightweight playlist or channel entries"""
+    try:
+        data = request.get_json(silent=True)
+        if not data or 'url' not in data:
+            return jsonify({'error': 'URL is required'}), 400
+        
+        page = playlist_pager.page(data['url'], data.get('cursor'), data.get('page_size'))
+        logger.info(f"Listed {len(page['entries'])} entries of playlist {page['playlist_id']}")
+        return jsonify(page)
+        
+    except TooManyRequests as e:
+        return too_many_requests(e)
+    except ValueError as e:
+        logger.error(f"Validation error: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        return jsonify({'error': 'Failed to list playlist entries'}), 500
+
+def find_format(video_info, format_id):
+    """Return the format with the given ID from a video info response, or None"""
+    return next((f for f in video_info['formats'] if f['format_id'] == format_id), None)
+
+@app.route('/api/stream/<video_id>/<format_id>', methods=['GET'])
+def stream_format(video_id, format_id):
+    """Relay a format to the client in chunks, passing Range requests through"""
+    if not VIDEO_ID_RE.fullmatch(video_id):
+        return jsonify({'error': 'Invalid video ID'}), 400
+    
+    try:
+        video_url = f'https://www.youtube.com/watch?v={video_id}'
+        fmt = find_format(downloader.extract_video_info(video_url), format_id)
+        if not fmt:
+            return jsonify({'error': 'Format not found'}), 404
+        
+        stream = relay.open(fmt['url'], request.headers.get('Range'))
+        if stream.status_code == 403 and downloader.cache:
+            # The signed URL expired or was revoked: resolve it again once
+            stream.close()
+            downloader.cache.invalidate(video_id)
+            fmt = find_format(downloader.extract_video_info(video_url), format_id)
+            if not fmt:
+                return jsonify({'error': 'Format not found'}), 404
+            stream = relay.open(fmt['url'], request.headers.get('Range'))
+    except StreamLimitExceeded as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    except TooManyRequests as e:
+        return too_many_requests(e)
+    except ValueError as e:
+        logger.error(f"Validation error: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Upstream stream error: {str(e)}")
+        return jsonify({'error': 'Failed to reach upstream media server'}), 502
+    
+    if stream.status_code == 416:
+        # The range lies past the end of the format; Content-Range carries its real size
+        stream.close()
+        response = jsonify({'error': 'Requested range not satisfiable'})
+        if 'Content-Range' in stream.headers:
+            response.headers['Content-Range'] = stream.headers['Content-Range']
+        return response, 416
+    if stream.status_code not in (200, 206):
+        stream.close()
+        return jsonify({'error': f'Upstream returned HTTP {stream.status_code}'}), 502
+    
+    headers = dict(stream.headers)
+    headers.setdefault('Accept-Ranges', 'bytes')
+    if request.args.get('download'):
+        headers['Content-Disposition'] = f'attachment; filename="{fmt["filename"]}"'
+    return Response(stream, status=stream.status_code, headers=headers, direct_passthrough=True)
+
+@app.route('/api/mux/<video_id>', methods=['GET'])
+def mux_video(video_id):
+    """Stream the best adaptive video and audio formats muxed into one fragmented MP4 or WebM"""
+    if not VIDEO_ID_RE.fullmatch(video_id):
+        return jsonify({'error': 'Invalid video ID'}), 400
+    if not muxer.available:
+        return jsonify({'error': 'Muxing is unavailable: ffmpeg is not installed on the server'}), 503
+    
+    container = request.args.get('container', 'mp4')
+    video_url = f'https://www.youtube.com/watch?v={video_id}'
+    try:
+        filters = parse_filters(request.args.to_dict())
+        for attempt in range(2):
+            video_info = downloader.extract_video_info(video_url)
+            video_fmt, audio_fmt = pick_tracks(video_info['formats'], container,
+                                             filters.get('max_height'), filters.get('vcodec'))
+            if not video_fmt or not audio_fmt:
+                return jsonify({'error': f'No separate video and audio formats available for {container}'}), 404
+            try:
+                stream = muxer.open(video_fmt['url'], audio_fmt['url'], container)
+                break
+            except MuxSourceExpired:
+                # The signed URLs expired: resolve them again once
+                if attempt == 0 and downloader.cache:
+                    downloader.cache.invalidate(video_id)
+                    continue
+                raise
+    except (MuxUnavailable, MuxLimitExceeded) as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    except MuxError as e:
+        logger.error(f"Mux error: {str(e)}")
+        return jsonify({'error': 'Failed to mux formats from upstream media server'}), 502
+    except TooManyRequests as e:
+        return too_many_requests(e)
+    except ValueError as e:
+        logger.error(f"Validation error: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+    
+    headers = {'Cache-Control': 'no-store', 'X-Video-Format': video_fmt['format_id'], 'X-Audio-Format': audio_fmt['format_id']}
+    if request.args.get('download'):
+        filename = video_fmt['filename'].rsplit('.', 1)[0]
+        headers['Content-Disposition'] = f'attachment; filename="{filename}.{container}"'
+    return Response(stream, mimetype=CONTAINERS[container][3], headers=headers, direct_passthrough=True)
+
+def fill_format(video_id, format_id, fmt):
+    """Return a store fill that downloads a format in parallel segments, re-resolving an expired URL"""
+    def resolve():
+        if downloader.cache:
+            downloader.cache.invalidate(video_id)
+        current = find_format(downloader.extract_video_info(f'https://www.youtube.com/watch?v={video_id}'), format_id)
+        if not current:
+            raise ValueError('Format not found')
+        return current['url']
+
+    def fill(f):
+        # The store keeps the partial file and this sidecar if the download is interrupted
+        segmented.download(fmt['url'], f, resolve=resolve, progress_path=f.name + PROGRESS_SUFFIX,
+                           reserve=download_store.reserve)
+    return fill
+
+@app.route('/api/file/<video_id>/<format_id>', methods=['GET'])
+def download_file(video_id, format_id):
+    """Serve a format from the local download store, fetching it from upstream once on a miss"""
+    if not VIDEO_ID_RE.fullmatch(video_id):
+        return jsonify({'error': 'Invalid video ID'}), 400
+    
+    try:
+        key = download_store.find(make_key(video_id, format_id))
+        path = download_store.get(key) if key else None
+        if path:
+            meta = download_store.metadata(key)
+        else:
+            fmt = find_format(downloader.extract_video_info(f'https://www.youtube.com/watch?v={video_id}'), format_id)
+            if not fmt:
+                return jsonify({'error': 'Format not found'}), 404
+            key = make_key(video_id, f"{format_id}.{fmt['ext']}")
+            meta = {'filename': fmt['filename'], 'ext': fmt['ext']}
+            path = download_store.fetch(key, fill_format(video_id, format_id, fmt), meta, resumable=True)
+    except StreamLimitExceeded as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    except StoreFull as e:
+        return jsonify({'error': str(e)}), 413
+    except TooManyRequests as e:
+        return too_many_requests(e)
+    except ValueError as e:
+        logger.error(f"Validation error: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Download store error: {str(e)}")
+        return jsonify({'error': 'Failed to fetch file from upstream media server'}), 502
+    
+    # send_file handles Range, If-Modified-Since and ETag for the stored file
+    return send_file(path, conditional=True, as_attachment=bool(request.args.get('download')),
+                     download_name=meta.get('filename') or os.path.basename(path), max_age=3600)
+
+@app.route('/api/thumbnail/<video_id>', methods=['GET'])
+def thumbnail(video_id):
+    """Serve a resized thumbnail, fetching and resizing it from i.ytimg.com once"""
+    if not VIDEO_ID_RE.fullmatch(video_id):
+        return jsonify({'error': 'Invalid video ID'}), 400
+    
+    try:
+        path, meta = thumbnails.get(video_id, request.args.get('size', DEFAULT_SIZE))
+    except ThumbnailNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Thumbnail error: {str(e)}")
+        return jsonify({'error': 'Failed to fetch thumbnail'}), 502
+    
+    return send_file(path, mimetype=meta.get('content_type'), conditional=True,
+                     etag=meta.get('etag', True), max_age=thumbnails.max_age)
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """Queue a video for resolution and return a job ID immediately"""
+    data = request.get_json(silent=True)
+    if not data or 'url' not in data:
+        return jsonify({'error': 'URL is required'}), 400
+    
+    try:
+        job = jobs.submit(data['url'])
+    except QueueFull as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    
+    logger.info(f"Queued job {job.id} for: {data['url']}")
+    response = jsonify({'job_id': job.id, 'status': job.status, 'status_url': f'/api/jobs/{job.id}'})
+    response.headers['Location'] = f'/api/jobs/{job.id}'
+    return response, 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Return job status and result; ?wait=N long-polls up to N seconds for completion"""
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    wait = min(request.args.get('wait', 0, type=float), JOB_MAX_WAIT)
+    if wait > 0:
+        job.wait(wait)
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Stream job status changes as server-sent events until the job finishes"""
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def generate():
+        deadline = time.monotonic() + JOB_MAX_WAIT
+        status = None
+        while True:
+            if job.status != status:
+                status = job.status
+                yield f"event: {status}\ndata: {json.dumps(job.to_dict())}\n\n"
+            if job.finished or time.monotonic() >= deadline:
+                return
+            if not job.wait(min(15, deadline - time.monotonic()), seen_status=status):
+                yield ": keep-alive\n\n"
+    
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
+    return jsonify({
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat(),
+        'cache': downloader.cache.stats() if downloader.cache else None,
+        'negative_cache': downloader.negative_cache.stats() if downloader.negative_cache else None,
+        'inflight': downloader.inflight.stats(),
+        'configs': downloader.config_stats.snapshot() if downloader.config_stats else None,
+        'jobs': jobs.stats(),
+        'relay': relay.stats(),
+        'ydl_pool': ydl_pool.stats(),
+        'rate_limit': rate_limiter.stats(),
+        'download_store': download_store.stats(),
+        'segmented_downloads': segmented.stats(),
+        'mux': muxer.stats(),
+        'thumbnails': thumbnails.stats(),
+        'extraction_slots': downloader.limiter.stats() if downloader.limiter else None,
+        'url_refresh': downloader.refresher.stats() if downloader.refresher else None,
+        'shared_backend': dict(shared_backend.stats(), extraction_waits=downloader.shared_waits) if shared_backend else None,
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics for requests, extraction stages, configurations and caches"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
 
 @app.errorhandler(404)
 def not_found(error):
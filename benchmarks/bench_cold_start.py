@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark: import time and first-response time for each entry point
+
+Every sample runs in a fresh interpreter, as a new serverless instance would.
+The probe also reports whether yt_dlp was loaded, which cheap paths should never do.
+
+Usage: python benchmarks/bench_cold_start.py [--runs N]
+"""
+
+import os
+import sys
+import json
+import statistics
+import subprocess
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the child interpreter; prints one JSON line
+PROBE = r'''
+import sys, json, time, threading, http.client
+from http.server import HTTPServer
+start = time.perf_counter()
+import {module} as entry
+imported = time.perf_counter()
+
+def vercel_request(method, body=None):
+    server = HTTPServer(('127.0.0.1', 0), entry.handler)
+    thread = threading.Thread(target=server.handle_request)
+    thread.start()
+    conn = http.client.HTTPConnection('127.0.0.1', server.server_address[1])
+    headers = {{'Content-Type': 'application/json'}}
+    conn.request(method, '{path}', body=body, headers=headers)
+    status = conn.getresponse().status
+    thread.join()
+    server.server_close()
+    return status
+
+def flask_request(method, body=None):
+    client = entry.app.test_client()
+    return client.open('{path}', method=method, data=body, content_type='application/json').status_code
+
+request = flask_request if hasattr(entry, 'app') else vercel_request
+status = request('{method}', {body!r})
+responded = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - start) * 1000,
+    'first_response_ms': (responded - start) * 1000,
+    'status': status,
+    'yt_dlp_loaded': 'yt_dlp' in sys.modules,
+}}))
+'''
+
+SCENARIOS = [
+    ('app', 'OPTIONS', '/api/download', None),
+    ('app', 'POST', '/api/download', '{"url": "https://example.com/not-youtube"}'),
+    ('app', 'GET', '/api/health', None),
+    ('api.download', 'OPTIONS', '/api/download', None),
+    ('api.download', 'POST', '/api/download', '{"url": "https://example.com/not-youtube"}'),
+    ('api.health', 'GET', '/api/health', None),
+    ('api.playlist', 'OPTIONS', '/api/playlist', None),
+]
+
+
+def run_probe(module, method, path, body):
+    code = PROBE.format(module=module, method=method, path=path, body=body)
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_yt_dlp_import(runs):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    code = 'import time; t = time.perf_counter(); import yt_dlp; print((time.perf_counter() - t) * 1000)'
+    samples = [float(subprocess.run([sys.executable, '-c', code], env=env, capture_output=True,
+                                    text=True, check=True).stdout) for _ in range(runs)]
+    return round(statistics.median(samples), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per scenario')
+    args = parser.parse_args()
+
+    results = []
+    for module, method, path, body in SCENARIOS:
+        samples = [run_probe(module, method, path, body) for _ in range(args.runs)]
+        results.append({
+            'entry_point': module,
+            'request': f'{method} {path}' + (' (invalid URL)' if body else ''),
+            'status': samples[-1]['status'],
+            'import_ms_p50': round(statistics.median(s['import_ms'] for s in samples), 1),
+            'first_response_ms_p50': round(statistics.median(s['first_response_ms'] for s in samples), 1),
+            'yt_dlp_loaded': any(s['yt_dlp_loaded'] for s in samples),
+        })
+
+    print(json.dumps({
+        'runs': args.runs,
+        'yt_dlp_import_ms_p50': measure_yt_dlp_import(args.runs),
+        'scenarios': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Benchmark: streaming mux of separate video and audio files served by a local stand-in CDN
+
+ffmpeg generates a video-only and an audio-only test file, a local HTTP server
+(with Range support and optional per-connection throttling) serves them, and
+StreamMuxer muxes them into fragmented MP4/WebM read from its pipe. Reports
+time to first byte, throughput and output size; ffprobe checks the result.
+Requires ffmpeg (and ffprobe for verification) on PATH.
+
+Usage: python benchmarks/bench_mux.py [--duration S] [--jobs N] [--container mp4|webm] [--rate BYTES_PER_S]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.mux import MuxLimitExceeded, StreamMuxer
+
+# container -> ffmpeg arguments producing (video-only file, audio-only file)
+SOURCES = {
+    'mp4': (('video.mp4', ['-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', '-movflags', '+faststart']),
+            ('audio.m4a', ['-c:a', 'aac', '-b:a', '128k', '-movflags', '+faststart'])),
+    'webm': (('video.webm', ['-c:v', 'libvpx-vp9', '-deadline', 'realtime', '-cpu-used', '8']),
+             ('audio.webm', ['-c:a', 'libopus', '-b:a', '128k'])),
+}
+
+
+def make_sources(directory, container, duration):
+    (video_name, video_args), (audio_name, audio_args) = SOURCES[container]
+    subprocess.run(['ffmpeg', '-v', 'error', '-y', '-f', 'lavfi', '-i', f'testsrc2=size=1280x720:rate=30:duration={duration}',
+                    '-an', *video_args, os.path.join(directory, video_name)], check=True)
+    subprocess.run(['ffmpeg', '-v', 'error', '-y', '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+                    '-vn', *audio_args, os.path.join(directory, audio_name)], check=True)
+    return video_name, audio_name
+
+
+def serve(directory, rate):
+    """Serve directory with Range support, pacing each connection to `rate` bytes/second"""
+
+    class Handler(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=directory, **kwargs)
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_head(self):
+            match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+            path = self.translate_path(self.path)
+            if not match or not os.path.isfile(path):
+                return super().send_head()
+            size = os.path.getsize(path)
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+            if start >= size:
+                self.send_error(416)
+                return None
+            f = open(path, 'rb')
+            f.seek(start)
+            self.send_response(206)
+            self.send_header('Content-Type', self.guess_type(path))
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.send_header('Content-Length', str(end - start + 1))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.end_headers()
+            self._remaining = end - start + 1
+            return f
+
+        def copyfile(self, source, outputfile):
+            remaining = getattr(self, '_remaining', None)
+            started = time.monotonic()
+            sent = 0
+            while remaining is None or remaining > 0:
+                chunk = source.read(64 * 1024 if remaining is None else min(64 * 1024, remaining))
+                if not chunk:
+                    break
+                outputfile.write(chunk)
+                sent += len(chunk)
+                if remaining is not None:
+                    remaining -= len(chunk)
+                if rate:
+                    ahead = sent / rate - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_job(muxer, video_url, audio_url, container, output_path):
+    start = time.perf_counter()
+    stream = muxer.open(video_url, audio_url, container)
+    first_byte = time.perf_counter() - start
+    size = 0
+    with open(output_path, 'wb') as out:
+        for chunk in stream:
+            out.write(chunk)
+            size += len(chunk)
+    total = time.perf_counter() - start
+    return {'ttfb_ms': round(first_byte * 1000, 1), 'total_ms': round(total * 1000, 1), 'bytes': size,
+            'throughput_mb_s': round(size / total / 1024 / 1024, 2) if total else None}
+
+
+def probe(path):
+    if not shutil.which('ffprobe'):
+        return None
+    output = subprocess.run(['ffprobe', '-v', 'error', '-show_entries', 'stream=codec_type,codec_name',
+                             '-of', 'json', path], capture_output=True, text=True).stdout
+    return [f"{s['codec_type']}:{s['codec_name']}" for s in json.loads(output or '{}').get('streams', [])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--duration', type=int, default=30, help='seconds of generated media')
+    parser.add_argument('--jobs', type=int, default=2, help='concurrent mux jobs to start')
+    parser.add_argument('--max-jobs', type=int, default=2, help='StreamMuxer slot limit')
+    parser.add_argument('--container', choices=sorted(SOURCES), default='mp4')
+    parser.add_argument('--rate', type=int, default=0, help='per-connection throttle in bytes/second (0 = none)')
+    args = parser.parse_args()
+
+    if not shutil.which('ffmpeg'):
+        print(json.dumps({'error': 'ffmpeg is not installed; the mux endpoint answers 503 without it'}))
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        video_name, audio_name = make_sources(directory, args.container, args.duration)
+        server = serve(directory, args.rate)
+        base = f'http://127.0.0.1:{server.server_address[1]}'
+        muxer = StreamMuxer(max_jobs=args.max_jobs)
+
+        results = [None] * args.jobs
+
+        def job(i):
+            try:
+                results[i] = run_job(muxer, f'{base}/{video_name}', f'{base}/{audio_name}', args.container,
+                                     os.path.join(directory, f'out{i}.{args.container}'))
+            except MuxLimitExceeded as e:
+                results[i] = {'rejected': str(e)}
+
+        threads = [threading.Thread(target=job, args=(i,)) for i in range(args.jobs)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        completed = [r for r in results if 'bytes' in r]
+        print(json.dumps({
+            'container': args.container,
+            'duration_s': args.duration,
+            'source_bytes': sum(os.path.getsize(os.path.join(directory, n)) for n in (video_name, audio_name)),
+            'rate_limit': args.rate or None,
+            'jobs': results,
+            'output_streams': probe(os.path.join(directory, f'out0.{args.container}')) if completed else None,
+            'muxer': muxer.stats(),
+        }, indent=2))
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
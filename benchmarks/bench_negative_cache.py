@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark: requests for a video that cannot be resolved (removed, private, bot check)
+
+Uses the stub yt-dlp, so it runs offline; every configuration fails with the
+given error. For each case the same video is requested --requests times and
+the latency of the first and of the repeated requests is reported together
+with the number of upstream attempts. An unrecognised error walks the whole
+fallback chain with its 1-3s pauses, which is what every failure used to do;
+a permanent one stops after the first attempt, and with the negative cache
+the repeats never reach YouTube.
+
+Usage: python benchmarks/bench_negative_cache.py [--requests N] [--latency S]
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stub_ytdlp
+
+stub_ytdlp.install()
+
+from core.cache import VideoInfoCache
+from core.downloader import EXTRACTION_CONFIGS, YouTubeVideoDownloader
+from core.errors import NegativeCache
+
+URL = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+
+ERRORS = {
+    'unrecognised': "ERROR: [youtube] {id}: HTTP Error 500: Internal Server Error",
+    'removed': "ERROR: [youtube] {id}: Video unavailable. This video has been removed by the uploader",
+    'private': "ERROR: [youtube] {id}: Private video. Sign in if you've been granted access to this video",
+    'bot_check': stub_ytdlp.BOT_ERROR,
+}
+
+
+def run(error, negative_cache, args):
+    behavior = stub_ytdlp.configure(latency=args.latency, failures={name: error for name, _ in EXTRACTION_CONFIGS})
+    downloader = YouTubeVideoDownloader(cache=VideoInfoCache(),
+                                        negative_cache=NegativeCache() if negative_cache else None)
+    samples = []
+    reason = None
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        try:
+            downloader.extract_video_info(URL)
+        except ValueError as e:
+            reason = getattr(e, 'reason', None)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        'reason': reason,
+        'first_ms': round(samples[0], 1),
+        'repeat_p50_ms': round(statistics.median(samples[1:]), 3) if len(samples) > 1 else None,
+        'upstream_attempts': behavior.calls,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=3, help='requests per case for the same video')
+    parser.add_argument('--latency', type=float, default=0.3, help='seconds per stub extraction attempt')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+
+    results = {}
+    for name, error in ERRORS.items():
+        results[name] = {
+            'without_negative_cache': run(error, False, args),
+            'with_negative_cache': run(error, True, args),
+        }
+    print(json.dumps({'settings': vars(args), 'cases': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
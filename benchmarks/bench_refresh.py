@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark: interactive latency for a hot video with and without background URL refresh
+
+Uses the stub yt-dlp, so it runs offline. Cache entries are given a short
+lifetime (--ttl) so several expiry cycles fit in one run. A client requests the
+same video every --period seconds. Without refresh, the request that finds the
+entry expired waits on a full extraction; with refresh, the background thread
+re-resolves the video --margin seconds before expiry and every request is a
+cache hit.
+
+Usage: python benchmarks/bench_refresh.py [--duration S] [--ttl S] [--margin S] [--latency S]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stub_ytdlp
+
+stub_ytdlp.install()
+
+from core.admission import ConcurrencyLimiter
+from core.cache import VideoInfoCache
+from core.downloader import YouTubeVideoDownloader, bot_signature
+from core.refresh import URLRefresher
+
+URL = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+
+
+def run(refresh, args):
+    behavior = stub_ytdlp.configure(latency=args.latency)
+    downloader = YouTubeVideoDownloader(cache=VideoInfoCache(ttl=args.ttl), limiter=ConcurrencyLimiter())
+    if refresh:
+        downloader.refresher = URLRefresher(downloader, margin=args.margin, min_score=3, rate=60,
+                                            interval=0.2, is_bot_error=bot_signature)
+    samples = []
+    deadline = time.monotonic() + args.duration
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        downloader.extract_video_info(URL)
+        samples.append((time.perf_counter() - start) * 1000)
+        time.sleep(args.period)
+    if downloader.refresher:
+        downloader.refresher.stop()
+    samples.sort()
+    return {
+        'requests': len(samples),
+        'slow_requests': sum(1 for s in samples if s >= args.latency * 1000 / 2),
+        'extractions': behavior.calls,
+        'p50_ms': round(statistics.median(samples), 3),
+        'p99_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3),
+        'max_ms': round(samples[-1], 3),
+        'refresh': downloader.refresher.stats() if downloader.refresher else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--duration', type=float, default=30, help='seconds per mode')
+    parser.add_argument('--ttl', type=float, default=8, help='cache entry lifetime in seconds')
+    parser.add_argument('--margin', type=float, default=3, help='refresh this many seconds before expiry')
+    parser.add_argument('--latency', type=float, default=1.0, help='seconds per stub extraction')
+    parser.add_argument('--period', type=float, default=0.1, help='seconds between client requests')
+    args = parser.parse_args()
+
+    print(json.dumps({
+        'settings': vars(args),
+        'without_refresh': run(False, args),
+        'with_refresh': run(True, args),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
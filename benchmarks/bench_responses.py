@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark: video info response encoding, serialization time and bytes on the wire
+
+Builds a synthetic ladder the size of a long video's format list, then times each
+installed JSON encoder and reports the body size raw, gzipped and (if available) brotli.
+
+Usage: python benchmarks/bench_responses.py [--formats N] [--iterations N]
+"""
+
+import os
+import sys
+import json
+import time
+import statistics
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import responses
+from core.formats import build_ladder
+
+
+def synthetic_info(count):
+    expire = int(time.time()) + 6 * 3600
+    raw = []
+    for i in range(count):
+        raw.append({
+            'format_id': str(100 + i),
+            'ext': ('mp4', 'webm', 'm4a')[i % 3],
+            'vcodec': 'none' if i % 3 == 2 else ('avc1.64001F', 'vp09.00.40.08', 'av01.0.08M.08')[i % 3],
+            'acodec': 'none' if i % 3 == 1 else 'mp4a.40.2',
+            'height': 144 * (i % 15 + 1),
+            'fps': 30,
+            'tbr': 100 + i * 37,
+            'filesize': 1_000_000 + i * 12345,
+            'url': f'https://rr1---sn-abc.googlevideo.com/videoplayback?expire={expire}&itag={100 + i}'
+                   + '&sig=' + 'A1b2C3d4' * 24,
+        })
+    # Distinct quality labels keep every synthetic format on the ladder
+    formats = build_ladder(raw, 'Benchmark_Video',
+                           lambda f: f"{f['height']}p ({f['format_id']})",
+                           lambda size: f'{size / 1048576:.1f} MB' if size else 'Unknown')
+    return {
+        'video_id': 'dQw4w9WgXcQ',
+        'title': 'Benchmark video',
+        'author': '@bench',
+        'duration': '03:32',
+        'thumbnail': 'https://i.ytimg.com/vi/dQw4w9WgXcQ/hqdefault.jpg',
+        'formats': formats,
+        'resolved_at': time.time(),
+    }
+
+
+def timed(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {'p50_ms': round(statistics.median(samples), 4), 'max_ms': round(max(samples), 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--formats', type=int, default=80, help='raw formats in the synthetic video')
+    parser.add_argument('--iterations', type=int, default=500, help='encodes per measurement')
+    args = parser.parse_args()
+
+    info = synthetic_info(args.formats)
+    body = responses.dumps(info)
+
+    encoders = {name: timed(lambda fn=fn: fn(info), args.iterations)
+                for name, fn in responses.JSON_ENCODERS.items()}
+    sizes = {'raw': len(body), 'gzip': len(responses.compress(body, 'gzip'))}
+    if responses.brotli is not None:
+        sizes['br'] = len(responses.compress(body, 'br'))
+
+    print(json.dumps({
+        'ladder_entries': len(info['formats']),
+        'iterations': args.iterations,
+        'encoders': encoders,
+        'compress_gzip': timed(lambda: responses.compress(body, 'gzip'), args.iterations),
+        'bytes': sizes,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
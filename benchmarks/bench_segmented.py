@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Benchmark: segmented multi-connection downloads against a per-connection throttle
+
+Starts a local HTTP server that serves random bytes with Range support and
+limits every connection to --rate bytes per second, the way googlevideo
+throttles a single stream. The same file is then downloaded:
+
+  - over 1 connection and over --connections connections (throughput)
+  - with the server failing part-way through, then again with the same file
+    and progress sidecar (how much the resumed download had to fetch)
+  - with the signed URL expiring part-way through (re-resolved via resolve())
+  - with connections dropped at random mid-response (segment retries)
+
+Every run is checked against the SHA-256 of the served bytes.
+
+Usage: python benchmarks/bench_segmented.py [--size BYTES] [--rate BYTES_PER_S] [--connections N]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import logging
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.segmented import DownloadError, SegmentedDownloader
+
+CHUNK = 64 * 1024
+
+
+class Upstream:
+    """What the test server serves and how it misbehaves"""
+
+    def __init__(self, data, rate):
+        self.data = data
+        self.rate = rate
+        self.token = 0           # URLs carry ?t=<token>; older tokens get 403 once expired
+        self.expire_after = None  # bytes served before the current token expires
+        self.fail_after = None   # bytes served before every request fails with 500
+        self.drop_rate = 0.0     # chance that a response is cut off half-way
+        self.served = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def url(self, port):
+        return f'http://127.0.0.1:{port}/video?t={self.token}'
+
+
+def make_handler(upstream):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            with upstream.lock:
+                upstream.requests += 1
+                token = int(parse_qs(urlparse(self.path).query).get('t', ['0'])[0])
+                if upstream.expire_after is not None and upstream.served >= upstream.expire_after:
+                    upstream.token += 1
+                    upstream.expire_after = None
+                failing = upstream.fail_after is not None and upstream.served >= upstream.fail_after
+                expired = token != upstream.token
+            if failing or expired:
+                self.send_response(500 if failing else 403)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            size = len(upstream.data)
+            start, end = 0, size - 1
+            header = self.headers.get('Range')
+            if header:
+                first, _, last = header.split('=', 1)[1].partition('-')
+                start, end = int(first), min(int(last) if last else size - 1, size - 1)
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            else:
+                self.send_response(200)
+            self.send_header('Content-Length', str(end - start + 1))
+            self.end_headers()
+
+            drop_at = None
+            if end - start > CHUNK and random.random() < upstream.drop_rate:
+                drop_at = start + (end - start) // 2
+            offset = start
+            while offset <= end:
+                if drop_at is not None and offset >= drop_at:
+                    self.close_connection = True
+                    return
+                chunk = upstream.data[offset:min(offset + CHUNK, end + 1)]
+                self.wfile.write(chunk)
+                offset += len(chunk)
+                with upstream.lock:
+                    upstream.served += len(chunk)
+                time.sleep(len(chunk) / upstream.rate)
+
+    return Handler
+
+
+def run(upstream, port, connections, segment_size, path, resolve=False, retries=3):
+    downloader = SegmentedDownloader(connections=connections, segment_size=segment_size, retries=retries,
+                                     timeout=(5, 10))
+    downloader._backoff = lambda attempt: time.sleep(0.05)
+    upstream.served = 0
+    upstream.requests = 0
+    start = time.perf_counter()
+    error = None
+    mode = 'r+b' if os.path.exists(path) else 'w+b'
+    with open(path, mode) as f:
+        try:
+            downloader.download(upstream.url(port), f, progress_path=path + '.progress',
+                                resolve=(lambda: upstream.url(port)) if resolve else None)
+        except (DownloadError, OSError) as e:
+            error = str(e)
+    seconds = time.perf_counter() - start
+    stats = downloader.stats()
+    result = {
+        'connections': connections,
+        'seconds': round(seconds, 2),
+        'mb_per_s': round(len(upstream.data) / seconds / 1024 ** 2, 2),
+        'bytes_fetched': upstream.served,
+        'requests': upstream.requests,
+        'retried_segments': stats['retried_segments'],
+        'reresolved_urls': stats['reresolved_urls'],
+        'resumed': bool(stats['resumed']),
+    }
+    if error:
+        result['error'] = error
+    else:
+        with open(path, 'rb') as f:
+            result['verified'] = hashlib.sha256(f.read()).hexdigest() == hashlib.sha256(upstream.data).hexdigest()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=16 * 1024 ** 2, help='bytes in the served file')
+    parser.add_argument('--rate', type=int, default=4 * 1024 ** 2, help='bytes per second per connection')
+    parser.add_argument('--connections', type=int, default=4)
+    parser.add_argument('--segment-size', type=int, default=2 * 1024 ** 2)
+    parser.add_argument('--drop-rate', type=float, default=0.3, help='share of responses cut off in the drop case')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+
+    upstream = Upstream(os.urandom(args.size), args.rate)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(upstream))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as root:
+        def path(name):
+            return os.path.join(root, name)
+
+        results['single_connection'] = run(upstream, port, 1, args.segment_size, path('single'))
+        results['segmented'] = run(upstream, port, args.connections, args.segment_size, path('segmented'))
+
+        # The first attempt dies half-way with retries off; the second resumes from the sidecar
+        upstream.fail_after = args.size // 2
+        interrupted = run(upstream, port, args.connections, args.segment_size, path('resume'), retries=0)
+        upstream.fail_after = None
+        results['resume'] = {
+            'interrupted': interrupted,
+            'resumed': run(upstream, port, args.connections, args.segment_size, path('resume')),
+        }
+
+        upstream.expire_after = args.size // 3
+        results['url_expiry'] = run(upstream, port, args.connections, args.segment_size, path('expiry'),
+                                    resolve=True)
+
+        upstream.drop_rate = args.drop_rate
+        results['dropped_connections'] = run(upstream, port, args.connections, args.segment_size, path('drops'))
+        upstream.drop_rate = 0.0
+
+    server.shutdown()
+    results['speedup'] = round(results['single_connection']['seconds'] / results['segmented']['seconds'], 2)
+    print(json.dumps({'settings': vars(args), 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark: shared state backends (memory, sqlite, redis via a local stand-in)
+
+Part 1 times the primitives each backend offers (get, set, lock acquire and
+release, counter increment). Part 2 starts several worker processes, as a
+multi-worker deployment would, all resolving the same videos at once through
+the stub yt-dlp, and counts upstream extractions: without a shared backend
+every process extracts every video; with one, each video is extracted once.
+
+Usage: python benchmarks/bench_shared_backend.py [--workers N] [--videos N] [--latency S]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.backends import MemoryBackend, RedisBackend, SQLiteBackend
+from redis_standin import RedisStandIn
+
+VIDEO_IDS = [f'vid{index:08d}' for index in range(1000)]
+
+
+def time_primitives(backend, iterations):
+    def per_op(fn):
+        start = time.perf_counter()
+        for i in range(iterations):
+            fn(i)
+        return round((time.perf_counter() - start) / iterations * 1e6, 1)
+
+    value = json.dumps({'expires_at': time.time() + 3600, 'info': {'title': 'x' * 4000}})
+    return {
+        'set_us': per_op(lambda i: backend.set(f'bench:{i}', value, 60)),
+        'get_us': per_op(lambda i: backend.get(f'bench:{i}')),
+        'lock_us': per_op(lambda i: backend.release_lock(f'lock:{i}', backend.acquire_lock(f'lock:{i}', 60))),
+        'incr_us': per_op(lambda i: backend.incr(f'count:{i % 10}', 1, 60)),
+    }
+
+
+def worker(videos, latency, start_at):
+    """Run in a child process: resolve the same videos as every other worker, report extractions"""
+    import stub_ytdlp
+    stub_ytdlp.install()
+    behavior = stub_ytdlp.configure(latency=latency)
+    from core.backends import create_backend
+    from core.downloader import create_downloader
+
+    downloader = create_downloader(create_backend())
+    time.sleep(max(0.0, start_at - time.time()))
+    threads = [threading.Thread(target=downloader.extract_video_info, args=(f'https://www.youtube.com/watch?v={video_id}',))
+               for video_id in VIDEO_IDS[:videos]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(json.dumps({'extractions': behavior.calls, 'waits': downloader.shared_waits}))
+
+
+def run_workers(kind, env, workers, videos, latency):
+    env = {**os.environ, **env, 'SHARED_BACKEND': kind, 'PYTHONPATH': ROOT, 'LOG_LEVEL': 'CRITICAL',
+           'EXTRACTION_MAX_CONCURRENT': str(videos)}
+    start_at = time.time() + 1.5  # lets every worker finish importing before the first request
+    code = f'import bench_shared_backend as b; b.worker({videos}, {latency}, {start_at})'
+    processes = [subprocess.Popen([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                  env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+                 for _ in range(workers)]
+    results = [json.loads(p.communicate()[0].strip().splitlines()[-1]) for p in processes]
+    return {
+        'upstream_extractions': sum(r['extractions'] for r in results),
+        'lock_waits': sum(r['waits'] for r in results),
+        'wall_s': round(time.time() - start_at, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--videos', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.5, help='seconds per stub extraction')
+    args = parser.parse_args()
+
+    redis = RedisStandIn().start()
+    directory = tempfile.mkdtemp()
+    sqlite_path = os.path.join(directory, 'shared.db')
+
+    primitives = {
+        'memory': time_primitives(MemoryBackend(), args.iterations),
+        'sqlite': time_primitives(SQLiteBackend(os.path.join(directory, 'primitives.db')), args.iterations),
+        'redis_standin': time_primitives(RedisBackend(redis.url), args.iterations),
+    }
+
+    multi_process = {
+        'none': run_workers('none', {}, args.workers, args.videos, args.latency),
+        'memory': run_workers('memory', {}, args.workers, args.videos, args.latency),
+        'sqlite': run_workers('sqlite', {'SHARED_BACKEND_PATH': sqlite_path}, args.workers, args.videos, args.latency),
+        'redis_standin': run_workers('redis', {'SHARED_BACKEND_URL': redis.url}, args.workers, args.videos,
+                                     args.latency),
+    }
+
+    print(json.dumps({
+        'primitives_per_op': primitives,
+        'workers': args.workers,
+        'videos': args.videos,
+        'multi_process': multi_process,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: per-URL cost of the single-pass URL parser vs the legacy normalize + validate code
+
+Usage: python benchmarks/bench_url_parser.py [--number N]
+"""
+
+import os
+import re
+import sys
+import json
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.urls import parse_youtube_url, parse_many, InvalidURLError
+
+SAMPLE_URLS = [
+    'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+    'https://youtu.be/dQw4w9WgXcQ?t=42',
+    'https://m.youtube.com/watch?feature=share&v=dQw4w9WgXcQ&list=PLrAXtmErZgOeiKm4sgNOknGvNjby9efdf',
+    'https://music.youtube.com/watch?v=dQw4w9WgXcQ',
+    'https://www.youtube-nocookie.com/embed/dQw4w9WgXcQ?start=10',
+    'https://youtube.com/shorts/dQw4w9WgXcQ',
+    'https://www.youtube.com/live/dQw4w9WgXcQ?si=abcdef',
+    'www.youtube.com/watch?v=dQw4w9WgXcQ',
+    'https://example.com/not-youtube',
+    'https://www.youtube.com/@somechannel',
+]
+
+
+def legacy_normalize(url):
+    """The original normalize_youtube_url from app.py"""
+    url = url.strip()
+    if not url.startswith(('http://', 'https://')):
+        url = 'https://' + url
+    if 'youtu.be/' in url:
+        video_id = url.split('youtu.be/')[1].split('?')[0].split('&')[0]
+        url = f'https://www.youtube.com/watch?v={video_id}'
+    if 'youtube.com' in url and 'www.youtube.com' not in url:
+        url = url.replace('youtube.com', 'www.youtube.com')
+    if 'm.youtube.com' in url:
+        url = url.replace('m.youtube.com', 'www.youtube.com')
+    return url
+
+
+def legacy_validate(url):
+    """The original validate_youtube_url from app.py"""
+    patterns = [
+        r'https?://(www\.)?youtube\.com/watch\?v=[\w-]+',
+        r'https?://youtu\.be/[\w-]+',
+        r'https?://(www\.)?youtube\.com/embed/[\w-]+',
+        r'https?://(www\.)?youtube\.com/v/[\w-]+',
+        r'https?://m\.youtube\.com/watch\?v=[\w-]+',
+        r'https?://(www\.)?youtube\.com/.+'
+    ]
+    return any(re.search(pattern, url) for pattern in patterns)
+
+
+def legacy(url):
+    url = legacy_normalize(url)
+    return url if legacy_validate(url) else None
+
+
+def parse(url):
+    try:
+        return parse_youtube_url(url)
+    except InvalidURLError:
+        return None
+
+
+def per_url_ns(fn, number):
+    def run():
+        for url in SAMPLE_URLS:
+            fn(url)
+    best = min(timeit.repeat(run, number=number, repeat=5))
+    return best / (number * len(SAMPLE_URLS)) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=2000, help='iterations over the sample set per repeat')
+    args = parser.parse_args()
+
+    bulk_urls = SAMPLE_URLS * 100
+    bulk = min(timeit.repeat(lambda: parse_many(bulk_urls), number=max(1, args.number // 100), repeat=5))
+
+    results = {
+        'urls_per_iteration': len(SAMPLE_URLS),
+        'legacy_ns_per_url': round(per_url_ns(legacy, args.number)),
+        'parser_ns_per_url': round(per_url_ns(parse, args.number)),
+        'parse_many_ns_per_url': round(bulk / (max(1, args.number // 100) * len(bulk_urls)) * 1e9),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-request YoutubeDL setup overhead, fresh instance vs pooled instance
+
+Only the setup cost is measured (no network): building YoutubeDL(config) and
+closing it, as every request used to do, against a pool checkout and return.
+
+Usage: python benchmarks/bench_ydl_pool.py [--requests N]
+"""
+
+import os
+import sys
+import json
+import time
+import statistics
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.downloader import EXTRACTION_CONFIGS
+from core.ytdlp import YoutubeDLPool, load_yt_dlp
+
+
+def timed(fn, requests):
+    samples = []
+    for i in range(requests):
+        name, config = EXTRACTION_CONFIGS[i % len(EXTRACTION_CONFIGS)]
+        start = time.perf_counter()
+        fn(name, config)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        'mean_ms': round(statistics.mean(samples), 3),
+        'p50_ms': round(statistics.median(samples), 3),
+        'max_ms': round(max(samples), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200, help='simulated requests per mode')
+    args = parser.parse_args()
+
+    yt_dlp = load_yt_dlp()
+
+    def fresh(name, config):
+        with yt_dlp.YoutubeDL(config) as ydl:
+            ydl.params.get('quiet')
+
+    pool = YoutubeDLPool()
+
+    def pooled(name, config):
+        with pool.checkout(name, config) as ydl:
+            ydl.params.get('quiet')
+
+    results = {
+        'requests': args.requests,
+        'fresh_instance': timed(fresh, args.requests),
+        'pooled_instance': timed(pooled, args.requests),
+        'pool': pool.stats(),
+    }
+    results['speedup'] = round(results['fresh_instance']['mean_ms'] / max(results['pooled_instance']['mean_ms'], 1e-6), 1)
+    pool.clear()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Offline load test: throughput and latency percentiles for the main API paths
+
+yt_dlp is replaced by benchmarks/stub_ytdlp.py, which replays recorded info dicts
+with injected latency and failures, so no request leaves the machine. Both the
+Flask app and the Vercel handler are served over real HTTP on localhost and
+driven by the same client threads.
+
+Scenarios:
+  cold_extraction  every request is a new video (cache miss, one yt-dlp attempt)
+  cache_hit        every request is the same, already resolved video
+  fallback_chain   configs 1 and 2 fail with bot errors, config 3 succeeds
+  large_formats    a 190-format info dict goes through the ladder
+  invalid_url      non-YouTube URLs rejected before extraction
+
+Each scenario starts with a fresh downloader and a static configuration order,
+so runs are comparable between commits. Per-client rate limits are disabled;
+the global extraction cap (EXTRACTION_MAX_CONCURRENT) stays in force. Save results with --output and compare
+two runs with --compare.
+
+Usage: python benchmarks/loadtest.py [--requests N] [--concurrency N] [--latency S]
+                                     [--scenario NAME ...] [--entry-point flask|vercel]
+                                     [--output FILE] [--compare BASELINE.json]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import statistics
+import subprocess
+import threading
+import http.client
+from http.server import ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stub_ytdlp
+
+stub_ytdlp.install()
+
+from werkzeug.serving import make_server
+
+import app as flask_app
+import api.download as vercel_download
+import core.downloader as downloader_module
+from core.admission import ConcurrencyLimiter, RateLimiter
+from core.cache import VideoInfoCache
+from core.downloader import YouTubeVideoDownloader
+from core.ytdlp import ydl_pool
+
+SCENARIOS = {
+    'cold_extraction': {'fixture': 'standard', 'unique_videos': True},
+    'cache_hit': {'fixture': 'standard', 'unique_videos': False},
+    'fallback_chain': {
+        'fixture': 'standard', 'unique_videos': True,
+        'failures': {'chrome_desktop': stub_ytdlp.BOT_ERROR, 'safari_mac': stub_ytdlp.BOT_ERROR},
+    },
+    'large_formats': {'fixture': 'large_format_list', 'unique_videos': True},
+    'invalid_url': {'fixture': 'standard', 'invalid': True},
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class QuietVercelHandler(vercel_download.handler):
+    def log_message(self, format, *args):
+        # BaseHTTPRequestHandler writes an access log line to stderr per request
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            super().log_message(format, *args)
+
+
+class Server:
+    """Serve a WSGI app or a BaseHTTPRequestHandler on an ephemeral localhost port"""
+
+    def __init__(self, entry_point):
+        if entry_point == 'flask':
+            self.httpd = make_server('127.0.0.1', 0, flask_app.app, threaded=True)
+        else:
+            self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), QuietVercelHandler)
+            self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def fresh_downloader():
+    """A downloader with an empty cache and the static configuration order"""
+    downloader = YouTubeVideoDownloader(cache=VideoInfoCache.from_env(), limiter=ConcurrencyLimiter.from_env())
+    flask_app.downloader = downloader
+    vercel_download.downloader = downloader
+    # Every client thread shares one IP, so per-client rate limits would shed the whole run
+    flask_app.rate_limiter = RateLimiter(rate=0)
+    vercel_download.rate_limiter = RateLimiter(rate=0)
+    ydl_pool.clear()
+
+
+def request_bodies(scenario, count, run_id):
+    if scenario.get('invalid'):
+        return [json.dumps({'url': f'https://example.com/watch?v={i}'}) for i in range(count)]
+    if not scenario['unique_videos']:
+        return [json.dumps({'url': 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'})] * count
+    # 11-character IDs unique to this run, so every request misses the cache
+    return [json.dumps({'url': f'https://youtu.be/{run_id}{i:07d}'}) for i in range(count)]
+
+
+def drive(port, bodies, concurrency):
+    """Send every body as POST /api/download from `concurrency` keep-alive clients"""
+    samples = []
+    statuses = {}
+    errors = 0
+    lock = threading.Lock()
+    queue = iter(bodies)
+
+    def worker():
+        nonlocal errors
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        while True:
+            with lock:
+                body = next(queue, None)
+            if body is None:
+                break
+            start = time.perf_counter()
+            try:
+                conn.request('POST', '/api/download', body=body,
+                             headers={'Content-Type': 'application/json', 'Accept-Encoding': 'gzip'})
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+                if response.getheader('Connection', '').lower() == 'close' or response.version == 10:
+                    conn.close()
+            except Exception:
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                status = 'error'
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                samples.append(elapsed)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if status == 'error' or (isinstance(status, int) and status >= 500):
+                    errors += 1
+        conn.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, statuses, errors, time.perf_counter() - start
+
+
+def run_scenario(name, entry_point, args):
+    scenario = SCENARIOS[name]
+    behavior = stub_ytdlp.configure(scenario['fixture'], args.latency, scenario.get('failures'))
+    fresh_downloader()
+
+    bodies = request_bodies(scenario, args.requests, f'{entry_point[0]}{name[:3]}')
+    server = Server(entry_point)
+    try:
+        if name == 'cache_hit':
+            drive(server.port, bodies[:1], 1)  # warm the cache
+            behavior.calls = 0
+        samples, statuses, errors, wall = drive(server.port, bodies, args.concurrency)
+    finally:
+        server.stop()
+
+    return {
+        'entry_point': entry_point,
+        'scenario': name,
+        'requests': len(samples),
+        'concurrency': args.concurrency,
+        'status_counts': statuses,
+        'errors': errors,
+        'extractor_calls': behavior.calls,
+        'throughput_rps': round(len(samples) / wall, 1),
+        'p50_ms': round(percentile(samples, 50), 2),
+        'p95_ms': round(percentile(samples, 95), 2),
+        'p99_ms': round(percentile(samples, 99), 2),
+        'mean_ms': round(statistics.mean(samples), 2),
+        'max_ms': round(max(samples), 2),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(report, baseline_path):
+    """Relative change of each percentile against a previous report (positive = slower)"""
+    with open(baseline_path, encoding='utf-8') as f:
+        previous = json.load(f)
+    baseline = {(r['entry_point'], r['scenario']): r for r in previous['results']}
+    deltas = []
+    for result in report['results']:
+        before = baseline.get((result['entry_point'], result['scenario']))
+        if not before:
+            continue
+        delta = {'entry_point': result['entry_point'], 'scenario': result['scenario']}
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            delta[key] = round((result[key] - before[key]) / before[key], 3) if before[key] else None
+        before_rps = before['throughput_rps']
+        delta['throughput_rps'] = round((result['throughput_rps'] - before_rps) / before_rps, 3) if before_rps else None
+        deltas.append(delta)
+    return {'baseline_revision': previous.get('revision'), 'changes': deltas}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario and entry point')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent client connections')
+    parser.add_argument('--latency', type=float, default=0.05, help='injected seconds per yt-dlp attempt')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='repeatable; default all')
+    parser.add_argument('--entry-point', action='append', choices=['flask', 'vercel'], help='repeatable; default both')
+    parser.add_argument('--no-retry-delay', action='store_true',
+                        help='skip the random 1-3s pause between sequential config attempts')
+    parser.add_argument('--log-level', default='CRITICAL', help='server log level (invalid URLs log at ERROR)')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    parser.add_argument('--compare', metavar='BASELINE', help='report changes against a previous --output file')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level.upper())
+    logging.getLogger('werkzeug').setLevel(args.log_level.upper())
+    if args.no_retry_delay:
+        downloader_module.random = random.Random()
+        downloader_module.random.uniform = lambda a, b: 0.0
+
+    report = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'settings': {'requests': args.requests, 'concurrency': args.concurrency, 'latency_s': args.latency,
+                     'retry_delay': not args.no_retry_delay},
+        'results': [run_scenario(name, entry_point, args)
+                    for entry_point in args.entry_point or ['flask', 'vercel']
+                    for name in args.scenario or list(SCENARIOS)],
+    }
+    if args.compare:
+        report['comparison'] = compare(report, args.compare)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for a Redis server, for exercising the redis shared backend offline
+
+Speaks RESP2 over TCP and implements only the commands core.backends sends:
+PING, AUTH, SELECT, GET, SET (NX, EX, PX), DEL, INCRBY and EVAL of the lock
+release script. Everything is kept in one dict; nothing is persisted.
+
+Usage: python benchmarks/redis_standin.py [--port 6399]
+       then SHARED_BACKEND=redis SHARED_BACKEND_URL=redis://127.0.0.1:6399/0
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+import socketserver
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.backends import RELEASE_SCRIPT
+
+
+class Store:
+    def __init__(self):
+        self.data = {}  # key -> (value bytes, expires_at or None)
+        self.lock = threading.Lock()
+        self.commands = 0
+
+    def live(self, key):
+        entry = self.data.get(key)
+        if entry and entry[1] is not None and entry[1] <= time.time():
+            del self.data[key]
+            return None
+        return entry
+
+
+class Error(Exception):
+    pass
+
+
+def run_command(store, args):
+    name = args[0].upper()
+    store.commands += 1
+    if name == b'PING':
+        return b'+PONG\r\n'
+    if name in (b'AUTH', b'SELECT'):
+        return b'+OK\r\n'
+    if name == b'GET':
+        entry = store.live(args[1])
+        return bulk(entry[0] if entry else None)
+    if name == b'SET':
+        key, value, options = args[1], args[2], [a.upper() for a in args[3:]]
+        expires_at = None
+        if b'PX' in options:
+            expires_at = time.time() + int(options[options.index(b'PX') + 1]) / 1000
+        elif b'EX' in options:
+            expires_at = time.time() + int(options[options.index(b'EX') + 1])
+        if b'NX' in options and store.live(key):
+            return b'$-1\r\n'
+        store.data[key] = (value, expires_at)
+        return b'+OK\r\n'
+    if name == b'DEL':
+        return b':%d\r\n' % sum(store.data.pop(key, None) is not None for key in args[1:])
+    if name == b'INCRBY':
+        entry = store.live(args[1])
+        try:
+            value = int(entry[0] if entry else 0) + int(args[2])
+        except ValueError:
+            raise Error('ERR value is not an integer or out of range')
+        store.data[args[1]] = (str(value).encode(), entry[1] if entry else None)
+        return b':%d\r\n' % value
+    if name == b'EVAL':
+        if args[1].decode() != RELEASE_SCRIPT:
+            raise Error('ERR only the lock release script is supported by this stand-in')
+        key, token = args[3], args[4]
+        entry = store.live(key)
+        if entry and entry[0] == token:
+            del store.data[key]
+            return b':1\r\n'
+        return b':0\r\n'
+    raise Error(f"ERR unknown command '{name.decode()}'")
+
+
+def bulk(value):
+    if value is None:
+        return b'$-1\r\n'
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    # Like Redis itself, so pipelined replies are not held back by Nagle's algorithm
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if not line.startswith(b'*'):
+                self.wfile.write(b'-ERR inline commands are not supported\r\n')
+                continue
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2])
+            with self.server.store.lock:
+                try:
+                    reply = run_command(self.server.store, args)
+                except Error as e:
+                    reply = b'-%s\r\n' % str(e).encode()
+            self.wfile.write(reply)
+
+
+class RedisStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0)):
+        super().__init__(address, Handler)
+        self.store = Store()
+
+    @property
+    def url(self):
+        return f'redis://{self.server_address[0]}:{self.server_address[1]}/0'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6399)
+    args = parser.parse_args()
+    server = RedisStandIn((args.host, args.port))
+    print(f'Redis stand-in listening on {server.url}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Deterministic, offline stand-in for yt_dlp used by the load-test benchmark
+
+StubYoutubeDL replays recorded info dicts from benchmarks/fixtures/ instead of
+contacting YouTube. `{id}` and `{expire}` placeholders in a fixture are filled
+in per request, so every video ID gets its own fresh-looking signed URLs.
+Latency and failures can be injected per extraction configuration.
+"""
+
+import os
+import sys
+import json
+import time
+import types
+import threading
+
+from core.downloader import EXTRACTION_CONFIGS
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+BOT_ERROR = ("ERROR: [youtube] {id}: Sign in to confirm you're not a bot. "
+             "Use --cookies-from-browser or --cookies for the authentication.")
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, f'{name}.json'), encoding='utf-8') as f:
+        return f.read()
+
+
+class Behavior:
+    """What the stub does for each extraction: fixture, latency and per-config failures"""
+
+    def __init__(self, fixture='standard', latency=0.0, failures=None):
+        self.template = load_fixture(fixture)
+        self.latency = latency
+        # Configuration name -> error message raised instead of returning info
+        self.failures = dict(failures or {})
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def render(self, video_id):
+        expire = str(int(time.time()) + 6 * 3600)
+        return json.loads(self.template.replace('{id}', video_id).replace('{expire}', expire))
+
+
+# Extraction configurations are recognised by their user agent
+_CONFIG_BY_USER_AGENT = {config.get('user_agent'): name for name, config in EXTRACTION_CONFIGS}
+
+_behavior = Behavior()
+
+
+class DownloadError(Exception):
+    pass
+
+
+class StubYoutubeDL:
+    """Accepts the same options as yt_dlp.YoutubeDL; extract_info replays a fixture"""
+
+    def __init__(self, params=None):
+        self.params = dict(params or {})
+        self.config = _CONFIG_BY_USER_AGENT.get(self.params.get('user_agent'), 'default')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        pass
+
+    def extract_info(self, url, download=False, **kwargs):
+        behavior = _behavior
+        with behavior._lock:
+            behavior.calls += 1
+        video_id = url.rsplit('v=', 1)[-1][:11]
+        if behavior.latency:
+            time.sleep(behavior.latency)
+        error = behavior.failures.get(self.config)
+        if error:
+            raise DownloadError(error.format(id=video_id))
+        return behavior.render(video_id)
+
+
+def install():
+    """Make `import yt_dlp` resolve to this stub; call before anything imports yt_dlp"""
+    module = types.ModuleType('yt_dlp')
+    module.YoutubeDL = StubYoutubeDL
+    module.DownloadError = DownloadError
+    module.__version__ = 'stub'
+    sys.modules['yt_dlp'] = module
+    return module
+
+
+def configure(fixture='standard', latency=0.0, failures=None):
+    """Replace the behaviour used by every subsequent extraction"""
+    global _behavior
+    _behavior = Behavior(fixture, latency, failures)
+    return _behavior
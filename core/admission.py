@@ -0,0 +1,238 @@
+"""
+Admission control: per-client token buckets and a global cap on upstream extractions
+
+Requests over a client's rate, or arriving while every extraction slot is busy
+and the wait queue is full, are shed with TooManyRequests so the caller can
+answer 429 with a Retry-After instead of piling more load onto YouTube.
+"""
+
+import os
+import math
+import hashlib
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from core.backends import BackendError
+from core.tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+class TooManyRequests(Exception):
+    """Raised when a request is not admitted; `retry_after` is in seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self):
+        """Retry-After value: whole seconds, rounded up, at least 1"""
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class RateLimited(TooManyRequests):
+    """The client has used up its token bucket"""
+
+
+class Overloaded(TooManyRequests):
+    """Every extraction slot is busy and the wait queue is full or timed out"""
+
+
+class RateLimiter:
+    """Token bucket per client: `rate` tokens per second, holding at most `burst`
+
+    With a shared backend the limit is enforced across processes as a fixed
+    window instead: at most `burst` per `burst / rate` seconds, the same
+    average rate. If the backend fails, the local bucket is used.
+    """
+
+    def __init__(self, rate=1.0, burst=10, max_clients=10000, api_keys=(), trust_forwarded=False, proxy_hops=1,
+                 backend=None):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.api_keys = frozenset(api_keys)
+        self.trust_forwarded = trust_forwarded
+        # Proxies in front of the app that each append to X-Forwarded-For; the client is the entry they added
+        self.proxy_hops = max(1, proxy_hops)
+        self.backend = backend
+        self.allowed = 0
+        self.rejected = 0
+        # client key -> (tokens, last refill time), least recently seen first
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, backend=None):
+        """Build a limiter from RATE_LIMIT_* environment variables"""
+        return cls(
+            rate=float(os.environ.get('RATE_LIMIT_RATE', 1.0)),
+            burst=float(os.environ.get('RATE_LIMIT_BURST', 10)),
+            max_clients=int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', 10000)),
+            api_keys=[key.strip() for key in os.environ.get('API_KEYS', '').split(',') if key.strip()],
+            trust_forwarded=os.environ.get('TRUST_FORWARDED_FOR', 'False').lower() == 'true',
+            proxy_hops=int(os.environ.get('TRUSTED_PROXY_HOPS', 1)),
+            backend=backend,
+        )
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def client_key(self, remote_addr, headers, trust_forwarded=None):
+        """Key a request by a known X-API-Key, else by client IP.
+
+        Proxies append to X-Forwarded-For, so only its last proxy_hops entries
+        were written by trusted proxies; anything left of them is whatever the
+        client sent. The client address is the entry the outermost proxy added.
+        """
+        api_key = headers.get('X-API-Key')
+        if api_key and api_key in self.api_keys:
+            return f'key:{api_key}'
+        if self.trust_forwarded if trust_forwarded is None else trust_forwarded:
+            hops = [hop.strip() for hop in headers.get('X-Forwarded-For', '').split(',') if hop.strip()]
+            if hops:
+                return f"ip:{hops[-min(self.proxy_hops, len(hops))]}"
+        return f'ip:{remote_addr or "unknown"}'
+
+    def acquire(self, key, cost=1):
+        """Take `cost` tokens from the client's bucket or raise RateLimited"""
+        if not self.enabled:
+            return
+        if self.backend and self._acquire_shared(key, cost):
+            return
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            admitted = tokens >= cost
+            if admitted:
+                tokens -= cost
+                self.allowed += 1
+            else:
+                self.rejected += 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        if not admitted:
+            raise RateLimited("Rate limit exceeded, please slow down", (cost - tokens) / self.rate)
+
+    def _acquire_shared(self, key, cost):
+        """Count the request in the client's shared window; False if the backend is unavailable"""
+        window = self.burst / self.rate
+        now = time.time()
+        index = int(now // window)
+        try:
+            # Hashed so API keys are never written to the shared store
+            digest = hashlib.blake2b(key.encode('utf-8'), digest_size=12).hexdigest()
+            used = self.backend.incr(f'rate:{digest}:{index}', cost, window)
+        except BackendError:
+            return False
+        with self._lock:
+            if used <= self.burst:
+                self.allowed += 1
+                return True
+            self.rejected += 1
+        raise RateLimited("Rate limit exceeded, please slow down", (index + 1) * window - now)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rate': self.rate,
+                'burst': self.burst,
+                'shared': self.backend is not None,
+                'clients': len(self._buckets),
+                'allowed': self.allowed,
+                'rejected': self.rejected,
+            }
+
+
+class ConcurrencyLimiter:
+    """Cap concurrent upstream extractions, with a short bounded wait queue"""
+
+    def __init__(self, max_concurrent=4, max_waiting=16, max_wait=10.0):
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        # Moving average of how long a slot is held, used to estimate Retry-After
+        self._avg_hold = None
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_env(cls):
+        """Build a limiter from EXTRACTION_* environment variables"""
+        return cls(
+            max_concurrent=int(os.environ.get('EXTRACTION_MAX_CONCURRENT', 4)),
+            max_waiting=int(os.environ.get('EXTRACTION_QUEUE_SIZE', 16)),
+            max_wait=float(os.environ.get('EXTRACTION_QUEUE_TIMEOUT', 10)),
+        )
+
+    @contextmanager
+    def slot(self):
+        """Hold one extraction slot for the duration of the block"""
+        if self.max_concurrent <= 0:
+            yield
+            return
+        with span('queue'):
+            self._acquire()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - start)
+
+    def _acquire(self):
+        with self._cond:
+            if self.active < self.max_concurrent and not self.waiting:
+                self.active += 1
+                self.admitted += 1
+                return
+            if self.waiting >= self.max_waiting:
+                self.rejected += 1
+                raise Overloaded("Server is busy, please retry shortly", self._retry_after())
+            self.waiting += 1
+            deadline = time.monotonic() + self.max_wait
+            try:
+                while self.active >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        raise Overloaded("Server is busy, please retry shortly", self._retry_after())
+                    self._cond.wait(remaining)
+                self.active += 1
+                self.admitted += 1
+            finally:
+                self.waiting -= 1
+
+    def _release(self, held):
+        with self._cond:
+            self.active -= 1
+            self._avg_hold = held if self._avg_hold is None else 0.8 * self._avg_hold + 0.2 * held
+            self._cond.notify()
+
+    def _retry_after(self):
+        """Time for the current backlog to drain through the slots (lock must be held)"""
+        hold = self._avg_hold if self._avg_hold is not None else 1.0
+        return hold * (self.waiting + 1) / self.max_concurrent
+
+    def stats(self):
+        with self._cond:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'active': self.active,
+                'waiting': self.waiting,
+                'max_waiting': self.max_waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'avg_hold_seconds': round(self._avg_hold, 3) if self._avg_hold is not None else None,
+            }
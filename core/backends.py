@@ -0,0 +1,441 @@
+"""
+Shared state backends: cached video info, extraction locks and rate-limit counters
+
+Every Flask worker and serverless instance otherwise keeps this state to
+itself, so the same video is extracted once per process. A backend gives them
+a common store with three primitives: expiring key/value pairs, token-owned
+locks and windowed counters. SHARED_BACKEND selects one:
+
+- memory: a dict in this process (same reach as no backend; useful for development)
+- sqlite: a database file shared by every process on the host
+- redis:  any server speaking the Redis protocol, shared across hosts
+
+Callers treat BackendError as "backend unavailable" and fall back to local
+behaviour rather than failing requests.
+"""
+
+import os
+import time
+import abc
+import uuid
+import socket
+import sqlite3
+import logging
+import tempfile
+import threading
+from collections import deque
+from urllib.parse import urlparse, unquote
+
+logger = logging.getLogger(__name__)
+
+# Deletes a lock only while it still holds the caller's token
+RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+
+class BackendError(Exception):
+    """Raised when the shared backend cannot be reached or answers with an error"""
+
+
+class Backend(abc.ABC):
+    """Interface shared by every backend; keys are namespaced with `prefix`"""
+
+    kind = None
+
+    def __init__(self, prefix='ytdl:'):
+        self.prefix = prefix
+        self.errors = 0
+        self._stats_lock = threading.Lock()
+
+    @abc.abstractmethod
+    def get(self, key):
+        """Return the string stored under key, or None if missing or expired"""
+
+    @abc.abstractmethod
+    def set(self, key, value, ttl):
+        """Store a string under key for `ttl` seconds"""
+
+    @abc.abstractmethod
+    def delete(self, key):
+        """Remove key if present"""
+
+    @abc.abstractmethod
+    def acquire_lock(self, key, ttl):
+        """Take the lock if free; return an ownership token, or None if another holder has it"""
+
+    @abc.abstractmethod
+    def release_lock(self, key, token):
+        """Release the lock if `token` still owns it"""
+
+    @abc.abstractmethod
+    def incr(self, key, amount, ttl):
+        """Add amount to a counter created with a `ttl` second lifetime; return the new value"""
+
+    def _record_error(self, error):
+        with self._stats_lock:
+            self.errors += 1
+        logger.warning(f"Shared backend ({self.kind}) error: {str(error)}")
+
+    def stats(self):
+        with self._stats_lock:
+            return {'kind': self.kind, 'errors': self.errors}
+
+
+class MemoryBackend(Backend):
+    """Backend held in this process's memory"""
+
+    kind = 'memory'
+
+    def __init__(self, prefix='ytdl:'):
+        super().__init__(prefix)
+        self._data = {}  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _live(self, key, now):
+        """Return the unexpired entry for key (lock must be held)"""
+        entry = self._data.get(key)
+        if entry is not None and entry[1] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    def _put(self, key, value, ttl, now):
+        self._data[key] = (value, now + ttl)
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            for stale in [k for k, (_, expires_at) in self._data.items() if expires_at <= now]:
+                del self._data[stale]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(self.prefix + key, time.time())
+            return entry[0] if entry else None
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._put(self.prefix + key, value, ttl, time.time())
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(self.prefix + key, None)
+
+    def acquire_lock(self, key, ttl):
+        now = time.time()
+        with self._lock:
+            if self._live(self.prefix + key, now):
+                return None
+            token = uuid.uuid4().hex
+            self._put(self.prefix + key, token, ttl, now)
+            return token
+
+    def release_lock(self, key, token):
+        with self._lock:
+            entry = self._data.get(self.prefix + key)
+            if entry and entry[0] == token:
+                del self._data[self.prefix + key]
+
+    def incr(self, key, amount, ttl):
+        now = time.time()
+        with self._lock:
+            entry = self._live(self.prefix + key, now)
+            value = (entry[0] if entry else 0) + amount
+            expires_at = entry[1] if entry else now + ttl
+            self._data[self.prefix + key] = (value, expires_at)
+            return value
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats['keys'] = len(self._data)
+        return stats
+
+
+class SQLiteBackend(Backend):
+    """Backend in a SQLite file, shared by every process on this host"""
+
+    kind = 'sqlite'
+
+    def __init__(self, path, prefix='ytdl:', timeout=5.0):
+        super().__init__(prefix)
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._writes = 0
+        # Not kept: a connection opened before gunicorn forks must not be used by the workers
+        db = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        try:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('CREATE TABLE IF NOT EXISTS shared_state '
+                       '(key TEXT PRIMARY KEY, value, expires_at REAL NOT NULL)')
+        finally:
+            db.close()
+
+    def _connect(self):
+        """Return this thread's connection (sqlite3 connections must not be shared across threads)"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            # Autocommit; writes that read first use BEGIN IMMEDIATE to serialise with other processes
+            db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def _run(self, operation):
+        try:
+            return operation(self._connect())
+        except sqlite3.Error as e:
+            self._record_error(e)
+            raise BackendError(str(e)) from e
+
+    def _transaction(self, db, body):
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            result = body(db)
+            db.execute('COMMIT')
+            return result
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    def _maybe_purge(self, db, now):
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            db.execute('DELETE FROM shared_state WHERE expires_at <= ?', (now,))
+
+    def get(self, key):
+        def operation(db):
+            row = db.execute('SELECT value FROM shared_state WHERE key = ? AND expires_at > ?',
+                             (self.prefix + key, time.time())).fetchone()
+            return row[0] if row else None
+        return self._run(operation)
+
+    def set(self, key, value, ttl):
+        def operation(db):
+            now = time.time()
+            db.execute('INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)',
+                       (self.prefix + key, value, now + ttl))
+            self._maybe_purge(db, now)
+        self._run(operation)
+
+    def delete(self, key):
+        self._run(lambda db: db.execute('DELETE FROM shared_state WHERE key = ?', (self.prefix + key,)))
+
+    def acquire_lock(self, key, ttl):
+        def body(db):
+            now = time.time()
+            db.execute('DELETE FROM shared_state WHERE key = ? AND expires_at <= ?', (self.prefix + key, now))
+            token = uuid.uuid4().hex
+            cursor = db.execute('INSERT OR IGNORE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)',
+                                (self.prefix + key, token, now + ttl))
+            return token if cursor.rowcount == 1 else None
+        return self._run(lambda db: self._transaction(db, body))
+
+    def release_lock(self, key, token):
+        self._run(lambda db: db.execute('DELETE FROM shared_state WHERE key = ? AND value = ?',
+                                        (self.prefix + key, token)))
+
+    def incr(self, key, amount, ttl):
+        def body(db):
+            now = time.time()
+            db.execute('DELETE FROM shared_state WHERE key = ? AND expires_at <= ?', (self.prefix + key, now))
+            db.execute('INSERT INTO shared_state (key, value, expires_at) VALUES (?, ?, ?) '
+                       'ON CONFLICT(key) DO UPDATE SET value = value + excluded.value',
+                       (self.prefix + key, amount, now + ttl))
+            self._maybe_purge(db, now)
+            return db.execute('SELECT value FROM shared_state WHERE key = ?', (self.prefix + key,)).fetchone()[0]
+        return self._run(lambda db: self._transaction(db, body))
+
+    def stats(self):
+        stats = super().stats()
+        stats['path'] = self.path
+        return stats
+
+
+class RedisProtocolError(Exception):
+    """An error reply from the server (as opposed to a connection failure)"""
+
+
+class RedisConnection:
+    """One socket speaking RESP2: commands are arrays of bulk strings"""
+
+    def __init__(self, host, port, timeout):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+
+    @staticmethod
+    def encode(args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    def send(self, *commands):
+        self.sock.sendall(b''.join(self.encode(args) for args in commands))
+
+    def read(self):
+        line = self.reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError('Connection closed by server')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode('utf-8')
+        if kind == b'-':
+            return RedisProtocolError(payload.decode('utf-8'))
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError('Connection closed by server')
+            return data[:-2].decode('utf-8')
+        if kind == b'*':
+            length = int(payload)
+            return None if length < 0 else [self.read() for _ in range(length)]
+        raise ConnectionError(f'Unexpected reply type {kind!r}')
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisBackend(Backend):
+    """Backend on a Redis-protocol server, using a small pool of plain sockets"""
+
+    kind = 'redis'
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='ytdl:', timeout=2.0, pool_size=8, retry_interval=5.0):
+        super().__init__(prefix)
+        parsed = urlparse(url)
+        self.url = url
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.timeout = timeout
+        self.pool_size = pool_size
+        # After a connection failure, calls fail fast for this long instead of each waiting on a timeout
+        self.retry_interval = retry_interval
+        self._down_until = 0.0
+        self._idle = deque()
+        self._pool_lock = threading.Lock()
+
+    def _checkout(self):
+        with self._pool_lock:
+            if self._idle:
+                return self._idle.pop()
+        connection = RedisConnection(self.host, self.port, self.timeout)
+        setup = []
+        if self.password:
+            setup.append(('AUTH', self.username, self.password) if self.username else ('AUTH', self.password))
+        if self.db:
+            setup.append(('SELECT', self.db))
+        if setup:
+            connection.send(*setup)
+            for _ in setup:
+                reply = connection.read()
+                if isinstance(reply, RedisProtocolError):
+                    connection.close()
+                    raise reply
+        return connection
+
+    def _checkin(self, connection):
+        with self._pool_lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def pipeline(self, *commands):
+        """Send commands in one round trip and return their replies, raising on any error reply"""
+        if time.monotonic() < self._down_until:
+            raise BackendError(f'Redis at {self.host}:{self.port} unavailable')
+        for attempt in range(2):
+            connection = None
+            try:
+                connection = self._checkout()
+                connection.send(*commands)
+                replies = [connection.read() for _ in commands]
+            except (OSError, ConnectionError) as e:
+                if connection is not None:
+                    connection.close()
+                # A pooled connection may have been closed by the server while idle: retry once on a new one
+                if attempt == 0:
+                    continue
+                self._down_until = time.monotonic() + self.retry_interval
+                self._record_error(e)
+                raise BackendError(f'Redis at {self.host}:{self.port} unavailable: {str(e)}') from e
+            except RedisProtocolError as e:
+                if connection is not None:
+                    connection.close()
+                self._record_error(e)
+                raise BackendError(str(e)) from e
+            self._checkin(connection)
+            for reply in replies:
+                if isinstance(reply, RedisProtocolError):
+                    self._record_error(reply)
+                    raise BackendError(str(reply))
+            return replies
+
+    def execute(self, *args):
+        return self.pipeline(args)[0]
+
+    def ping(self):
+        return self.execute('PING') == 'PONG'
+
+    def get(self, key):
+        return self.execute('GET', self.prefix + key)
+
+    def set(self, key, value, ttl):
+        self.execute('SET', self.prefix + key, value, 'PX', max(1, int(ttl * 1000)))
+
+    def delete(self, key):
+        self.execute('DEL', self.prefix + key)
+
+    def acquire_lock(self, key, ttl):
+        token = uuid.uuid4().hex
+        reply = self.execute('SET', self.prefix + key, token, 'NX', 'PX', max(1, int(ttl * 1000)))
+        return token if reply == 'OK' else None
+
+    def release_lock(self, key, token):
+        self.execute('EVAL', RELEASE_SCRIPT, 1, self.prefix + key, token)
+
+    def incr(self, key, amount, ttl):
+        # SET NX creates the counter with its lifetime; INCRBY keeps that TTL
+        replies = self.pipeline(('SET', self.prefix + key, 0, 'NX', 'PX', max(1, int(ttl * 1000))),
+                                ('INCRBY', self.prefix + key, amount))
+        return replies[1]
+
+    def stats(self):
+        stats = super().stats()
+        with self._pool_lock:
+            stats['idle_connections'] = len(self._idle)
+        stats['server'] = f'{self.host}:{self.port}/{self.db}'
+        return stats
+
+
+def create_backend(kind=None):
+    """Build the backend named by SHARED_BACKEND (memory, sqlite or redis), or None when unset"""
+    kind = (kind if kind is not None else os.environ.get('SHARED_BACKEND', '')).strip().lower()
+    prefix = os.environ.get('SHARED_BACKEND_PREFIX', 'ytdl:')
+    if not kind or kind == 'none':
+        return None
+    if kind == 'memory':
+        return MemoryBackend(prefix)
+    if kind == 'sqlite':
+        path = os.environ.get('SHARED_BACKEND_PATH') or os.path.join(tempfile.gettempdir(), 'youtube_shared_state.db')
+        return SQLiteBackend(path, prefix)
+    if kind == 'redis':
+        return RedisBackend(os.environ.get('SHARED_BACKEND_URL', 'redis://localhost:6379/0'), prefix,
+                            timeout=float(os.environ.get('SHARED_BACKEND_TIMEOUT', 2.0)))
+    raise ValueError(f"Unknown SHARED_BACKEND {kind!r}: expected memory, sqlite or redis")
@@ -0,0 +1,241 @@
+"""
+Video metadata cache keyed by canonical YouTube video ID
+
+Lookups go through an in-process LRU, then the optional disk tier, then the
+optional shared backend (core.backends), which other workers and nodes fill.
+"""
+
+import os
+import json
+import copy
+import time
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+from core.backends import BackendError
+
+logger = logging.getLogger(__name__)
+
+
+def url_expiry(url):
+    """Return the signed `expire` timestamp of a googlevideo URL, or None"""
+    if not url:
+        return None
+    parsed = urlparse(url)
+    values = parse_qs(parsed.query).get('expire')
+    if not values and '/expire/' in parsed.path:
+        # Manifest style URLs carry their parameters as path segments
+        values = [parsed.path.split('/expire/', 1)[1].split('/', 1)[0]]
+    try:
+        return int(values[0]) if values else None
+    except ValueError:
+        return None
+
+
+def info_expiry(info):
+    """Return the earliest URL expiry across all formats of a video info dict"""
+    expiries = [url_expiry(fmt.get('url')) for fmt in info.get('formats') or []]
+    expiries = [e for e in expiries if e]
+    return min(expiries) if expiries else None
+
+
+class VideoInfoCache:
+    """Size-bounded LRU cache with TTL, an optional on-disk tier and an optional shared backend"""
+
+    def __init__(self, max_entries=512, ttl=3600, expiry_margin=300, disk_dir=None, backend=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.expiry_margin = expiry_margin
+        self.disk_dir = disk_dir
+        self.backend = backend
+        self._entries = OrderedDict()  # video_id -> (expires_at, info)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.shared_hits = 0
+        self.evictions = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._sweep_disk()
+
+    @classmethod
+    def from_env(cls, backend=None):
+        """Build a cache from VIDEO_CACHE_* environment variables"""
+        return cls(
+            max_entries=int(os.environ.get('VIDEO_CACHE_SIZE', 512)),
+            ttl=int(os.environ.get('VIDEO_CACHE_TTL', 3600)),
+            expiry_margin=int(os.environ.get('VIDEO_CACHE_EXPIRY_MARGIN', 300)),
+            disk_dir=os.environ.get('VIDEO_CACHE_DIR') or None,
+            backend=backend,
+        )
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def expires_at(self, info, now=None):
+        """Compute when a cached entry must be dropped, never past its URL expiry"""
+        now = now or time.time()
+        expires_at = now + self.ttl
+        url_expire = info_expiry(info)
+        if url_expire:
+            expires_at = min(expires_at, url_expire - self.expiry_margin)
+        return expires_at
+
+    def get(self, video_id):
+        """Return a copy of the cached info for a video ID, or None"""
+        if not self.enabled or not video_id:
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(video_id)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(video_id)
+                    self.hits += 1
+                    return copy.deepcopy(entry[1])
+                del self._entries[video_id]
+
+        entry, tier = self._read_disk(video_id, now), 'disk'
+        if entry is None:
+            entry, tier = self._read_shared(video_id, now), 'shared'
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if tier == 'disk':
+                self.disk_hits += 1
+            else:
+                self.shared_hits += 1
+            self._store(video_id, entry)
+        return copy.deepcopy(entry[1])
+
+    def set(self, video_id, info):
+        """Cache info for a video ID unless its URLs are already about to expire"""
+        if not self.enabled or not video_id:
+            return
+
+        expires_at = self.expires_at(info)
+        if expires_at <= time.time():
+            logger.info(f"Not caching {video_id}: format URLs expire too soon")
+            return
+
+        entry = (expires_at, copy.deepcopy(info))
+        with self._lock:
+            self._store(video_id, entry)
+        self._write_disk(video_id, entry)
+        self._write_shared(video_id, entry)
+
+    def invalidate(self, video_id):
+        """Drop a video ID from every tier"""
+        with self._lock:
+            self._entries.pop(video_id, None)
+        if self.disk_dir:
+            try:
+                os.remove(self._disk_path(video_id))
+            except OSError:
+                pass
+        if self.backend:
+            try:
+                self.backend.delete(f'info:{video_id}')
+            except BackendError:
+                pass
+
+    def stats(self):
+        """Return hit/miss counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'disk_hits': self.disk_hits,
+                'shared_hits': self.shared_hits,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _store(self, video_id, entry):
+        """Insert an entry and evict least recently used ones (lock must be held)"""
+        self._entries[video_id] = entry
+        self._entries.move_to_end(video_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_path(self, video_id):
+        return os.path.join(self.disk_dir, f'{video_id}.json')
+
+    def _read_disk(self, video_id, now):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(video_id)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('expires_at', 0) <= now:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return (data['expires_at'], data['info'])
+
+    def _write_disk(self, video_id, entry):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(video_id)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'expires_at': entry[0], 'info': entry[1]}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write disk cache for {video_id}: {str(e)}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def _read_shared(self, video_id, now):
+        if not self.backend:
+            return None
+        try:
+            raw = self.backend.get(f'info:{video_id}')
+        except BackendError:
+            return None
+        if raw is None:
+            return None
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            return None
+        if data.get('expires_at', 0) <= now:
+            return None
+        return (data['expires_at'], data['info'])
+
+    def _write_shared(self, video_id, entry):
+        if not self.backend:
+            return
+        try:
+            # The backend drops the entry when its URLs stop being servable
+            self.backend.set(f'info:{video_id}', json.dumps({'expires_at': entry[0], 'info': entry[1]}),
+                             entry[0] - time.time())
+        except BackendError:
+            pass
+
+    def _sweep_disk(self):
+        """Remove expired entries left over from previous runs"""
+        now = time.time()
+        for name in os.listdir(self.disk_dir):
+            if name.endswith('.json'):
+                self._read_disk(name[:-len('.json')], now)
@@ -0,0 +1,130 @@
+"""
+Rolling success statistics and circuit breakers for extraction configurations
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class _ConfigState:
+    def __init__(self, index, name, window):
+        self.index = index
+        self.name = name
+        self.samples = deque(maxlen=window)  # (success, latency)
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+        self.probe_started = 0.0
+        self.attempts = 0
+        self.successes = 0
+
+    def success_rate(self):
+        # Laplace smoothing so untried configs start at 0.5 instead of 0 or 1
+        wins = sum(1 for ok, _ in self.samples if ok)
+        return (wins + 1) / (len(self.samples) + 2)
+
+    def avg_latency(self):
+        latencies = [latency for ok, latency in self.samples if ok]
+        return sum(latencies) / len(latencies) if latencies else None
+
+
+class ConfigStats:
+    """Track per-config outcomes and order configs so the best one goes first"""
+
+    def __init__(self, names, window=50, failure_threshold=5, cooldown=120):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._states = [_ConfigState(i, name, window) for i, name in enumerate(names)]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, names):
+        """Build stats from CONFIG_* environment variables"""
+        return cls(
+            names,
+            window=int(os.environ.get('CONFIG_STATS_WINDOW', 50)),
+            failure_threshold=int(os.environ.get('CONFIG_BREAKER_THRESHOLD', 5)),
+            cooldown=float(os.environ.get('CONFIG_BREAKER_COOLDOWN', 120)),
+        )
+
+    def order(self):
+        """Return config indexes to try, best first, skipping tripped breakers"""
+        now = time.time()
+        with self._lock:
+            available = []
+            probes = []
+            for state in self._states:
+                if state.state == OPEN and now - state.opened_at >= self.cooldown:
+                    state.state = HALF_OPEN
+                    state.probing = False
+                if state.state == CLOSED:
+                    available.append(state)
+                elif state.state == HALF_OPEN and (not state.probing or now - state.probe_started >= self.cooldown):
+                    # Let one request at a time probe a recovering config, ahead of the others
+                    state.probing = True
+                    state.probe_started = now
+                    probes.append(state)
+
+            if not available and not probes:
+                # Everything is tripped: try the ones closest to recovery rather than nothing
+                return [s.index for s in sorted(self._states, key=lambda s: s.opened_at)]
+
+            available.sort(key=lambda s: (-round(s.success_rate(), 1),
+                                          s.avg_latency() or float('inf'),
+                                          s.index))
+            return [s.index for s in probes + available]
+
+    def record(self, index, success, latency):
+        """Record the outcome of one attempt"""
+        with self._lock:
+            state = self._states[index]
+            state.samples.append((success, latency))
+            state.attempts += 1
+            state.probing = False
+            if success:
+                state.successes += 1
+                state.consecutive_failures = 0
+                if state.state != CLOSED:
+                    logger.info(f"Configuration {index+1} ({state.name}) recovered")
+                state.state = CLOSED
+                return
+
+            state.consecutive_failures += 1
+            if state.state == HALF_OPEN or state.consecutive_failures >= self.failure_threshold:
+                if state.state != OPEN:
+                    logger.warning(f"Configuration {index+1} ({state.name}) tripped for {self.cooldown:.0f}s")
+                state.state = OPEN
+                state.opened_at = time.time()
+
+    def skip(self, index):
+        """Note an attempt whose outcome says nothing about the config (e.g. a removed video)"""
+        with self._lock:
+            self._states[index].probing = False
+
+    def snapshot(self):
+        """Return per-config statistics for the health endpoint"""
+        with self._lock:
+            return [
+                {
+                    'index': s.index + 1,
+                    'name': s.name,
+                    'state': s.state,
+                    'success_rate': round(s.success_rate(), 3),
+                    'avg_latency': round(s.avg_latency(), 3) if s.avg_latency() is not None else None,
+                    'window': len(s.samples),
+                    'attempts': s.attempts,
+                    'successes': s.successes,
+                    'consecutive_failures': s.consecutive_failures,
+                }
+                for s in self._states
+            ]
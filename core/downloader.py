@@ -0,0 +1,513 @@
+"""
+YouTube video extraction shared by the Flask app and the Vercel functions
+
+yt-dlp is imported lazily (see core.ytdlp) so that cheap paths such as CORS
+preflights, URL validation errors, cache hits and health checks never pay for it.
+"""
+
+import os
+import re
+import time
+import random
+import logging
+import tempfile
+import functools
+from contextlib import nullcontext
+
+from core import metrics
+from core.admission import ConcurrencyLimiter, TooManyRequests
+from core.backends import BackendError
+from core.cache import VideoInfoCache
+from core.config_stats import ConfigStats
+from core.errors import ExtractionError, NegativeCache, bot_signature, classify, extraction_error, is_permanent
+from core.formats import MUXED, build_ladder
+from core.hedging import HedgedRunner
+from core.singleflight import SingleFlight
+from core.tracing import bind, span
+from core.urls import InvalidURLError, parse_youtube_url
+from core.ytdlp import ydl_pool
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+DOWNLOAD_DIR = os.environ.get('DOWNLOAD_DIR') or os.path.join(tempfile.gettempdir(), 'youtube_downloads')
+os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+
+# yt-dlp configurations (name, options) tried to bypass bot detection
+EXTRACTION_CONFIGS = [
+    # Configuration 1: Chrome-like headers without cookies
+    ('chrome_desktop', {
+        'quiet': True,
+        'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'referer': 'https://www.youtube.com/',
+        'headers': {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
+            'Accept-Language': 'en-US,en;q=0.9',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'DNT': '1',
+            'Connection': 'keep-alive',
+            'Upgrade-Insecure-Requests': '1',
+            'Sec-Fetch-Dest': 'document',
+            'Sec-Fetch-Mode': 'navigate',
+            'Sec-Fetch-Site': 'none',
+            'Cache-Control': 'max-age=0',
+        },
+        'extractor_args': {
+            'youtube': {
+                'skip': ['dash', 'hls'],
+                'player_skip': ['configs', 'webpage']
+            }
+        }
+    }),
+    # Configuration 2: Safari-like headers
+    ('safari_mac', {
+        'quiet': True,
+        'user_agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15',
+        'referer': 'https://www.youtube.com/',
+        'headers': {
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Language': 'en-US,en;q=0.5',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'DNT': '1',
+            'Connection': 'keep-alive',
+            'Upgrade-Insecure-Requests': '1',
+        },
+    }),
+    # Configuration 3: Firefox-like headers
+    ('firefox_desktop', {
+        'quiet': True,
+        'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:120.0) Gecko/20100101 Firefox/120.0',
+        'referer': 'https://www.youtube.com/',
+        'headers': {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:120.0) Gecko/20100101 Firefox/120.0',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+            'Accept-Language': 'en-US,en;q=0.5',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'DNT': '1',
+            'Connection': 'keep-alive',
+            'Upgrade-Insecure-Requests': '1',
+            'Sec-Fetch-Dest': 'document',
+            'Sec-Fetch-Mode': 'navigate',
+            'Sec-Fetch-Site': 'none',
+        },
+    }),
+    # Configuration 4: Mobile Chrome headers
+    ('chrome_android', {
+        'quiet': True,
+        'user_agent': 'Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Mobile Safari/537.36',
+        'referer': 'https://m.youtube.com/',
+        'headers': {
+            'User-Agent': 'Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Mobile Safari/537.36',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
+            'Accept-Language': 'en-US,en;q=0.9',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'DNT': '1',
+            'Connection': 'keep-alive',
+            'Upgrade-Insecure-Requests': '1',
+        },
+    }),
+    # Configuration 5: Minimal configuration
+    ('minimal', {
+        'quiet': True,
+        'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+        'referer': 'https://www.youtube.com/',
+    }),
+]
+
+# 'sequential' tries configurations one by one, 'hedged' overlaps them
+EXTRACTION_MODE = os.environ.get('EXTRACTION_MODE', 'sequential').lower()
+# Reorder configurations by recent success rate and trip failing ones
+ADAPTIVE_CONFIG_ORDER = os.environ.get('ADAPTIVE_CONFIG_ORDER', 'True').lower() == 'true'
+# How long one process may hold a video's shared extraction lock (seconds), and how often waiters poll it
+SHARED_LOCK_TTL = float(os.environ.get('SHARED_LOCK_TTL', 90))
+SHARED_LOCK_POLL = float(os.environ.get('SHARED_LOCK_POLL', 0.2))
+
+class YouTubeVideoDownloader:
+    """Resolve YouTube URLs to video metadata and downloadable formats"""
+
+    def __init__(self, cache=None, hedger=None, config_stats=None, limiter=None, backend=None, negative_cache=None):
+        self.cache = cache
+        # Recent classified failures (removed, private, bot check...) answered without extracting
+        self.negative_cache = negative_cache
+        self.hedger = hedger
+        self.config_stats = config_stats
+        self.limiter = limiter
+        # Shared with other processes: extraction locks here, video info through the cache
+        self.backend = backend
+        self.inflight = SingleFlight()
+        self.shared_waits = 0
+        # Optional core.refresh.URLRefresher told about every resolved video
+        self.refresher = None
+        self.ydl_opts = {
+            'format': 'best[ext=mp4]/best',
+            # Same <video_id>/<format_id>.<ext> layout as the download store (core.store)
+            'outtmpl': os.path.join(DOWNLOAD_DIR, '%(id)s', '%(format_id)s.%(ext)s'),
+            'noplaylist': True,
+            'extract_flat': False,
+            'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'referer': 'https://www.youtube.com/',
+            'headers': {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+                'Accept-Language': 'en-us,en;q=0.5',
+                'Accept-Encoding': 'gzip,deflate',
+                'Accept-Charset': 'ISO-8859-1,utf-8;q=0.7,*;q=0.7',
+                'Keep-Alive': '300',
+                'Connection': 'keep-alive',
+            },
+            'extractor_args': {
+                'youtube': {
+                    'skip': ['dash', 'hls'],
+                    'player_skip': ['configs', 'webpage']
+                }
+            },
+            'cookiefile': None,  # 可以后续添加cookie文件路径
+            'ignoreerrors': False,
+            'no_warnings': False,
+        }
+    
+    def normalize_youtube_url(self, url):
+        """Normalize YouTube URLs to the canonical watch URL"""
+        return parse_youtube_url(url).watch_url
+    
+    def validate_youtube_url(self, url):
+        """Validate if the URL is a valid YouTube video URL"""
+        try:
+            parse_youtube_url(url)
+            return True
+        except InvalidURLError:
+            return False
+    
+    def extract_video_info(self, url, admit=None):
+        """Extract video information without downloading.
+
+        admit(), if given, is called only when the video has to be extracted
+        (not on a cache or negative-cache hit) and may raise TooManyRequests.
+        """
+        try:
+            # One parse validates the URL and yields the canonical video ID
+            with span('normalize'):
+                parsed = parse_youtube_url(url)
+            video_id = parsed.video_id
+            url = parsed.watch_url
+            
+            # Serve repeat lookups from the cache, keyed by video ID rather than raw URL
+            with span('cache') as timing:
+                result = self.cache.get(video_id) if self.cache else None
+                timing.set(hit=result is not None)
+            if result is not None:
+                logger.info(f"Cache hit for video {video_id}")
+            else:
+                failure = self.negative_cache.get(video_id) if self.negative_cache else None
+                if failure is not None:
+                    logger.info(f"Negative cache hit for video {video_id} ({failure.reason})")
+                    metrics.negative_cache_hits.inc(reason=failure.reason)
+                    raise failure
+                if admit:
+                    admit()
+                # Concurrent requests for the same video wait on a single extraction
+                with span('extract', video_id=video_id):
+                    result = self.inflight.do(video_id, self._extract_and_cache, url, video_id)
+            if self.refresher:
+                self.refresher.record(result)
+            return result
+                
+        except TooManyRequests:
+            raise
+        except ExtractionError as e:
+            logger.error(f"Error extracting video info: {str(e)}")
+            raise
+        except Exception as e:
+            logger.error(f"Error extracting video info: {str(e)}")
+            raise ValueError(f"Failed to extract video information: {str(e)}")
+    
+    def refresh_video_info(self, video_id):
+        """Re-extract a video now and replace its cached entry (used by background refresh)"""
+        return self.inflight.do(video_id, self._extract_and_cache, f'https://www.youtube.com/watch?v={video_id}', video_id)
+    
+    def _extract_and_cache(self, url, video_id=None):
+        """Extract video information and store it in the cache"""
+        token = None
+        if self.backend and self.cache and video_id:
+            # Another worker or node may already be extracting this video: wait for its result
+            with span('shared_lock'):
+                token, cached = self._claim_extraction(video_id)
+            if cached is not None:
+                return cached
+        try:
+            # Only real upstream work takes an extraction slot; cache hits and coalesced waiters do not
+            with self.limiter.slot() if self.limiter else nullcontext():
+                result = self._extract_video_info(url, video_id)
+        except ExtractionError as e:
+            if self.negative_cache:
+                self.negative_cache.set(video_id, e)
+            if e.permanent and self.cache and video_id:
+                # A video that was removed or made private must not keep being served from the cache
+                self.cache.invalidate(video_id)
+            raise
+        else:
+            if self.negative_cache:
+                self.negative_cache.discard(video_id)
+            if self.cache:
+                self.cache.set(result['video_id'], result)
+            return result
+        finally:
+            if token:
+                try:
+                    self.backend.release_lock(f'extract:{video_id}', token)
+                except BackendError:
+                    pass
+    
+    def _claim_extraction(self, video_id):
+        """Take the shared extraction lock for a video, or wait for its holder's cached result.
+
+        Returns (token, None) when this process should extract, or (None, info)
+        when another process finished it first; raises the holder's negative-cached
+        ExtractionError when it failed. If the backend is unavailable or
+        the holder outlives SHARED_LOCK_TTL, extraction proceeds without the lock.
+        """
+        key = f'extract:{video_id}'
+        deadline = time.monotonic() + SHARED_LOCK_TTL
+        waited = False
+        while True:
+            try:
+                token = self.backend.acquire_lock(key, SHARED_LOCK_TTL)
+            except BackendError:
+                return None, None
+            if token:
+                break
+            if not waited:
+                waited = True
+                self.shared_waits += 1
+                logger.info(f"Waiting for another process to extract {video_id}")
+            if time.monotonic() >= deadline:
+                return None, None
+            time.sleep(SHARED_LOCK_POLL)
+        if waited:
+            # The holder caches its result (or its classified failure) before releasing the lock
+            cached = self.cache.get(video_id)
+            failure = self.negative_cache.get(video_id) if cached is None and self.negative_cache else None
+            if cached is not None or failure is not None:
+                try:
+                    self.backend.release_lock(key, token)
+                except BackendError:
+                    pass
+            if failure is not None:
+                logger.info(f"Negative cache hit for video {video_id} after waiting ({failure.reason})")
+                metrics.negative_cache_hits.inc(reason=failure.reason)
+                raise failure
+            if cached is not None:
+                return None, cached
+        return token, None
+    
+    def _extract_video_info(self, url, video_id=None):
+        """Run yt-dlp against YouTube and build the API response"""
+        start = time.monotonic()
+        if self.hedger:
+            info, last_error = self._extract_hedged(url)
+        else:
+            info, last_error = self._extract_sequential(url)
+        metrics.extraction_duration.observe(time.monotonic() - start, outcome='success' if info else 'failure')
+        
+        if not info:
+            # Classified, user-friendly message; the bot-check one triggers the frontend's special handling
+            error = extraction_error(last_error)
+            metrics.extraction_failures.inc(reason=error.reason or 'unknown')
+            raise error
+            
+        if 'entries' in info:
+            video_info = info['entries'][0] if info['entries'] else None
+        else:
+            video_info = info
+        
+        if not video_info:
+            raise ValueError("No video found in the provided URL")
+        
+        # Rank every format in one pass; per-video fields are computed only once
+        filename_base = self.sanitize_filename(video_info.get('title', 'video'))
+        start = time.perf_counter()
+        with span('formats') as timing:
+            formats = build_ladder(video_info.get('formats'), filename_base,
+                                   self.get_quality_label, self.format_filesize)
+            timing.set(count=len(formats))
+        metrics.ladder_build_duration.observe(time.perf_counter() - start)
+        
+        # If no formats found, try the direct URL
+        if not formats and video_info.get('url'):
+            formats.append({
+                'format_id': 'direct',
+                'url': video_info['url'],
+                'ext': video_info.get('ext', 'mp4'),
+                'quality': 'Standard Quality',
+                'kind': MUXED,
+                'filesize': self.format_filesize(video_info.get('filesize')),
+                'filename': f"{filename_base}.{video_info.get('ext', 'mp4')}"
+            })
+        
+        return {
+            'video_id': video_info.get('id') or video_id,
+            'title': video_info.get('title', 'YouTube Video'),
+            'author': video_info.get('uploader', 'Unknown'),
+            'duration': self.format_duration(video_info.get('duration')),
+            'thumbnail': video_info.get('thumbnail', ''),
+            'formats': formats,
+            # Identifies this extraction; changes whenever the video is re-resolved
+            'resolved_at': time.time(),
+        }
+    
+    def _config_order(self):
+        """Return configuration indexes in the order they should be tried"""
+        if self.config_stats:
+            return self.config_stats.order()
+        return list(range(len(EXTRACTION_CONFIGS)))
+    
+    def _try_config(self, url, index):
+        """Run a single extraction attempt with one configuration"""
+        name, config = EXTRACTION_CONFIGS[index]
+        logger.info(f"Trying configuration {index+1} ({name})")
+        start = time.monotonic()
+        try:
+            with span('attempt', config=name):
+                with ydl_pool.checkout(name, config) as ydl:
+                    info = ydl.extract_info(url, download=False)
+                if not info:
+                    raise ValueError("Could not extract video information")
+        except Exception as e:
+            elapsed = time.monotonic() - start
+            permanent = is_permanent(e)
+            if self.config_stats:
+                if permanent:
+                    # The video itself is unavailable; that says nothing about this configuration
+                    self.config_stats.skip(index)
+                else:
+                    self.config_stats.record(index, False, elapsed)
+            signature = bot_signature(e)
+            if signature:
+                metrics.bot_detections.inc(signature=signature)
+            if permanent:
+                outcome = 'unavailable'
+            else:
+                outcome = 'bot_detected' if signature else 'error'
+            metrics.extraction_attempt_duration.observe(elapsed, config_index=index + 1, config=name, outcome=outcome)
+            raise
+        elapsed = time.monotonic() - start
+        if self.config_stats:
+            self.config_stats.record(index, True, elapsed)
+        metrics.extraction_attempt_duration.observe(elapsed, config_index=index + 1, config=name, outcome='success')
+        logger.info(f"Successfully extracted info with configuration {index+1} ({name})")
+        return info
+    
+    def _extract_sequential(self, url):
+        """Try each configuration in turn, pausing between attempts"""
+        last_error = None
+        for attempt, i in enumerate(self._config_order()):
+            try:
+                # Add random delay between attempts to avoid rapid requests
+                if attempt > 0:
+                    delay = random.uniform(1, 3)
+                    logger.info(f"Adding {delay:.1f}s delay before next attempt")
+                    with span('backoff'):
+                        time.sleep(delay)
+                
+                return self._try_config(url, i), None
+            except Exception as e:
+                last_error = e
+                logger.warning(f"Configuration {i+1} failed: {str(e)}")
+                if is_permanent(e):
+                    logger.info(f"Not trying other configurations: video is {classify(e)}")
+                    break
+        return None, last_error
+    
+    def _extract_hedged(self, url):
+        """Overlap configuration attempts; the first one to succeed wins"""
+        attempts = [bind(functools.partial(self._try_config, url, i)) for i in self._config_order()]
+        try:
+            _, info = self.hedger.run(attempts, is_final=is_permanent)
+            return info, None
+        except Exception as e:
+            return None, e
+    
+    def get_quality_label(self, fmt):
+        """Generate a human-readable quality label"""
+        height = fmt.get('height')
+        width = fmt.get('width')
+        
+        if height:
+            if height >= 2160:
+                return "4K (2160p)"
+            elif height >= 1440:
+                return "1440p HD"
+            elif height >= 1080:
+                return "1080p HD"
+            elif height >= 720:
+                return "720p HD"
+            elif height >= 480:
+                return "480p"
+            elif height >= 360:
+                return "360p"
+            elif height >= 240:
+                return "240p"
+            else:
+                return f"{height}p"
+        elif width:
+            if width >= 3840:
+                return "4K (2160p)"
+            elif width >= 2560:
+                return "1440p HD"
+            elif width >= 1920:
+                return "1080p HD"
+            elif width >= 1280:
+                return "720p HD"
+            else:
+                return "Standard Quality"
+        else:
+            return "Standard Quality"
+    
+    def format_filesize(self, size):
+        """Format file size in human readable format"""
+        if not size:
+            return "Unknown size"
+        
+        for unit in ['B', 'KB', 'MB', 'GB']:
+            if size < 1024.0:
+                return f"{size:.1f} {unit}"
+            size /= 1024.0
+        return f"{size:.1f} TB"
+    
+    def format_duration(self, duration):
+        """Format duration in human readable format"""
+        if not duration:
+            return "Unknown"
+        
+        hours = int(duration // 3600)
+        minutes = int((duration % 3600) // 60)
+        seconds = int(duration % 60)
+        
+        if hours > 0:
+            return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+        else:
+            return f"{minutes:02d}:{seconds:02d}"
+    
+    def sanitize_filename(self, filename):
+        """Sanitize filename for safe download"""
+        if not filename:
+            return "video"
+        
+        # Remove or replace invalid characters
+        filename = re.sub(r'[<>:"/\\|?*]', '', filename)
+        filename = filename.strip().replace(' ', '_')
+        return filename[:50]  # Limit length
+
+
+def create_downloader(backend=None):
+    """Build a downloader configured from the environment, sharing state through `backend` if given"""
+    return YouTubeVideoDownloader(
+        cache=VideoInfoCache.from_env(backend=backend),
+        hedger=HedgedRunner.from_env() if EXTRACTION_MODE == 'hedged' else None,
+        config_stats=ConfigStats.from_env([name for name, _ in EXTRACTION_CONFIGS]) if ADAPTIVE_CONFIG_ORDER else None,
+        limiter=ConcurrencyLimiter.from_env(),
+        backend=backend,
+        negative_cache=NegativeCache.from_env(backend=backend),
+    )
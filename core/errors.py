@@ -0,0 +1,243 @@
+"""
+Classification of extraction errors, and a negative cache for videos that cannot be resolved
+
+yt-dlp reports every failure as an exception whose message (and, for
+DownloadError, the wrapped ExtractorError in exc_info) says why. classify()
+maps it to a reason. Permanent reasons (removed, private, age-restricted...)
+describe the video itself, so no other extraction configuration can succeed
+and the fallback chain stops at the first one. Failed extractions are
+remembered per video ID for a TTL that depends on the reason, so repeated
+requests for a dead video are answered without going back to YouTube.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+from core.backends import BackendError
+
+# Error text that means YouTube wants the client to prove it is not a bot (all fragments must appear)
+BOT_SIGNATURES = [
+    ('sign_in', ("Sign in to confirm you're not a bot",)),
+    ('po_token', ("Unable to fetch GVS PO Token",)),
+    ('visitor_data', ("Missing required Visitor Data",)),
+    ('cookie_access', ("Operation not permitted", "Cookies")),
+]
+
+# reason -> (permanent, default negative-cache TTL in seconds, message returned to clients)
+ERROR_CLASSES = {
+    'removed': (True, 86400, "This video is unavailable or has been removed"),
+    'private': (True, 3600, "This video is private"),
+    'age_restricted': (True, 3600, "This video is age-restricted and cannot be downloaded without signing in"),
+    'members_only': (True, 3600, "This video is only available to channel members"),
+    'geo_blocked': (True, 3600, "This video is not available in the server's region"),
+    'upcoming': (True, 60, "This live stream or premiere has not started yet"),
+    'unsupported': (True, 86400, "This URL is not a supported YouTube video"),
+    # Kept as the bare YouTube wording: the frontend shows its bot-detection help for it
+    'bot_check': (False, 60, "Sign in to confirm you're not a bot"),
+    'rate_limited': (False, 30, "YouTube is rate limiting this server, please try again later"),
+}
+
+# (reason, lowercase message fragments, any of which matches); checked in order, first match wins.
+# Rate limiting comes first because YouTube words it as "Video unavailable. ... try again later",
+# and the specific "Video unavailable. <reason>" messages come before the generic removed one.
+ERROR_PATTERNS = [
+    ('rate_limited', ("http error 429", "too many requests", "try again later")),
+    ('age_restricted', ("sign in to confirm your age", "inappropriate for some users", "age-restricted")),
+    ('private', ("private video", "this video is private")),
+    ('members_only', ("members-only", "join this channel to get access", "available to this channel's members")),
+    ('geo_blocked', ("not made this video available in your country", "not available in your country",
+                     "blocked it in your country")),
+    ('upcoming', ("live event will begin", "premieres in", "premiere will begin")),
+    ('removed', ("video unavailable", "this video is unavailable", "has been removed", "no longer available",
+                 "account associated with this video has been terminated", "does not exist")),
+    ('unsupported', ("unsupported url", "incomplete youtube id")),
+]
+
+# yt-dlp exception types (matched by name; yt-dlp is imported lazily) that already say why
+TYPED_ERRORS = {
+    'GeoRestrictedError': 'geo_blocked',
+    'UnsupportedError': 'unsupported',
+    'UserNotLive': 'upcoming',
+}
+
+
+class ExtractionError(ValueError):
+    """Extraction failed for a classified reason (still a ValueError, so handlers answer 400)"""
+
+    def __init__(self, message, reason=None):
+        super().__init__(message)
+        self.reason = reason
+
+    @property
+    def permanent(self):
+        return is_permanent(self)
+
+
+def bot_signature(error):
+    """Return the name of the bot-detection signature matching an error, or None"""
+    text = str(error)
+    for name, fragments in BOT_SIGNATURES:
+        if all(fragment in text for fragment in fragments):
+            return name
+    return None
+
+
+def _unwrap(error):
+    """yt-dlp's DownloadError carries the extractor's exception in exc_info"""
+    for _ in range(5):
+        exc_info = getattr(error, 'exc_info', None)
+        inner = exc_info[1] if isinstance(exc_info, tuple) and len(exc_info) > 1 else None
+        if not isinstance(inner, BaseException) or inner is error:
+            break
+        error = inner
+    return error
+
+
+def classify(error):
+    """Return the reason an extraction error happened, or None when it is not recognised"""
+    if error is None:
+        return None
+    if isinstance(error, ExtractionError):
+        return error.reason
+    inner = _unwrap(error)
+    for cls in type(inner).__mro__:
+        if cls.__name__ in TYPED_ERRORS:
+            return TYPED_ERRORS[cls.__name__]
+    if bot_signature(error) or bot_signature(inner):
+        return 'bot_check'
+    text = f'{error} {inner}'.lower() if inner is not error else str(error).lower()
+    for reason, fragments in ERROR_PATTERNS:
+        if any(fragment in text for fragment in fragments):
+            return reason
+    return None
+
+
+def is_permanent(error):
+    """True when no other extraction configuration can get around the error"""
+    reason = classify(error)
+    return reason in ERROR_CLASSES and ERROR_CLASSES[reason][0]
+
+
+def extraction_error(error):
+    """Build the ExtractionError reported to clients for the last failed attempt"""
+    reason = classify(error)
+    if reason in ERROR_CLASSES:
+        return ExtractionError(ERROR_CLASSES[reason][2], reason)
+    return ExtractionError(f"Failed to extract video information. Please try a different video or try again later. "
+                           f"({str(error)[:100]}...)")
+
+
+class NegativeCache:
+    """Remember why a video could not be resolved, per reason TTL, in process and in the shared backend"""
+
+    def __init__(self, ttls=None, max_entries=10000, backend=None):
+        self.ttls = {reason: ttl for reason, (_, ttl, _) in ERROR_CLASSES.items()}
+        self.ttls.update(ttls or {})
+        self.max_entries = max_entries
+        self.backend = backend
+        self._entries = OrderedDict()  # video_id -> (expires_at, reason, message)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.stored = 0
+
+    @classmethod
+    def from_env(cls, backend=None):
+        """Build a negative cache from NEGATIVE_CACHE_* environment variables (TTL 0 disables a reason)"""
+        ttls = {}
+        for reason in ERROR_CLASSES:
+            value = os.environ.get(f'NEGATIVE_CACHE_TTL_{reason.upper()}')
+            if value is not None:
+                ttls[reason] = float(value)
+        return cls(ttls, max_entries=int(os.environ.get('NEGATIVE_CACHE_SIZE', 10000)), backend=backend)
+
+    def get(self, video_id):
+        """Return a fresh ExtractionError for a video that recently failed, or None"""
+        if not video_id or self.max_entries <= 0:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(video_id)
+            if entry is not None:
+                if entry[0] > now:
+                    self.hits += 1
+                    return ExtractionError(entry[2], entry[1])
+                del self._entries[video_id]
+
+        entry = self._read_shared(video_id, now)
+        if entry is None:
+            return None
+        with self._lock:
+            self.hits += 1
+            self.shared_hits += 1
+            self._store(video_id, entry)
+        return ExtractionError(entry[2], entry[1])
+
+    def set(self, video_id, error):
+        """Remember a classified failure for its reason's TTL; unclassified errors are not cached"""
+        reason = getattr(error, 'reason', None)
+        ttl = self.ttls.get(reason, 0)
+        if not video_id or self.max_entries <= 0 or ttl <= 0:
+            return
+        entry = (time.time() + ttl, reason, str(error))
+        with self._lock:
+            self.stored += 1
+            self._store(video_id, entry)
+        if self.backend:
+            try:
+                self.backend.set(f'neg:{video_id}', json.dumps({'reason': entry[1], 'message': entry[2]}), ttl)
+            except BackendError:
+                pass
+
+    def discard(self, video_id):
+        """Forget a failure (the video resolved after all)"""
+        with self._lock:
+            if self._entries.pop(video_id, None) is None and not self.backend:
+                return
+        if self.backend:
+            try:
+                self.backend.delete(f'neg:{video_id}')
+            except BackendError:
+                pass
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            reasons = {}
+            for expires_at, reason, _ in self._entries.values():
+                if expires_at > now:
+                    reasons[reason] = reasons.get(reason, 0) + 1
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'stored': self.stored,
+                'by_reason': reasons,
+            }
+
+    def _store(self, video_id, entry):
+        """Insert an entry and evict least recently stored ones (lock must be held)"""
+        self._entries[video_id] = entry
+        self._entries.move_to_end(video_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _read_shared(self, video_id, now):
+        if not self.backend:
+            return None
+        try:
+            raw = self.backend.get(f'neg:{video_id}')
+        except BackendError:
+            return None
+        if raw is None:
+            return None
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            return None
+        reason = data.get('reason')
+        # The backend only knows the key's remaining life; keep the local copy for the reason's TTL at most
+        return (now + self.ttls.get(reason, 0), reason, data.get('message', ''))
@@ -0,0 +1,141 @@
+"""
+Format ladder: rank, deduplicate and filter yt-dlp formats in a single pass
+"""
+
+MUXED = 'muxed'
+VIDEO_ONLY = 'video'
+AUDIO_ONLY = 'audio'
+KINDS = (MUXED, VIDEO_ONLY, AUDIO_ONLY)
+
+# Higher is preferred when resolution and bitrate tie
+VIDEO_CODEC_RANK = {'av01': 3, 'vp09': 2, 'vp9': 2, 'avc1': 1, 'h264': 1}
+AUDIO_CODEC_RANK = {'opus': 2, 'mp4a': 1, 'aac': 1}
+EXT_RANK = {'mp4': 2, 'm4a': 2, 'webm': 1}
+
+# Friendly names accepted by the vcodec filter
+CODEC_ALIASES = {'h264': 'avc1', 'avc': 'avc1', 'av1': 'av01', 'vp9': 'vp09'}
+
+
+def _codec(value):
+    """Return the codec family ('avc1', 'opus', ...) or None when absent"""
+    if not value or value == 'none':
+        return None
+    family = value.split('.', 1)[0].lower()
+    return 'vp09' if family == 'vp9' else family
+
+
+def _number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def build_ladder(raw_formats, filename_base, quality_label, format_filesize):
+    """Return the full ladder (muxed, video-only, audio-only), best first within each kind.
+
+    Each format is visited once: it is classified, given a rank key and kept only
+    if it beats the current best entry for its (kind, quality, container, codec)
+    slot, so every codec variant of a resolution stays selectable by the filters.
+    """
+    best = {}
+    for fmt in raw_formats or []:
+        url = fmt.get('url')
+        ext = fmt.get('ext') or 'mp4'
+        if not url or ext == 'mhtml':  # storyboards are not downloadable media
+            continue
+
+        # yt-dlp uses 'none' for a missing track and None for an unknown codec
+        if fmt.get('vcodec') == 'none':
+            kind = AUDIO_ONLY
+        elif fmt.get('acodec') == 'none':
+            kind = VIDEO_ONLY
+        else:
+            kind = MUXED
+        vcodec = _codec(fmt.get('vcodec'))
+        acodec = _codec(fmt.get('acodec'))
+
+        size = int(_number(fmt.get('filesize') or fmt.get('filesize_approx')))
+        if kind == AUDIO_ONLY:
+            abr = _number(fmt.get('abr') or fmt.get('tbr'))
+            quality = f"{round(abr)}kbps" if abr else 'Audio'
+            rank = (abr, AUDIO_CODEC_RANK.get(acodec, 0), EXT_RANK.get(ext, 0), size)
+        else:
+            quality = quality_label(fmt)
+            rank = (_number(fmt.get('height')), _number(fmt.get('fps')),
+                    _number(fmt.get('tbr') or fmt.get('vbr')),
+                    VIDEO_CODEC_RANK.get(vcodec, 0), EXT_RANK.get(ext, 0), size)
+
+        slot = (kind, quality, ext, acodec if kind == AUDIO_ONLY else vcodec)
+        current = best.get(slot)
+        if current is not None and current[0] >= rank:
+            continue
+
+        best[slot] = (rank, {
+            'format_id': fmt.get('format_id', ''),
+            'url': url,
+            'ext': ext,
+            'quality': quality,
+            'kind': kind,
+            'height': fmt.get('height'),
+            'fps': fmt.get('fps'),
+            'vcodec': vcodec,
+            'acodec': acodec,
+            'tbr': fmt.get('tbr'),
+            'filesize': format_filesize(size),
+            'filesize_bytes': size or None,
+            'filename': f"{filename_base}.{ext}",
+        })
+
+    kind_order = {kind: i for i, kind in enumerate(KINDS)}
+    ranked = sorted(best.items(), key=lambda item: (kind_order[item[0][0]], tuple(-v for v in item[1][0])))
+    return [entry for _, (_, entry) in ranked]
+
+
+def parse_filters(params):
+    """Read format filters from request parameters, raising ValueError on bad values"""
+    filters = {}
+
+    max_height = params.get('max_height')
+    if max_height not in (None, ''):
+        try:
+            filters['max_height'] = int(max_height)
+        except (TypeError, ValueError):
+            raise ValueError("max_height must be an integer")
+
+    vcodec = params.get('vcodec')
+    if vcodec:
+        vcodec = str(vcodec).lower()
+        filters['vcodec'] = CODEC_ALIASES.get(vcodec, vcodec)
+
+    ext = params.get('ext')
+    if ext:
+        filters['ext'] = str(ext).lower()
+
+    kind = params.get('kind')
+    if kind:
+        if kind not in KINDS:
+            raise ValueError(f"kind must be one of: {', '.join(KINDS)}")
+        filters['kind'] = kind
+
+    audio_only = params.get('audio_only')
+    if audio_only in (True, 'true', 'True', '1', 1):
+        filters['kind'] = AUDIO_ONLY
+
+    return filters
+
+
+def filter_formats(formats, max_height=None, vcodec=None, ext=None, kind=None):
+    """Keep only the ladder entries matching every given filter"""
+    result = []
+    for fmt in formats:
+        if kind and fmt.get('kind') != kind:
+            continue
+        if ext and fmt.get('ext') != ext:
+            continue
+        if vcodec and fmt.get('vcodec') != vcodec:
+            continue
+        if max_height and (fmt.get('height') or 0) > max_height:
+            continue
+        result.append(fmt)
+    return result
@@ -0,0 +1,100 @@
+"""
+Hedged execution of fallback attempts
+"""
+
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+
+class AttemptCancelled(Exception):
+    """Raised by an attempt that was cancelled before it started"""
+
+
+class HedgedRunner:
+    """Start the next fallback after a hedge delay or a failure; the first success wins.
+
+    Attempts that are already running cannot be interrupted (yt-dlp has no
+    cancellation hook), so losing attempts finish in the background and their
+    results are discarded. Attempts that have not started yet are cancelled.
+    """
+
+    def __init__(self, hedge_delay=2.5, max_parallel=2, global_max=8):
+        self.hedge_delay = hedge_delay
+        self.max_parallel = max(1, max_parallel)
+        # The shared executor caps concurrent attempts across all requests
+        self._executor = ThreadPoolExecutor(max_workers=max(1, global_max), thread_name_prefix='hedge')
+
+    @classmethod
+    def from_env(cls):
+        """Build a runner from HEDGE_* environment variables"""
+        return cls(
+            hedge_delay=float(os.environ.get('HEDGE_DELAY', 2.5)),
+            max_parallel=int(os.environ.get('HEDGE_MAX_PARALLEL', 2)),
+            global_max=int(os.environ.get('HEDGE_GLOBAL_MAX', 8)),
+        )
+
+    def run(self, attempts, is_final=None):
+        """Run zero-argument callables in order; return (index, result) of the first success.
+
+        An error for which is_final(error) is true ends the run straight away:
+        no further fallbacks are started and that error is raised.
+        """
+        if not attempts:
+            raise ValueError("No attempts to run")
+
+        cancelled = threading.Event()
+        pending = {}
+        errors = []
+        next_index = 0
+
+        def launch():
+            nonlocal next_index
+            future = self._executor.submit(self._run_attempt, attempts[next_index], cancelled)
+            pending[future] = next_index
+            next_index += 1
+
+        launch()
+        try:
+            while pending:
+                can_hedge = next_index < len(attempts) and len(pending) < self.max_parallel
+                done, _ = wait(pending, timeout=self.hedge_delay if can_hedge else None,
+                               return_when=FIRST_COMPLETED)
+                if not done:
+                    logger.info(f"Hedging: starting attempt {next_index + 1} after {self.hedge_delay:.1f}s")
+                    launch()
+                    continue
+
+                for future in done:
+                    index = pending.pop(future)
+                    try:
+                        return index, future.result()
+                    except Exception as e:
+                        errors.append(e)
+                        logger.warning(f"Hedged attempt {index + 1} failed: {str(e)}")
+                        if is_final and is_final(e):
+                            raise
+
+                # Replace each failed attempt with the next fallback straight away
+                failures = len(done)
+                while failures and next_index < len(attempts) and len(pending) < self.max_parallel:
+                    launch()
+                    failures -= 1
+        finally:
+            cancelled.set()
+            for future in pending:
+                future.cancel()
+
+        raise errors[-1]
+
+    @staticmethod
+    def _run_attempt(attempt, cancelled):
+        if cancelled.is_set():
+            raise AttemptCancelled("Attempt cancelled before it started")
+        return attempt()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,261 @@
+"""
+Background job queue for video resolution
+
+Jobs run on the process that accepted them. With a shared backend every
+state change is also written there (key job:<id>), so any worker or node can
+answer GET /api/jobs/<id> and its event stream, and results outlive the worker
+that produced them; other processes follow a job by polling its record.
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import logging
+import threading
+
+from core.backends import BackendError
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# How often a job owned by another process is re-read from the shared backend (seconds)
+SHARED_POLL = 0.5
+# Lifetime of the shared record of a job that has not finished yet (seconds)
+PENDING_TTL = 3600
+
+
+class QueueFull(Exception):
+    """Raised when the job queue cannot accept more work"""
+
+
+class Job:
+    def __init__(self, url, on_change=None):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.changed = threading.Condition()
+        self.on_change = on_change
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self):
+        data = {
+            'job_id': self.id,
+            'url': self.url,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if self.status == DONE:
+            data['result'] = self.result
+        elif self.status == FAILED:
+            data['error'] = self.error
+        return data
+
+    def _set_status(self, status):
+        with self.changed:
+            self.status = status
+            self.changed.notify_all()
+        if self.on_change:
+            self.on_change(self)
+
+    def wait(self, timeout, seen_status=None):
+        """Block until the job finishes (or leaves seen_status); return True if it changed"""
+        deadline = time.monotonic() + timeout
+        with self.changed:
+            while not self.finished and (seen_status is None or self.status == seen_status):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.changed.wait(remaining)
+        return True
+
+
+class SharedJob:
+    """Read-only view of a job owned by another process, refreshed from the shared backend"""
+
+    def __init__(self, manager, record):
+        self.manager = manager
+        self.record = record
+        self.id = record['job_id']
+
+    @property
+    def status(self):
+        return self.record['status']
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self):
+        return dict(self.record)
+
+    def wait(self, timeout, seen_status=None):
+        """Poll the record until the job finishes (or leaves seen_status); return True if it changed"""
+        deadline = time.monotonic() + timeout
+        while not self.finished and (seen_status is None or self.status == seen_status):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(SHARED_POLL, remaining))
+            record = self.manager._read_shared(self.id)
+            if record is not None:
+                self.record = record
+        return True
+
+
+class JobManager:
+    """Run jobs on a fixed-size worker pool fed by a bounded queue"""
+
+    def __init__(self, handler, workers=4, max_queue=100, retention=600, backend=None):
+        self.handler = handler
+        self.backend = backend
+        self.workers = workers
+        self.max_queue = max_queue
+        self.retention = retention
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls, handler, backend=None):
+        """Build a manager from JOB_* environment variables"""
+        return cls(
+            handler,
+            workers=int(os.environ.get('JOB_WORKERS', 4)),
+            max_queue=int(os.environ.get('JOB_QUEUE_SIZE', 100)),
+            retention=int(os.environ.get('JOB_RETENTION', 600)),
+            backend=backend,
+        )
+
+    def submit(self, url):
+        """Enqueue a URL and return its job; raise QueueFull when saturated"""
+        self._start_workers()
+        self._purge()
+        job = Job(url, on_change=self._publish if self.backend else None)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+                self.rejected += 1
+            raise QueueFull("Job queue is full, please try again later")
+        if self.backend:
+            self._publish(job)
+        return job
+
+    def get(self, job_id):
+        """Return a job run here, or a view of one run by another process, or None"""
+        self._purge()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.backend:
+            record = self._read_shared(job_id)
+            if record is not None:
+                return SharedJob(self, record)
+        return job
+
+    def _publish(self, job):
+        """Write the job's current state to the shared backend"""
+        ttl = self.retention if job.finished else max(self.retention, PENDING_TTL)
+        try:
+            self.backend.set(f'job:{job.id}', json.dumps(job.to_dict(), separators=(',', ':')), ttl)
+        except BackendError:
+            pass
+
+    def _read_shared(self, job_id):
+        try:
+            raw = self.backend.get(f'job:{job_id}')
+        except BackendError:
+            return None
+        try:
+            return json.loads(raw) if raw else None
+        except ValueError:
+            return None
+
+    def drain(self, timeout):
+        """Wait up to timeout seconds for queued and running jobs to finish; return True if idle"""
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stats(self):
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if job.status == RUNNING)
+            return {
+                'workers': self.workers,
+                'queue_depth': self._queue.qsize(),
+                'max_queue': self.max_queue,
+                'running': running,
+                'retained': len(self._jobs),
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+            }
+
+    def _start_workers(self):
+        # Threads are started on first use so importing the app never spawns any
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            job.started_at = time.time()
+            job._set_status(RUNNING)
+            try:
+                job.result = self.handler(job.url)
+                job.finished_at = time.time()
+                with self._lock:
+                    self.completed += 1
+                job._set_status(DONE)
+            except Exception as e:
+                job.error = str(e)
+                job.finished_at = time.time()
+                with self._lock:
+                    self.failed += 1
+                job._set_status(FAILED)
+                logger.warning(f"Job {job.id} failed: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _purge(self):
+        """Forget finished jobs older than the retention period"""
+        cutoff = time.time() - self.retention
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
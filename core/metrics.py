@@ -0,0 +1,206 @@
+"""
+In-process metrics rendered in the Prometheus text exposition format
+
+Recording is a dict lookup and an increment under a per-metric lock, so it is
+cheap enough for the request path. Values derived from component stats() are
+pulled by collectors only when /api/metrics is scraped.
+"""
+
+import bisect
+import threading
+
+# Request and extraction latencies range from sub-millisecond cache hits to slow fallback chains
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = self.header()
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, [list(state[0]), state[1], state[2]]) for key, state in self._values.items())
+        lines = self.header()
+        bounds = self.buckets + (float('inf'),)
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(float(bound))))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Registry:
+    """Holds metrics plus collectors that read component stats at scrape time"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collect):
+        """Add a callable returning [(name, kind, help, [(labels_dict, value), ...]), ...]"""
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render(self):
+        """Return every metric as Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collect in collectors:
+            for name, kind, documentation, samples in collect():
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    lines.append(f'{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+# Shared by every component in this process
+registry = Registry()
+
+http_requests = registry.counter(
+    'ytdl_http_requests_total', 'HTTP requests handled, by endpoint, method and status',
+    ('endpoint', 'method', 'status'))
+http_request_duration = registry.histogram(
+    'ytdl_http_request_duration_seconds', 'Time until response headers were ready, by endpoint and status',
+    ('endpoint', 'method', 'status'))
+http_in_flight = registry.gauge(
+    'ytdl_http_requests_in_flight', 'HTTP requests currently being handled', ('endpoint',))
+
+extraction_duration = registry.histogram(
+    'ytdl_extraction_duration_seconds', 'Full extraction (all configuration attempts), by outcome',
+    ('outcome',))
+extraction_attempt_duration = registry.histogram(
+    'ytdl_extraction_attempt_duration_seconds', 'Single yt-dlp attempt, by configuration and outcome',
+    ('config_index', 'config', 'outcome'))
+ladder_build_duration = registry.histogram(
+    'ytdl_ladder_build_duration_seconds', 'Time spent ranking formats into the ladder',
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05))
+bot_detections = registry.counter(
+    'ytdl_bot_detection_errors_total', 'Extraction attempts rejected by bot detection, by matched signature',
+    ('signature',))
+extraction_failures = registry.counter(
+    'ytdl_extraction_failures_total', 'Extractions that failed after all attempts, by classified reason',
+    ('reason',))
+negative_cache_hits = registry.counter(
+    'ytdl_negative_cache_hits_total', 'Requests answered from a recent classified failure, by reason',
+    ('reason',))
+admission_rejections = registry.counter(
+    'ytdl_admission_rejections_total', 'Requests answered 429, by reason', ('reason',))
+url_refreshes = registry.counter(
+    'ytdl_url_refreshes_total', 'Background re-extractions of hot videos before URL expiry, by result',
+    ('result',))
@@ -0,0 +1,239 @@
+"""
+Streaming mux of separate video and audio formats into one fragmented file via ffmpeg
+
+ffmpeg reads both inputs over HTTP, copies the streams without re-encoding and
+writes fragmented MP4 (or WebM) to a pipe, which is relayed to the client in
+fixed-size chunks. Nothing is written to disk. Jobs are bounded by a semaphore.
+When ffmpeg fails before any output because an input's signed URL expired
+(403/410), MuxSourceExpired is raised so the caller can resolve the URLs again.
+"""
+
+import os
+import re
+import time
+import shutil
+import logging
+import threading
+import subprocess
+from collections import deque
+
+import requests
+
+from core.formats import AUDIO_ONLY, VIDEO_ONLY
+from core.relay import DEFAULT_USER_AGENT, build_session
+
+logger = logging.getLogger(__name__)
+
+# container -> (video ext, audio ext, ffmpeg muxer, content type, extra muxer options)
+CONTAINERS = {
+    'mp4': ('mp4', 'm4a', 'mp4', 'video/mp4', ['-movflags', 'frag_keyframe+empty_moov+default_base_moof']),
+    'webm': ('webm', 'webm', 'webm', 'video/webm', ['-cluster_time_limit', '5000']),
+}
+
+# Video codec picked for a container when the client does not ask for one: H.264 plays almost everywhere
+PREFERRED_VCODEC = {'mp4': 'avc1'}
+
+# ffmpeg's HTTP protocol logs "HTTP error 403 Forbidden" or "Server returned 403 Forbidden (access denied)"
+_EXPIRED_INPUT = re.compile(r'(?:HTTP error|Server returned) (?:403|410)\b|\bForbidden\b|\b410 Gone\b')
+# ffmpeg's error string names only 400/401/403/404; any other 4xx, 410 among them, ends as
+# "Server returned 4XX Client Error, but not one of ..." unless its "HTTP error 410 Gone" log line (matched
+# above) was kept, so this generic form is confirmed by probing the inputs
+_CLIENT_ERROR = re.compile(r'Server returned 4XX Client Error')
+
+
+class MuxUnavailable(Exception):
+    """Raised when ffmpeg is not installed"""
+
+
+class MuxLimitExceeded(Exception):
+    """Raised when all mux slots are in use"""
+
+
+class MuxError(Exception):
+    """Raised when ffmpeg fails before producing any output"""
+
+
+class MuxSourceExpired(MuxError):
+    """Raised when an input URL answered 403 or 410: the signed URLs have to be resolved again"""
+
+
+def pick_tracks(formats, container='mp4', max_height=None, vcodec=None):
+    """Return the best (video_format, audio_format) pair for a container from a ranked ladder.
+
+    Without vcodec, the container's preferred codec is used when the ladder has
+    it (avc1 for mp4), otherwise the best video track of any codec.
+    """
+    if container not in CONTAINERS:
+        raise ValueError(f"container must be one of: {', '.join(CONTAINERS)}")
+    video_ext, audio_ext = CONTAINERS[container][:2]
+    # The ladder keeps every codec variant and is ordered best first within each kind, so the first match wins
+    videos = [f for f in formats if f.get('kind') == VIDEO_ONLY and f.get('ext') == video_ext
+              and (not max_height or (f.get('height') or 0) <= max_height)]
+    if vcodec:
+        video = next((f for f in videos if f.get('vcodec') == vcodec), None)
+    else:
+        preferred = PREFERRED_VCODEC.get(container)
+        video = next((f for f in videos if f.get('vcodec') == preferred), videos[0] if videos else None)
+    audio = next((f for f in formats if f.get('kind') == AUDIO_ONLY and f.get('ext') == audio_ext), None)
+    return video, audio
+
+
+class MuxStream:
+    """Iterate ffmpeg's output in fixed-size chunks, then release the job's slot"""
+
+    def __init__(self, muxer, process, first_chunk, stderr_tail):
+        self.muxer = muxer
+        self.process = process
+        self.first_chunk = first_chunk
+        self.stderr_tail = stderr_tail
+        self.bytes_sent = 0
+        self._started = time.monotonic()
+        self._closed = False
+
+    def __iter__(self):
+        try:
+            chunk = self.first_chunk
+            while chunk:
+                self.bytes_sent += len(chunk)
+                yield chunk
+                chunk = self.process.stdout.read(self.muxer.chunk_size)
+            if self.process.wait() != 0:
+                logger.warning(f"ffmpeg exited with {self.process.returncode}: {' '.join(self.stderr_tail)}")
+        finally:
+            self.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        # Stops ffmpeg promptly when the client disconnects mid-stream
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        self.process.stdout.close()
+        self.muxer._finish(self.bytes_sent, time.monotonic() - self._started)
+
+
+class StreamMuxer:
+    """Run bounded ffmpeg mux jobs whose output is streamed as it is produced"""
+
+    def __init__(self, max_jobs=2, chunk_size=64 * 1024, ffmpeg_path='ffmpeg', user_agent=DEFAULT_USER_AGENT):
+        self.max_jobs = max_jobs
+        self.chunk_size = chunk_size
+        self.ffmpeg_path = ffmpeg_path
+        self.user_agent = user_agent
+        self._slots = threading.BoundedSemaphore(max_jobs)
+        # Only used to check the inputs after ffmpeg fails on an ambiguous HTTP error
+        self.session = build_session(pool_size=2, user_agent=user_agent)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.bytes_sent = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build a muxer from MUX_* and FFMPEG_PATH environment variables"""
+        return cls(
+            max_jobs=int(os.environ.get('MUX_MAX_JOBS', 2)),
+            chunk_size=int(os.environ.get('MUX_CHUNK_SIZE', 64 * 1024)),
+            ffmpeg_path=os.environ.get('FFMPEG_PATH', 'ffmpeg'),
+        )
+
+    @property
+    def available(self):
+        return shutil.which(self.ffmpeg_path) is not None
+
+    def command(self, video_url, audio_url, container):
+        muxer, extra = CONTAINERS[container][2], CONTAINERS[container][4]
+        http_input = ['-user_agent', self.user_agent, '-reconnect', '1', '-reconnect_streamed', '1']
+        return [
+            self.ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-nostdin',
+            *http_input, '-i', video_url,
+            *http_input, '-i', audio_url,
+            '-map', '0:v:0', '-map', '1:a:0', '-c', 'copy',
+            *extra, '-f', muxer, 'pipe:1',
+        ]
+
+    def open(self, video_url, audio_url, container='mp4'):
+        """Start muxing; return a MuxStream once ffmpeg has produced its first bytes"""
+        if not self.available:
+            raise MuxUnavailable("Muxing is unavailable: ffmpeg is not installed on the server")
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise MuxLimitExceeded("Too many active mux jobs, please try again later")
+
+        try:
+            process = subprocess.Popen(self.command(video_url, audio_url, container), stdin=subprocess.DEVNULL,
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+        except Exception:
+            self._slots.release()
+            raise
+
+        # Drain stderr so ffmpeg never blocks on it; keep only the last few lines for errors
+        stderr_tail = deque(maxlen=10)
+        stderr_reader = threading.Thread(target=self._read_stderr, args=(process, stderr_tail), daemon=True)
+        stderr_reader.start()
+
+        first_chunk = process.stdout.read(self.chunk_size)
+        if not first_chunk:
+            # Usually an upstream error (such as 403) on one of the inputs
+            process.wait()
+            process.stdout.close()
+            stderr_reader.join(timeout=1)
+            with self._lock:
+                self.failed += 1
+            self._slots.release()
+            message = ' '.join(stderr_tail) or f'ffmpeg exited with {process.returncode}'
+            if self._inputs_expired(message, video_url, audio_url):
+                raise MuxSourceExpired(message)
+            raise MuxError(message)
+        with self._lock:
+            self.active += 1
+        return MuxStream(self, process, first_chunk, stderr_tail)
+
+    def _inputs_expired(self, message, video_url, audio_url):
+        """Whether ffmpeg failed because an input URL expired, probing the inputs when its log is ambiguous"""
+        if _EXPIRED_INPUT.search(message):
+            return True
+        if not _CLIENT_ERROR.search(message):
+            return False
+        for url in (video_url, audio_url):
+            try:
+                response = self.session.get(url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=(5, 10))
+            except requests.RequestException:
+                continue
+            response.close()
+            if response.status_code in (403, 410):
+                return True
+        return False
+
+    @staticmethod
+    def _read_stderr(process, tail):
+        for line in process.stderr:
+            tail.append(line.decode('utf-8', 'replace').strip())
+        process.stderr.close()
+
+    def _finish(self, bytes_sent, seconds):
+        with self._lock:
+            self.active -= 1
+            self.completed += 1
+            self.bytes_sent += bytes_sent
+        self._slots.release()
+        rate = bytes_sent / seconds if seconds > 0 else 0
+        logger.info(f"Muxed {bytes_sent} bytes in {seconds:.2f}s ({rate / 1024 / 1024:.2f} MB/s)")
+
+    def stats(self):
+        available = self.available
+        with self._lock:
+            return {
+                'available': available,
+                'active': self.active,
+                'max_jobs': self.max_jobs,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'bytes_sent': self.bytes_sent,
+            }
@@ -0,0 +1,119 @@
+"""
+Lazy, paged enumeration of YouTube playlists and channels
+"""
+
+import os
+import re
+import base64
+import logging
+from contextlib import nullcontext
+
+from core.urls import NOT_STRING, InvalidURLError, parse_youtube_url
+from core.ytdlp import load_yt_dlp
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_RE = re.compile(
+    r'youtube\.com/(@[\w.-]+|channel/UC[\w-]+|c/[\w.-]+|user/[\w.-]+)(/(?:videos|shorts|streams))?'
+)
+
+PLAYLIST_PAGE_SIZE = int(os.environ.get('PLAYLIST_PAGE_SIZE', 50))
+PLAYLIST_MAX_PAGE_SIZE = int(os.environ.get('PLAYLIST_MAX_PAGE_SIZE', 200))
+
+
+def playlist_url(url):
+    """Return the canonical listing URL for a playlist or channel URL, or None"""
+    try:
+        parsed = parse_youtube_url(url, require_video=False)
+        if parsed.playlist_id:
+            return parsed.playlist_url
+    except InvalidURLError as e:
+        if e.reason == NOT_STRING:
+            return None
+    match = CHANNEL_RE.search(url or '')
+    if match:
+        # The bare channel URL lists tabs rather than videos
+        return f'https://www.youtube.com/{match.group(1)}{match.group(2) or "/videos"}'
+    return None
+
+
+def encode_cursor(offset):
+    return base64.urlsafe_b64encode(str(offset).encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the entry offset encoded in a cursor, raising ValueError if malformed"""
+    if not cursor:
+        return 0
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        offset = int(base64.urlsafe_b64decode(padded.encode('ascii')).decode('ascii'))
+    except Exception:
+        raise ValueError("Invalid playlist cursor")
+    if offset < 0:
+        raise ValueError("Invalid playlist cursor")
+    return offset
+
+
+class PlaylistPager:
+    """Fetch one page of flat playlist entries at a time without resolving formats"""
+
+    def __init__(self, ydl_opts=None, limiter=None):
+        self.ydl_opts = dict(ydl_opts or {})
+        # Optional ConcurrencyLimiter shared with video extraction
+        self.limiter = limiter
+
+    def page(self, url, cursor=None, page_size=None):
+        """Return a page of lightweight entries plus a cursor for the next page"""
+        listing_url = playlist_url(url)
+        if not listing_url:
+            raise ValueError("URL is not a YouTube playlist or channel")
+
+        offset = decode_cursor(cursor)
+        page_size = max(1, min(int(page_size or PLAYLIST_PAGE_SIZE), PLAYLIST_MAX_PAGE_SIZE))
+
+        opts = dict(self.ydl_opts)
+        opts.update({
+            'quiet': True,
+            'noplaylist': False,
+            'extract_flat': 'in_playlist',
+            'lazy_playlist': True,
+            # Ask for one extra entry to learn whether another page exists
+            'playlist_items': f'{offset + 1}:{offset + page_size + 1}',
+        })
+
+        logger.info(f"Fetching playlist page at offset {offset} for: {listing_url}")
+        with self.limiter.slot() if self.limiter else nullcontext():
+            with load_yt_dlp().YoutubeDL(opts) as ydl:
+                info = ydl.extract_info(listing_url, download=False)
+        if not info:
+            raise ValueError("Could not extract playlist information")
+
+        entries = []
+        has_more = False
+        for entry in info.get('entries') or []:
+            if len(entries) == page_size:
+                has_more = True
+                break
+            if entry and entry.get('id'):
+                entries.append(self.format_entry(entry))
+
+        return {
+            'playlist_id': info.get('id'),
+            'title': info.get('title', 'YouTube Playlist'),
+            'author': info.get('uploader') or info.get('channel') or 'Unknown',
+            'entry_count': info.get('playlist_count'),
+            'entries': entries,
+            'next_cursor': encode_cursor(offset + page_size) if has_more else None,
+        }
+
+    def format_entry(self, entry):
+        """Keep only the fields a client needs to list an entry and resolve it later"""
+        thumbnails = entry.get('thumbnails') or []
+        return {
+            'video_id': entry['id'],
+            'title': entry.get('title'),
+            'duration_seconds': entry.get('duration'),
+            'thumbnail': thumbnails[-1].get('url') if thumbnails else None,
+            'url': f"https://www.youtube.com/watch?v={entry['id']}",
+        }
@@ -0,0 +1,237 @@
+"""
+Background refresh of hot videos before their cached format URLs expire
+
+Every resolved video is recorded with a decaying request count and the time
+its cache entry stops being served (the earliest signed URL `expire` minus the
+cache margin, or the cache TTL). A background thread re-extracts popular
+videos shortly before that deadline, so interactive requests keep hitting the
+cache instead of waiting on a full extraction after a 403.
+
+Refreshes are capped by a token bucket, skipped while user extractions need
+the slots, and paused entirely after a bot-detection error.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from core import metrics
+from core.admission import TooManyRequests
+from core.backends import BackendError
+
+logger = logging.getLogger(__name__)
+
+
+class _Tracked:
+    __slots__ = ('score', 'seen_at', 'resolved_at', 'deadline', 'retry_at')
+
+    def __init__(self, now):
+        self.score = 0.0
+        self.seen_at = now
+        self.resolved_at = None
+        self.deadline = None
+        self.retry_at = 0.0
+
+
+class URLRefresher:
+    """Track video popularity and re-resolve hot videos before their URLs expire"""
+
+    def __init__(self, downloader, margin=600, min_score=3, half_life=900, rate=6, interval=5,
+                 max_tracked=5000, failure_backoff=300, bot_pause=900, is_bot_error=None):
+        self.downloader = downloader
+        # Refresh this many seconds before the cached entry would be dropped
+        self.margin = margin
+        # Decayed request count a video needs to be worth refreshing
+        self.min_score = min_score
+        self.half_life = half_life
+        # Refreshes per minute, with a burst of one minute's worth
+        self.rate = rate
+        self.interval = interval
+        self.max_tracked = max_tracked
+        self.failure_backoff = failure_backoff
+        self.bot_pause = bot_pause
+        self.is_bot_error = is_bot_error or (lambda error: False)
+        self.refreshed = 0
+        self.failed = 0
+        self.skipped_busy = 0
+        self.paused_until = 0.0
+        self._tokens = float(rate)
+        self._tokens_at = time.monotonic()
+        self._videos = OrderedDict()  # video_id -> _Tracked, least recently requested first
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_env(cls, downloader, is_bot_error=None):
+        """Build a refresher from URL_REFRESH_* environment variables, or None when disabled"""
+        if os.environ.get('URL_REFRESH_ENABLED', 'True').lower() != 'true' or not downloader.cache:
+            return None
+        return cls(
+            downloader,
+            margin=float(os.environ.get('URL_REFRESH_MARGIN', 600)),
+            min_score=float(os.environ.get('URL_REFRESH_MIN_HITS', 3)),
+            half_life=float(os.environ.get('URL_REFRESH_HALF_LIFE', 900)),
+            rate=float(os.environ.get('URL_REFRESH_RATE', 6)),
+            interval=float(os.environ.get('URL_REFRESH_INTERVAL', 5)),
+            max_tracked=int(os.environ.get('URL_REFRESH_MAX_TRACKED', 5000)),
+            is_bot_error=is_bot_error,
+        )
+
+    def _decayed(self, tracked, now):
+        return tracked.score * 0.5 ** ((now - tracked.seen_at) / self.half_life)
+
+    def _hot(self, score):
+        # min_score requests in quick succession qualify despite the slight decay between them
+        return score > self.min_score - 1
+
+    def record(self, info):
+        """Count a request for a resolved video; called on cache hits and fresh extractions alike"""
+        video_id = info.get('video_id')
+        if not video_id:
+            return
+        now = time.time()
+        with self._lock:
+            tracked = self._videos.pop(video_id, None) or _Tracked(now)
+            tracked.score = self._decayed(tracked, now) + 1
+            tracked.seen_at = now
+            self._videos[video_id] = tracked
+            resolved_at = info.get('resolved_at')
+            if resolved_at != tracked.resolved_at:
+                # Parsing every format URL is only needed once per extraction
+                tracked.resolved_at = resolved_at
+                tracked.deadline = self.downloader.cache.expires_at(info, now=resolved_at or now)
+            while len(self._videos) > self.max_tracked:
+                self._videos.popitem(last=False)
+        self._start()
+
+    def due(self, now=None):
+        """Return hot video IDs whose cache entries expire within the margin, hottest first"""
+        now = now or time.time()
+        with self._lock:
+            candidates = [(self._decayed(t, now), video_id) for video_id, t in self._videos.items()
+                          if t.deadline and t.deadline - now <= self.margin and t.deadline > now
+                          and t.retry_at <= now]
+        return [video_id for score, video_id in sorted(candidates, reverse=True) if self._hot(score)]
+
+    def _take_token(self):
+        now = time.monotonic()
+        with self._lock:
+            self._tokens = min(self.rate, self._tokens + (now - self._tokens_at) * self.rate / 60)
+            self._tokens_at = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def _users_waiting(self):
+        """True while user extractions need the slots (refresh only uses the spare half)"""
+        limiter = self.downloader.limiter
+        if not limiter or limiter.max_concurrent <= 0:
+            return False
+        stats = limiter.stats()
+        return stats['waiting'] > 0 or stats['active'] >= max(1, limiter.max_concurrent // 2)
+
+    def run_once(self):
+        """Refresh as many due videos as the budget allows; return how many were refreshed"""
+        if time.time() < self.paused_until:
+            return 0
+        count = 0
+        for video_id in self.due():
+            if self._users_waiting():
+                with self._lock:
+                    self.skipped_busy += 1
+                break
+            if not self._take_token():
+                break
+            if not self._claim(video_id):
+                with self._lock:
+                    self._tokens += 1
+                    tracked = self._videos.get(video_id)
+                    if tracked:
+                        # Another process is refreshing it; the new entry arrives via the shared tier
+                        tracked.retry_at = time.time() + self.margin
+                continue
+            if self._refresh(video_id):
+                count += 1
+            elif time.time() < self.paused_until:
+                break
+        return count
+
+    def _claim(self, video_id):
+        """With a shared backend, let only one process refresh a video per margin window"""
+        backend = self.downloader.backend
+        if not backend:
+            return True
+        try:
+            # Not released: the refreshed entry reaches other processes through the shared cache tier
+            return backend.acquire_lock(f'refresh:{video_id}', self.margin) is not None
+        except BackendError:
+            return True
+
+    def _refresh(self, video_id):
+        start = time.monotonic()
+        try:
+            info = self.downloader.refresh_video_info(video_id)
+        except TooManyRequests:
+            # User traffic took the extraction slots first; try again next cycle
+            with self._lock:
+                self.skipped_busy += 1
+            return False
+        except Exception as e:
+            now = time.time()
+            with self._lock:
+                self.failed += 1
+                tracked = self._videos.get(video_id)
+                if tracked:
+                    tracked.retry_at = now + self.failure_backoff
+                if self.is_bot_error(e):
+                    # Background traffic must not add to a bot-detection episode
+                    self.paused_until = now + self.bot_pause
+            metrics.url_refreshes.inc(result='failed')
+            logger.warning(f"Background refresh of {video_id} failed: {str(e)}")
+            return False
+        with self._lock:
+            self.refreshed += 1
+            tracked = self._videos.get(video_id)
+            if tracked:
+                tracked.resolved_at = info.get('resolved_at')
+                tracked.deadline = self.downloader.cache.expires_at(info, now=tracked.resolved_at)
+        metrics.url_refreshes.inc(result='refreshed')
+        logger.info(f"Refreshed {video_id} in the background ({time.monotonic() - start:.2f}s)")
+        return True
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='url-refresh', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"URL refresh loop error: {str(e)}")
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            hot = sum(1 for t in self._videos.values() if self._hot(self._decayed(t, now)))
+            return {
+                'tracked': len(self._videos),
+                'hot': hot,
+                'refreshed': self.refreshed,
+                'failed': self.failed,
+                'skipped_busy': self.skipped_busy,
+                'rate_per_minute': self.rate,
+                'paused_for': max(0, round(self.paused_until - now)),
+            }
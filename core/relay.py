@@ -0,0 +1,141 @@
+"""
+Chunked relay of upstream media streams over pooled keep-alive connections
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Upstream response headers that are safe and useful to pass through
+PASSTHROUGH_HEADERS = ('Content-Type', 'Content-Length', 'Content-Range', 'Accept-Ranges',
+                       'Last-Modified', 'ETag')
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+
+class StreamLimitExceeded(Exception):
+    """Raised when all relay slots are in use"""
+
+
+def build_session(pool_size=16, user_agent=DEFAULT_USER_AGENT):
+    """Return a requests session whose keep-alive pool is shared across streams"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['User-Agent'] = user_agent
+    return session
+
+
+class RelayStream:
+    """Iterate an upstream response in fixed-size chunks, then release its slot"""
+
+    def __init__(self, relay, upstream):
+        self.relay = relay
+        self.upstream = upstream
+        self.status_code = upstream.status_code
+        self.headers = {name: upstream.headers[name] for name in PASSTHROUGH_HEADERS
+                        if name in upstream.headers}
+        self.bytes_sent = 0
+        self._started = time.monotonic()
+        self._closed = False
+
+    def __iter__(self):
+        max_rate = self.relay.max_rate
+        try:
+            for chunk in self.upstream.iter_content(chunk_size=self.relay.chunk_size):
+                if not chunk:
+                    continue
+                self.bytes_sent += len(chunk)
+                yield chunk
+                if max_rate:
+                    # Pace the stream so it never exceeds max_rate bytes per second
+                    ahead = self.bytes_sent / max_rate - (time.monotonic() - self._started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        finally:
+            self.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.upstream.close()
+        self.relay._finish(self.bytes_sent, time.monotonic() - self._started)
+
+
+class StreamRelay:
+    """Relay media to clients without buffering whole files, with bounded concurrency"""
+
+    def __init__(self, chunk_size=256 * 1024, pool_size=16, max_streams=32, max_rate=0, timeout=(5, 30)):
+        self.chunk_size = chunk_size
+        self.max_streams = max_streams
+        self.max_rate = max_rate
+        self.timeout = timeout
+        self.session = build_session(pool_size)
+        self._slots = threading.BoundedSemaphore(max_streams)
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=100)  # (bytes, seconds) of recently finished streams
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.bytes_sent = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build a relay from RELAY_* environment variables"""
+        return cls(
+            chunk_size=int(os.environ.get('RELAY_CHUNK_SIZE', 256 * 1024)),
+            pool_size=int(os.environ.get('RELAY_POOL_SIZE', 16)),
+            max_streams=int(os.environ.get('RELAY_MAX_STREAMS', 32)),
+            max_rate=int(os.environ.get('RELAY_MAX_RATE', 0)),
+        )
+
+    def open(self, url, range_header=None):
+        """Start relaying url, forwarding an optional Range header"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise StreamLimitExceeded("Too many active streams, please try again later")
+
+        headers = {'Range': range_header} if range_header else {}
+        try:
+            upstream = self.session.get(url, headers=headers, stream=True, timeout=self.timeout)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.active += 1
+        return RelayStream(self, upstream)
+
+    def _finish(self, bytes_sent, seconds):
+        with self._lock:
+            self.active -= 1
+            self.completed += 1
+            self.bytes_sent += bytes_sent
+            self._recent.append((bytes_sent, seconds))
+        self._slots.release()
+        rate = bytes_sent / seconds if seconds > 0 else 0
+        logger.info(f"Relayed {bytes_sent} bytes in {seconds:.2f}s ({rate / 1024 / 1024:.2f} MB/s)")
+
+    def stats(self):
+        """Return stream counters and recent per-stream throughput"""
+        with self._lock:
+            rates = [b / s for b, s in self._recent if s > 0]
+            return {
+                'active': self.active,
+                'max_streams': self.max_streams,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'bytes_sent': self.bytes_sent,
+                'chunk_size': self.chunk_size,
+                'max_rate': self.max_rate,
+                'avg_stream_throughput': round(sum(rates) / len(rates)) if rates else None,
+            }
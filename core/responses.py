@@ -0,0 +1,140 @@
+"""
+Response helpers for the video info API: fast JSON, ETags, compression and Cache-Control
+
+orjson and brotli are optional; without them the stdlib json encoder and gzip are used.
+"""
+
+import os
+import gzip
+import json
+import time
+import hashlib
+import logging
+
+from core.cache import info_expiry
+from core.tracing import span
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+# Keep browser caching well clear of the signed URL expiry
+CACHE_EXPIRY_MARGIN = int(os.environ.get('RESPONSE_CACHE_MARGIN', 300))
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def _orjson_dumps(obj):
+    return orjson.dumps(obj)
+
+
+JSON_ENCODERS = {'json': _stdlib_dumps}
+if orjson is not None:
+    JSON_ENCODERS['orjson'] = _orjson_dumps
+
+
+def get_json_encoder(name=None):
+    """Return a dumps(obj) -> bytes function; 'auto' picks the fastest one installed"""
+    name = (name or os.environ.get('JSON_ENCODER', 'auto')).lower()
+    if name == 'auto':
+        name = 'orjson' if 'orjson' in JSON_ENCODERS else 'json'
+    if name not in JSON_ENCODERS:
+        logger.warning(f"JSON encoder '{name}' is not available, falling back to json")
+        name = 'json'
+    return JSON_ENCODERS[name]
+
+
+dumps = get_json_encoder()
+
+
+def negotiate_encoding(accept_encoding):
+    """Pick the best content coding the client accepts: br, then gzip, else None"""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            accepted[coding.lower()] = quality
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def video_etag(video_info, filters=None):
+    """Weak ETag from the video ID, the extraction that produced it and the filters applied"""
+    key = f"{video_info.get('video_id')}:{video_info.get('resolved_at')}:{sorted((filters or {}).items())}"
+    return 'W/"' + hashlib.blake2b(key.encode('utf-8'), digest_size=10).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # Weak comparison: ignore W/ prefixes on both sides
+    bare = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if (candidate[2:] if candidate.startswith('W/') else candidate) == bare:
+            return True
+    return False
+
+
+def cache_control(video_info, now=None):
+    """Cache-Control that lets clients reuse a response until shortly before its URLs expire"""
+    expire = info_expiry(video_info)
+    if not expire:
+        return 'no-cache'
+    max_age = int(expire - (now or time.time()) - CACHE_EXPIRY_MARGIN)
+    # Signed URLs can be bound to the requesting IP, so shared caches must not store them
+    return f'private, max-age={max_age}' if max_age > 0 else 'no-cache'
+
+
+def video_response(video_info, filters=None, if_none_match=None, accept_encoding=None):
+    """Build (status, headers, body) for a video info response, honouring If-None-Match"""
+    etag = video_etag(video_info, filters)
+    headers = {
+        'ETag': etag,
+        'Cache-Control': cache_control(video_info),
+        'Vary': 'Accept-Encoding',
+    }
+    if etag_matches(if_none_match, etag):
+        return 304, headers, b''
+
+    with span('serialize') as timing:
+        body = dumps(video_info)
+        encoding = negotiate_encoding(accept_encoding) if len(body) >= COMPRESS_MIN_SIZE else None
+        if encoding:
+            body = compress(body, encoding)
+            headers['Content-Encoding'] = encoding
+        timing.set(bytes=len(body), encoding=encoding or 'identity')
+    headers['Content-Type'] = 'application/json'
+    headers['Content-Length'] = str(len(body))
+    return 200, headers, body
@@ -0,0 +1,392 @@
+"""
+Segmented, resumable downloads of one media URL over several pooled connections
+
+googlevideo throttles each connection, so a large format is fetched as byte
+ranges in parallel. Segments are written with os.pwrite into a file that is
+preallocated to the full size, and finished segments are recorded in a small
+JSON sidecar so an interrupted download resumes where it stopped. Every
+response's Content-Range is checked against the expected offset and total,
+and the file size is verified at the end. A 403 part-way through means the
+signed URL expired: the caller's resolve() supplies a fresh one and the
+remaining segments continue from it.
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from core.relay import StreamLimitExceeded, build_session
+from core.tracing import span
+
+logger = logging.getLogger(__name__)
+
+_CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+
+
+class DownloadError(Exception):
+    """Raised when a download cannot be completed or does not verify"""
+
+
+class URLExpired(DownloadError):
+    """Upstream answered 403: the signed URL has to be resolved again"""
+
+
+if hasattr(os, 'pwrite'):
+    def _write_at(fd, data, offset):
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view = view[written:]
+            offset += written
+else:
+    # Without pwrite (Windows) segments share the file offset, so seek and write under a lock
+    _seek_lock = threading.Lock()
+
+    def _write_at(fd, data, offset):
+        view = memoryview(data)
+        with _seek_lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            while view:
+                view = view[os.write(fd, view):]
+
+
+def _preallocate(fd, size):
+    """Give the file its final size up front, reserving the blocks where the filesystem allows"""
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            pass
+    os.ftruncate(fd, size)
+
+
+class _Source:
+    """The URL being downloaded, re-resolved (at most `limit` times) when it expires"""
+
+    def __init__(self, url, resolve=None, limit=2):
+        self.url = url
+        self.resolve = resolve
+        self.limit = limit
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def current(self):
+        with self._lock:
+            return self.url, self.generation
+
+    def expired(self, generation):
+        """Replace the URL that returned 403; concurrent segments share one re-resolve"""
+        with self._lock:
+            if generation != self.generation:
+                return False
+            if not self.resolve or self.generation >= self.limit:
+                raise DownloadError("Upstream URL expired (HTTP 403)")
+            logger.info("Download URL expired, resolving it again")
+            self.url = self.resolve()
+            self.generation += 1
+            return True
+
+
+class _Progress:
+    """Which segments of a preallocated file are complete, saved to an optional sidecar file"""
+
+    def __init__(self, path, size, segment_size, done=()):
+        self.path = path
+        self.size = size
+        self.segment_size = segment_size
+        self.count = max(1, -(-size // segment_size))
+        self.done = set(done)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path, size, segment_size):
+        """Read the sidecar; it only counts when it describes a file of the same size and layout"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('size') == size and data.get('segment_size') == segment_size:
+                return cls(path, size, segment_size, data.get('done', ()))
+        except (OSError, ValueError, TypeError):
+            pass
+        return cls(path, size, segment_size)
+
+    def bounds(self, index):
+        start = index * self.segment_size
+        return start, min(self.size, start + self.segment_size) - 1
+
+    def mark(self, index):
+        with self._lock:
+            self.done.add(index)
+            if self.path:
+                snapshot = json.dumps({'size': self.size, 'segment_size': self.segment_size,
+                                       'done': sorted(self.done)})
+                tmp_path = f'{self.path}.{threading.get_ident()}.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(snapshot)
+                os.replace(tmp_path, self.path)
+
+    def complete(self):
+        with self._lock:
+            return len(self.done) == self.count
+
+    def remove(self):
+        if self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+class SegmentedDownloader:
+    """Download a URL into a file as parallel byte ranges, resumable and verified"""
+
+    def __init__(self, connections=4, segment_size=8 * 1024 ** 2, retries=3, max_downloads=4,
+                 chunk_size=256 * 1024, timeout=(5, 30)):
+        self.connections = max(1, connections)
+        self.segment_size = segment_size
+        self.retries = retries
+        self.max_downloads = max_downloads
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        # Enough keep-alive connections for every segment of every concurrent download
+        self.session = build_session(pool_size=self.connections * max(1, max_downloads))
+        self._slots = threading.BoundedSemaphore(max(1, max_downloads))
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=100)  # (bytes, seconds) of recently finished downloads
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.resumed = 0
+        self.retried = 0
+        self.reresolved = 0
+        self.bytes_downloaded = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build a downloader from DOWNLOAD_* environment variables"""
+        return cls(
+            connections=int(os.environ.get('DOWNLOAD_CONNECTIONS', 4)),
+            segment_size=int(os.environ.get('DOWNLOAD_SEGMENT_SIZE', 8 * 1024 ** 2)),
+            retries=int(os.environ.get('DOWNLOAD_RETRIES', 3)),
+            max_downloads=int(os.environ.get('DOWNLOAD_MAX_ACTIVE', 4)),
+        )
+
+    def download(self, url, f, resolve=None, progress_path=None, reserve=None):
+        """Fetch url into the binary file f (opened for reading and writing) and return its size.
+
+        resolve() returns a fresh URL when the current one answers 403.
+        progress_path names the sidecar that lets a later call with the same
+        file resume; without it an interrupted download starts over.
+        reserve(size) is called with the total size before the file is
+        preallocated (e.g. FileStore.reserve to make room under its quota).
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise StreamLimitExceeded("Too many active downloads, please try again later")
+        with self._lock:
+            self.active += 1
+        started = time.monotonic()
+        source = _Source(url, resolve)
+        size = None
+        try:
+            with span('segmented_download') as timing:
+                size = self._download(source, f, progress_path, reserve, timing)
+        except BaseException:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.reresolved += source.generation
+            self._slots.release()
+        seconds = time.monotonic() - started
+        with self._lock:
+            self.completed += 1
+            self._recent.append((size, seconds))
+        logger.info(f"Downloaded {size} bytes in {seconds:.2f}s ({size / max(seconds, 1e-6) / 1024 / 1024:.2f} MB/s)")
+        return size
+
+    def _download(self, source, f, progress_path, reserve, timing):
+        size, ranged = self._probe(source)
+        if reserve and size:
+            reserve(size)
+        fd = f.fileno()
+        if not ranged:
+            # No Range support upstream: one sequential stream, restarted from scratch on failure
+            timing.set(bytes=size, segments=1)
+            return self._fetch_whole(source, fd, size)
+
+        if os.fstat(fd).st_size == size and progress_path:
+            progress = _Progress.load(progress_path, size, self.segment_size)
+        else:
+            progress = _Progress(progress_path, size, self.segment_size)
+            _preallocate(fd, size)
+        pending = [index for index in range(progress.count) if index not in progress.done]
+        if len(pending) < progress.count:
+            with self._lock:
+                self.resumed += 1
+            logger.info(f"Resuming download: {progress.count - len(pending)} of {progress.count} segments already done")
+        timing.set(bytes=size, segments=progress.count, pending=len(pending))
+
+        abort = threading.Event()
+        with ThreadPoolExecutor(max_workers=min(self.connections, max(1, len(pending))),
+                                thread_name_prefix='segment') as pool:
+            futures = [pool.submit(self._fetch_segment, source, fd, progress, index, abort) for index in pending]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except BaseException:
+                # Segments already running stop at their next chunk; finished ones stay recorded
+                abort.set()
+                raise
+
+        if not progress.complete():
+            raise DownloadError("Download ended with missing segments")
+        actual = os.fstat(fd).st_size
+        if actual != size:
+            raise DownloadError(f"Downloaded file is {actual} bytes, expected {size}")
+        progress.remove()
+        return size
+
+    def _probe(self, source):
+        """Return (total size or None, whether byte ranges are supported) from a one-byte request"""
+        for attempt in range(self.retries + 1):
+            url, generation = source.current()
+            try:
+                response = self.session.get(url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=self.timeout)
+            except requests.RequestException:
+                if attempt == self.retries:
+                    raise
+                self._backoff(attempt)
+                continue
+            try:
+                if response.status_code == 403:
+                    source.expired(generation)
+                    continue
+                if response.status_code == 206:
+                    match = _CONTENT_RANGE.fullmatch(response.headers.get('Content-Range', ''))
+                    if not match:
+                        raise DownloadError("Upstream sent a partial response without a usable Content-Range")
+                    return int(match.group(3)), True
+                if response.status_code == 200:
+                    length = response.headers.get('Content-Length')
+                    return (int(length) if length else None), False
+                raise DownloadError(f"Upstream returned HTTP {response.status_code}")
+            finally:
+                response.close()
+        raise DownloadError("Upstream URL kept expiring")
+
+    def _fetch_segment(self, source, fd, progress, index, abort):
+        start, end = progress.bounds(index)
+        # Retries continue from the last byte written rather than the start of the segment
+        cursor = [start]
+        attempt = 0
+        while not abort.is_set():
+            url, generation = source.current()
+            try:
+                self._fetch_range(url, fd, cursor, end, progress.size, abort)
+                if cursor[0] == end + 1:
+                    progress.mark(index)
+                return
+            except URLExpired:
+                source.expired(generation)
+            except (requests.RequestException, OSError, DownloadError) as e:
+                if attempt >= self.retries:
+                    raise
+                logger.warning(f"Segment {index} failed at byte {cursor[0]}, retrying: {str(e)}")
+                with self._lock:
+                    self.retried += 1
+                self._backoff(attempt)
+                attempt += 1
+
+    def _fetch_range(self, url, fd, cursor, end, size, abort):
+        response = self.session.get(url, headers={'Range': f'bytes={cursor[0]}-{end}'}, stream=True,
+                                    timeout=self.timeout)
+        try:
+            if response.status_code == 403:
+                raise URLExpired("Upstream URL expired (HTTP 403)")
+            if response.status_code != 206:
+                raise DownloadError(f"Upstream returned HTTP {response.status_code} for a range request")
+            match = _CONTENT_RANGE.fullmatch(response.headers.get('Content-Range', ''))
+            if not match or int(match.group(1)) != cursor[0] or int(match.group(3)) != size:
+                raise DownloadError(f"Unexpected Content-Range {response.headers.get('Content-Range')!r} "
+                                    f"for bytes {cursor[0]}-{end} of {size}")
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                if abort.is_set():
+                    return
+                if not chunk:
+                    continue
+                if cursor[0] + len(chunk) > end + 1:
+                    raise DownloadError("Upstream sent more bytes than requested")
+                _write_at(fd, chunk, cursor[0])
+                cursor[0] += len(chunk)
+                with self._lock:
+                    self.bytes_downloaded += len(chunk)
+            if cursor[0] != end + 1:
+                raise DownloadError(f"Connection closed at byte {cursor[0]}, expected {end + 1}")
+        finally:
+            response.close()
+
+    def _fetch_whole(self, source, fd, size):
+        for attempt in range(self.retries + 1):
+            url, generation = source.current()
+            written = 0
+            try:
+                response = self.session.get(url, stream=True, timeout=self.timeout)
+                try:
+                    if response.status_code == 403:
+                        raise URLExpired("Upstream URL expired (HTTP 403)")
+                    if response.status_code != 200:
+                        raise DownloadError(f"Upstream returned HTTP {response.status_code}")
+                    os.ftruncate(fd, 0)
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        if chunk:
+                            _write_at(fd, chunk, written)
+                            written += len(chunk)
+                            with self._lock:
+                                self.bytes_downloaded += len(chunk)
+                finally:
+                    response.close()
+                if size is not None and written != size:
+                    raise DownloadError(f"Downloaded {written} bytes, expected {size}")
+                return written
+            except URLExpired:
+                source.expired(generation)
+            except (requests.RequestException, OSError, DownloadError):
+                if attempt == self.retries:
+                    raise
+                self._backoff(attempt)
+        raise DownloadError("Upstream URL kept expiring")
+
+    def _backoff(self, attempt):
+        time.sleep(min(0.5 * 2 ** attempt, 5))
+
+    def stats(self):
+        """Return download counters and recent per-download throughput"""
+        with self._lock:
+            rates = [b / s for b, s in self._recent if s > 0 and b]
+            return {
+                'active': self.active,
+                'max_active': self.max_downloads,
+                'connections': self.connections,
+                'segment_size': self.segment_size,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'resumed': self.resumed,
+                'retried_segments': self.retried,
+                'reresolved_urls': self.reresolved,
+                'bytes_downloaded': self.bytes_downloaded,
+                'avg_throughput': round(sum(rates) / len(rates)) if rates else None,
+            }
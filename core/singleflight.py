@@ -0,0 +1,67 @@
+"""
+Single-flight coalescing of concurrent calls for the same key
+"""
+
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run one call per key at a time; concurrent callers share its outcome"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """Call fn for key, or wait for the call already in flight and reuse its result"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        """Number of keys currently being executed"""
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        """Return coalescing counters for monitoring"""
+        with self._lock:
+            total = self.executed + self.coalesced
+            return {
+                'executed': self.executed,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._calls),
+                'coalesced_ratio': round(self.coalesced / total, 4) if total else 0.0,
+            }
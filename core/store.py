@@ -0,0 +1,441 @@
+"""
+Content-addressed file store with a byte quota, LRU eviction and single-flight fills
+
+Files live at <root>/<key>, where a key is a relative path such as
+'dQw4w9WgXcQ/137.mp4'. A fill is written to a temporary file next to its final
+path and renamed into place, so readers never see a partial file. An index of
+size and last access is kept in memory and saved to <root>/index.json.
+
+Several processes (gunicorn workers) may share one root. Files stored by
+another process are picked up from disk on lookup, and the quota is enforced
+against what is actually on disk: before evicting or saving the index, a
+process takes an flock on <root>/.lock, rescans the root (in-progress partial
+files count against the quota) and merges index.json with its own entries.
+
+Resumable fills use a fixed partial name (<key>.resume.part, plus an optional
+<key>.resume.part.progress sidecar written by the fill) that is kept when the
+fill fails, so the next fill of the key can continue where it stopped. Files
+with .resume.part in their name are never indexed as keys.
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+
+from core.singleflight import SingleFlight
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = 'index.json'
+# A plain partial file untouched this long belongs to a fill that died (seconds); younger ones may be in use
+PARTIAL_GRACE = 600
+# Serialises index and quota updates between processes (never a valid key: it starts with '.')
+LOCK_NAME = '.lock'
+PARTIAL_SUFFIX = '.part'
+RESUMABLE_SUFFIX = '.resume' + PARTIAL_SUFFIX
+# Sidecar a resumable fill may keep next to its partial file (core.segmented records progress in it)
+PROGRESS_SUFFIX = '.progress'
+# Path components: letters, digits, '-', '_' and '.', never starting with '.'
+_SAFE_CHARS = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_.')
+
+
+def make_key(*parts):
+    """Build a key from arbitrary strings, replacing characters the store does not allow"""
+    safe = [''.join(c if c in _SAFE_CHARS else '_' for c in str(part)).lstrip('.') or '_' for part in parts]
+    return '/'.join(safe)
+
+
+class StoreFull(Exception):
+    """Raised when a file cannot fit within the store quota"""
+
+
+def _check_key(key):
+    parts = key.split('/')
+    if not parts or any(not part or part[0] == '.' or not set(part) <= _SAFE_CHARS for part in parts):
+        raise ValueError(f"Invalid store key: {key!r}")
+    if key.endswith(PARTIAL_SUFFIX) or RESUMABLE_SUFFIX in key or key == INDEX_NAME:
+        raise ValueError(f"Invalid store key: {key!r}")
+    return key
+
+
+class FileStore:
+    """Bounded on-disk store; fetch() fills a missing key once however many callers ask"""
+
+    def __init__(self, root, max_bytes=2 * 1024 ** 3, index_interval=30, resume_max_age=86400):
+        self.root = root
+        self.max_bytes = max_bytes
+        # Access times alone are saved to the index at most this often (seconds)
+        self.index_interval = index_interval
+        # Interrupted resumable fills untouched for longer than this are deleted (seconds)
+        self.resume_max_age = resume_max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = {}  # key -> {'size': bytes, 'last_access': epoch seconds, 'meta': dict}
+        self._total = 0
+        # Bytes in partial files of fills still running (in any process), as of the last rescan
+        self._partial_bytes = 0
+        self._lock = threading.Lock()
+        self._fills = SingleFlight()
+        self._saved_at = 0.0
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    @classmethod
+    def from_env(cls, root, prefix='DOWNLOAD_STORE', max_bytes=2 * 1024 ** 3):
+        """Build a store from <prefix>_MAX_BYTES"""
+        return cls(root, max_bytes=int(os.environ.get(f'{prefix}_MAX_BYTES', max_bytes)))
+
+    def path(self, key):
+        return os.path.join(self.root, *_check_key(key).split('/'))
+
+    def get(self, key):
+        """Return the local path for key and mark it recently used, or None"""
+        path = self.path(key)
+        with self._lock:
+            known = key in self._entries
+        if not known and os.path.exists(path):
+            # Stored by another process sharing this root
+            self._adopt([key])
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not os.path.exists(path):
+                if entry is not None:
+                    self._forget(key)
+                self.misses += 1
+                return None
+            entry['last_access'] = time.time()
+            self.hits += 1
+        self._maybe_save()
+        return path
+
+    def metadata(self, key):
+        """Return the metadata saved with key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return dict(entry.get('meta') or {}) if entry else None
+
+    def find(self, base):
+        """Return the most recently used key that is `base` plus a file extension, or None"""
+        prefix = base + '.'
+        for attempt in range(2):
+            with self._lock:
+                matches = [(entry['last_access'], key) for key, entry in self._entries.items()
+                           if key.startswith(prefix) and '.' not in key[len(prefix):]]
+            if matches or attempt:
+                break
+            # Not known here; another process sharing the root may have stored it
+            directory, _, name = self.path(base).rpartition(os.sep)
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                break
+            stem = base.rpartition('/')[0]
+            candidates = [f'{stem}/{n}' if stem else n for n in names
+                          if n.startswith(name + '.') and '.' not in n[len(name) + 1:]]
+            if not candidates:
+                break
+            self._adopt(candidates)
+        return max(matches)[1] if matches else None
+
+    def fetch(self, key, fill, meta=None, resumable=False):
+        """Return the path for key, calling fill(file) to write it on a miss.
+
+        Concurrent callers for the same key share a single fill. `fill` receives
+        a binary file opened for writing and may raise to abandon the fill.
+        `meta` is a small JSON-serialisable dict kept in the index with the file.
+        With resumable=True the file is opened read/write without truncation
+        and is kept if the fill raises; its name plus PROGRESS_SUFFIX is where
+        the fill may record how far it got.
+        """
+        path = self.get(key)
+        if path is not None:
+            return path
+        return self._fills.do(key, self._fill, key, fill, meta, resumable)
+
+    def put(self, key, data, meta=None):
+        """Store bytes under key and return its path"""
+        return self._fill(key, lambda f: f.write(data), meta)
+
+    def _fill(self, key, fill, meta=None, resumable=False):
+        path = self.path(key)
+        with self._lock:
+            # Another fill may have finished between get() and acquiring the flight
+            if key in self._entries and os.path.exists(path):
+                return path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        f = self._open_resumable(f'{path}{RESUMABLE_SUFFIX}') if resumable else None
+        resuming = f is not None
+        if not resuming:
+            # Not resumable, or another process is already filling the resumable partial
+            f = open(f'{path}.{uuid.uuid4().hex[:8]}{PARTIAL_SUFFIX}', 'wb')
+        partial = f.name
+        try:
+            with f:
+                fill(f)
+                f.flush()
+                size = os.fstat(f.fileno()).st_size
+                if size > self.max_bytes:
+                    raise StoreFull(f"File of {size} bytes exceeds the store quota of {self.max_bytes} bytes")
+                if resuming:
+                    # Renamed while the lock is still held, so no other process resumes a finished file
+                    os.replace(partial, path)
+            if not resuming:
+                os.replace(partial, path)
+        except BaseException as e:
+            if not resuming or isinstance(e, StoreFull):
+                self._remove_partial(partial)
+                self._remove_partial(partial + PROGRESS_SUFFIX)
+            raise
+        if resuming:
+            self._remove_partial(partial + PROGRESS_SUFFIX)
+
+        with self._lock:
+            if key in self._entries:
+                self._total -= self._entries[key]['size']
+            self._entries[key] = {'size': size, 'last_access': time.time(), 'meta': meta or {}}
+            self._total += size
+        with self._disk_lock():
+            self._sync()
+            with self._lock:
+                evicted = self._evict(keep=key)
+            for victim in evicted:
+                self._remove_file(victim)
+            self._write_index()
+        logger.info(f"Stored {key} ({size} bytes, {len(evicted)} evicted)")
+        return path
+
+    def _open_resumable(self, partial):
+        """Open the fixed partial file of a resumable fill, or return None if another process holds it"""
+        # Created if missing but never truncated, unlike mode 'wb'
+        f = open(partial, 'r+b', opener=lambda name, flags: os.open(name, os.O_RDWR | os.O_CREAT, 0o644))
+        if fcntl is None:
+            return f
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # The previous holder may have renamed it into place between our open and lock
+            if os.fstat(f.fileno()).st_ino == os.stat(partial).st_ino:
+                return f
+        except OSError:
+            pass
+        f.close()
+        return None
+
+    @staticmethod
+    def _remove_partial(partial):
+        try:
+            os.remove(partial)
+        except OSError:
+            pass
+
+    def reserve(self, size):
+        """Evict least recently used files until `size` more bytes fit; raise StoreFull if it never can"""
+        if size > self.max_bytes:
+            raise StoreFull(f"File of {size} bytes exceeds the store quota of {self.max_bytes} bytes")
+        with self._disk_lock():
+            # Other processes' files and running fills count too
+            self._sync()
+            with self._lock:
+                evicted = self._evict(extra=size)
+            for victim in evicted:
+                self._remove_file(victim)
+            if evicted:
+                self._write_index()
+
+    def invalidate(self, key):
+        with self._lock:
+            known = key in self._entries
+            self._forget(key)
+        if known:
+            self._remove_file(key)
+            self._save()
+
+    def _evict(self, keep=None, extra=0):
+        """Drop least recently used entries until under quota (lock must be held)"""
+        extra += self._partial_bytes
+        if self._total + extra <= self.max_bytes:
+            return []
+        victims = []
+        for key, entry in sorted(self._entries.items(), key=lambda item: item[1]['last_access']):
+            if self._total + extra <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            self._forget(key)
+            self.evictions += 1
+            victims.append(key)
+        return victims
+
+    def _forget(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total -= entry['size']
+
+    def _remove_file(self, key):
+        # Unlinking is safe while a reader still has the file open
+        path = self.path(key)
+        try:
+            os.remove(path)
+            directory = os.path.dirname(path)
+            if directory != self.root and not os.listdir(directory):
+                os.rmdir(directory)
+        except OSError:
+            pass
+
+    def _load(self):
+        """Rebuild the index from disk, taking only access times and metadata from index.json"""
+        with self._disk_lock():
+            saved = self._read_index()
+            files, self._partial_bytes = self._scan()
+        for key, stat in files.items():
+            previous = saved.get(key, {})
+            self._entries[key] = {
+                'size': stat.st_size,
+                'last_access': previous.get('last_access', stat.st_mtime),
+                'meta': previous.get('meta', {}),
+            }
+            self._total += stat.st_size
+
+        evicted = self._evict()
+        for victim in evicted:
+            self._remove_file(victim)
+        if self._entries or saved:
+            self._save()
+
+    def _scan(self):
+        """Walk the root; return ({key: stat} of stored files, bytes held by partial files).
+
+        Partial files left by fills that died are deleted: plain ones once idle
+        for PARTIAL_GRACE, resumable ones (kept to be continued) after resume_max_age.
+        """
+        files = {}
+        partial_bytes = 0
+        now = time.time()
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                full = os.path.join(directory, name)
+                key = os.path.relpath(full, self.root).replace(os.sep, '/')
+                if name.endswith(PARTIAL_SUFFIX) or RESUMABLE_SUFFIX in name:
+                    max_age = self.resume_max_age if RESUMABLE_SUFFIX in name else PARTIAL_GRACE
+                    try:
+                        stat = os.stat(full)
+                        if now - stat.st_mtime >= max_age:
+                            os.remove(full)
+                        else:
+                            partial_bytes += stat.st_size
+                    except OSError:
+                        pass
+                    continue
+                if key == INDEX_NAME:
+                    continue
+                try:
+                    _check_key(key)
+                    files[key] = os.stat(full)
+                except (ValueError, OSError):
+                    continue
+        return files, partial_bytes
+
+    def _sync(self):
+        """Merge what other processes stored or removed into the index (disk lock must be held)"""
+        saved = self._read_index()
+        files, partial_bytes = self._scan()
+        with self._lock:
+            entries = {}
+            for key, stat in files.items():
+                entry = self._entries.get(key)
+                previous = saved.get(key, {})
+                last_access = max(entry['last_access'] if entry else 0,
+                                  previous.get('last_access', 0)) or stat.st_mtime
+                meta = (entry.get('meta') if entry else None) or previous.get('meta', {})
+                entries[key] = {'size': stat.st_size, 'last_access': last_access, 'meta': meta}
+            self._entries = entries
+            self._total = sum(entry['size'] for entry in entries.values())
+            self._partial_bytes = partial_bytes
+
+    def _adopt(self, keys):
+        """Index files that another process stored, with the metadata it saved"""
+        saved = self._read_index()
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    continue
+                try:
+                    _check_key(key)
+                    stat = os.stat(self.path(key))
+                except (ValueError, OSError):
+                    continue
+                previous = saved.get(key, {})
+                self._entries[key] = {
+                    'size': stat.st_size,
+                    'last_access': previous.get('last_access', stat.st_mtime),
+                    'meta': previous.get('meta', {}),
+                }
+                self._total += stat.st_size
+
+    @contextmanager
+    def _disk_lock(self):
+        """Hold the root's flock, serialising index and quota updates with other processes"""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.root, LOCK_NAME), 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.root, INDEX_NAME), encoding='utf-8') as f:
+                saved = json.load(f)
+            return saved if isinstance(saved, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _maybe_save(self):
+        if time.monotonic() - self._saved_at >= self.index_interval:
+            self._save()
+
+    def _save(self):
+        with self._disk_lock():
+            self._sync()
+            self._write_index()
+
+    def _write_index(self):
+        """Write the merged index (disk lock must be held)"""
+        with self._lock:
+            snapshot = json.dumps(self._entries)
+            self._saved_at = time.monotonic()
+        index_path = os.path.join(self.root, INDEX_NAME)
+        partial = f'{index_path}.{uuid.uuid4().hex[:8]}{PARTIAL_SUFFIX}'
+        try:
+            with open(partial, 'w', encoding='utf-8') as f:
+                f.write(snapshot)
+            os.replace(partial, index_path)
+        except OSError as e:
+            logger.warning(f"Could not save store index: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'files': len(self._entries),
+                'bytes': self._total,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'filling': self._fills.in_flight(),
+            }
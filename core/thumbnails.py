@@ -0,0 +1,142 @@
+"""
+Thumbnail proxy: fetch a video's thumbnail once and keep resized WebP variants on disk
+
+The first request for any size of a video downloads the thumbnail from
+i.ytimg.com and writes every variant, so clients never contact YouTube for
+images. Resizing needs Pillow (a declared requirement); if it is missing the
+service runs degraded, logging a warning and serving the original JPEG for
+every size. Variants live in a FileStore, which bounds their total
+size and evicts the least recently used.
+"""
+
+import io
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+
+from core.relay import build_session
+from core.singleflight import SingleFlight
+from core.store import FileStore, make_key
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Variant name -> width in pixels (height keeps the source aspect ratio)
+SIZES = {'small': 160, 'medium': 320, 'large': 640}
+DEFAULT_SIZE = 'medium'
+
+THUMBNAIL_HOST = 'https://i.ytimg.com/vi'
+# Largest first; maxresdefault and sddefault are missing (404) for some uploads
+SOURCES = ('maxresdefault.jpg', 'sddefault.jpg', 'hqdefault.jpg')
+
+
+class ThumbnailNotFound(Exception):
+    """Raised when YouTube has no thumbnail for the video"""
+
+
+class ThumbnailService:
+    """Serve thumbnail variants from a FileStore, generating all of a video's variants in one flight"""
+
+    def __init__(self, store, quality=80, max_age=7 * 86400, host=THUMBNAIL_HOST, timeout=(5, 10)):
+        self.store = store
+        self.quality = quality
+        self.max_age = max_age
+        self.host = host
+        self.timeout = timeout
+        self.webp = Image is not None
+        if not self.webp:
+            logger.warning("Pillow is not installed: thumbnails are served as full-size JPEGs for every size")
+        self.session = build_session(pool_size=8)
+        self.generated = 0
+        self.not_found = 0
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build a service from THUMBNAIL_* environment variables"""
+        root = os.environ.get('THUMBNAIL_DIR') or os.path.join(tempfile.gettempdir(), 'youtube_thumbnails')
+        return cls(
+            FileStore.from_env(root, prefix='THUMBNAIL_STORE', max_bytes=256 * 1024 ** 2),
+            quality=int(os.environ.get('THUMBNAIL_QUALITY', 80)),
+            max_age=int(os.environ.get('THUMBNAIL_MAX_AGE', 7 * 86400)),
+        )
+
+    def key(self, video_id, size):
+        if not self.webp:
+            return make_key(video_id, 'original.jpg')
+        return make_key(video_id, f'{size}.webp')
+
+    def get(self, video_id, size=DEFAULT_SIZE):
+        """Return (path, metadata) for a variant, fetching the thumbnail on a miss"""
+        if size not in SIZES:
+            raise ValueError(f"size must be one of: {', '.join(SIZES)}")
+        key = self.key(video_id, size)
+        path = self.store.get(key)
+        if path is None:
+            # Keyed by video, so first requests for different sizes also share one fetch and resize
+            path = self._flights.do(video_id, self._generate, video_id)[size]
+        return path, self.store.metadata(key) or {}
+
+    def _generate(self, video_id):
+        """Download the thumbnail and store every variant; return size -> path"""
+        keys = {size: self.key(video_id, size) for size in SIZES}
+        if all(self.store.metadata(key) is not None for key in keys.values()):
+            # Generated by a flight that finished after this caller's lookup missed
+            return {size: self.store.path(key) for size, key in keys.items()}
+
+        source = self._download(video_id)
+        if not self.webp:
+            path = self.store.put(keys[DEFAULT_SIZE], source, self._meta(source, 'image/jpeg'))
+            paths = dict.fromkeys(SIZES, path)
+        else:
+            image = Image.open(io.BytesIO(source))
+            image = image.convert('RGB')
+            paths = {}
+            for size, width in SIZES.items():
+                data = self._resize(image, width)
+                paths[size] = self.store.put(keys[size], data, self._meta(data, 'image/webp'))
+        with self._lock:
+            self.generated += 1
+        logger.info(f"Generated thumbnails for {video_id} ({len(source)} byte source)")
+        return paths
+
+    def _download(self, video_id):
+        for name in SOURCES:
+            response = self.session.get(f'{self.host}/{video_id}/{name}', timeout=self.timeout)
+            if response.status_code == 200:
+                return response.content
+            if response.status_code != 404:
+                raise IOError(f'Thumbnail host returned HTTP {response.status_code}')
+        with self._lock:
+            self.not_found += 1
+        raise ThumbnailNotFound(f"No thumbnail found for video {video_id}")
+
+    def _resize(self, image, width):
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, 'WEBP', quality=self.quality, method=4)
+        return buffer.getvalue()
+
+    @staticmethod
+    def _meta(data, content_type):
+        # A content hash, so the ETag survives eviction and regeneration of identical bytes
+        return {'etag': hashlib.blake2b(data, digest_size=12).hexdigest(), 'content_type': content_type}
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'webp': self.webp,
+                'generated': self.generated,
+                'not_found': self.not_found,
+                'coalesced': self._flights.coalesced,
+            }
+        stats['store'] = self.store.stats()
+        return stats
@@ -0,0 +1,180 @@
+"""
+Per-request timing spans, reported as a Server-Timing header and one JSON log line
+
+A trace is started for each sampled HTTP request and kept in a context
+variable, so code anywhere below the handler (URL parsing, the cache, each
+extraction attempt, back-off sleeps, format processing, serialization) can
+open a span without a trace object being passed around. Outside a sampled
+request span() returns a shared no-op context manager, so an unsampled or
+disabled request pays for one ContextVar lookup per instrumented stage.
+
+TRACE_SAMPLE_RATE (0.0-1.0, default 1.0) is the fraction of requests traced;
+0 turns tracing off. Request IDs are assigned to every request regardless.
+"""
+
+import os
+import re
+import json
+import time
+import random
+import logging
+import contextvars
+import functools
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 1.0))
+# Later spans are left out of the header (the JSON log keeps them all); headers have size limits
+MAX_SERVER_TIMING_ENTRIES = 20
+
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._:-]{1,64}$')
+_current = contextvars.ContextVar('trace_span', default=None)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """A timed stage; nested spans opened inside it become its children"""
+
+    __slots__ = ('name', 'attrs', 'parent', 'start', 'duration', 'children', '_token')
+
+    def __init__(self, name, attrs=None, parent=None):
+        self.name = name
+        self.attrs = attrs or {}
+        self.parent = parent
+        self.start = None
+        self.duration = None
+        self.children = []
+        self._token = None
+
+    def __enter__(self):
+        if self.parent is not None:
+            self.parent.children.append(self)
+            # The parent's children list is the only link kept, so finished trees are freed without the GC
+            self.parent = None
+        self._token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        return False
+
+    def set(self, **attrs):
+        """Attach attributes (outcome, sizes, config names) to the span"""
+        self.attrs.update(attrs)
+
+    def elapsed(self):
+        if self.duration is not None:
+            return self.duration
+        return time.perf_counter() - self.start if self.start is not None else 0.0
+
+    def to_dict(self):
+        record = {'name': self.name, 'ms': round(self.elapsed() * 1000, 2), **self.attrs}
+        if self.children:
+            record['spans'] = [child.to_dict() for child in list(self.children)]
+        return record
+
+
+def span(name, **attrs):
+    """Time a block as a child of the current span; a no-op outside a sampled request"""
+    parent = _current.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(name, attrs, parent)
+
+
+def bind(fn):
+    """Carry the current trace into fn when it runs on another thread (e.g. a hedged attempt)"""
+    if _current.get() is None:
+        return fn
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def request_id(incoming=None):
+    """Reuse a well-formed X-Request-ID from the client or proxy, otherwise make a new one"""
+    if incoming and _REQUEST_ID.match(incoming):
+        return incoming
+    return os.urandom(8).hex()
+
+
+class Trace:
+    """The root span of one request plus the fields written to its log record"""
+
+    def __init__(self, name, request_id):
+        self.request_id = request_id
+        self.root = Span(name)
+        self.fields = {}
+        self.root.__enter__()
+
+    def finish(self, **fields):
+        """Stop the clock, detach from the current context and write the JSON log record"""
+        if self.root.duration is not None:
+            return self
+        self.root.duration = time.perf_counter() - self.root.start
+        try:
+            _current.reset(self.root._token)
+        except ValueError:
+            # Finished from a different context than it was started in
+            _current.set(None)
+        self.fields.update(fields)
+        logger.info(json.dumps(self.to_dict(), separators=(',', ':'), default=str))
+        return self
+
+    def to_dict(self):
+        record = self.root.to_dict()
+        return {'request_id': self.request_id, **self.fields, **record}
+
+    def server_timing(self):
+        """Server-Timing header value: every span flattened depth-first, then the total"""
+        entries = []
+        counts = {}
+
+        def walk(spans):
+            for child in list(spans):
+                if len(entries) >= MAX_SERVER_TIMING_ENTRIES:
+                    return
+                counts[child.name] = counts.get(child.name, 0) + 1
+                # Repeated stages (one per configuration attempt) get numbered metric names
+                name = child.name if counts[child.name] == 1 else f'{child.name}-{counts[child.name]}'
+                entry = f'{name};dur={child.elapsed() * 1000:.1f}'
+                if child.attrs:
+                    desc = ' '.join(f'{k}={v}' for k, v in child.attrs.items())
+                    entry += ';desc="' + desc.replace('\\', '').replace('"', '') + '"'
+                entries.append(entry)
+                walk(child.children)
+
+        walk(self.root.children)
+        entries.append(f'total;dur={self.root.elapsed() * 1000:.1f}')
+        return ', '.join(entries)
+
+
+def start_trace(name, request_id, sample_rate=None):
+    """Begin tracing the current request, or return None when it is not sampled"""
+    rate = SAMPLE_RATE if sample_rate is None else sample_rate
+    if rate <= 0 or (rate < 1 and random.random() >= rate):
+        return None
+    return Trace(name, request_id)
+
+
+def end_trace():
+    """Drop whatever trace is attached to the current context (request teardown)"""
+    if _current.get() is not None:
+        _current.set(None)
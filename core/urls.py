@@ -0,0 +1,134 @@
+"""
+YouTube URL parsing
+"""
+
+import re
+from collections import namedtuple
+
+# One compiled pattern recognises every supported host and path shape in a single pass:
+# youtu.be/ID, /watch?v=ID, /embed/ID, /v/ID, /e/ID, /shorts/ID, /live/ID and /playlist?list=ID
+# on www., m., music. and youtube-nocookie.com hosts, with or without a scheme.
+URL_RE = re.compile(r"""
+    \A\s*
+    (?:https?://)?
+    (?:
+        (?:www\.)?youtu\.be/(?P<short_id>[^/?#&\s]+)/?
+      | (?:(?:www|m|music)\.)?youtube(?:-nocookie)?\.com(?::\d+)?
+        (?:
+            /(?:embed|v|e|shorts|live)/(?P<path_id>[^/?#&\s]+)/?
+          | /(?:watch|playlist)/?
+          | /[^?#\s]*
+        )?
+    )
+    (?:\?(?P<query>[^#\s]*))?
+    (?:\#(?P<fragment>[^\s]*))?
+    \s*\Z
+""", re.VERBOSE | re.IGNORECASE)
+
+VIDEO_ID_RE = re.compile(r'[A-Za-z0-9_-]{11}')
+TIME_RE = re.compile(r'(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s?)?')
+
+# Rejection reasons carried by InvalidURLError
+EMPTY = 'empty'
+NOT_STRING = 'not_string'
+NOT_YOUTUBE = 'not_youtube'
+NO_VIDEO_ID = 'no_video_id'
+BAD_VIDEO_ID = 'bad_video_id'
+
+
+class InvalidURLError(ValueError):
+    """Raised when a URL is not a usable YouTube URL; `reason` says why"""
+
+    MESSAGES = {
+        EMPTY: 'URL is empty',
+        NOT_STRING: 'URL must be a string',
+        NOT_YOUTUBE: 'not a YouTube URL',
+        NO_VIDEO_ID: 'no video ID found',
+        BAD_VIDEO_ID: 'malformed video ID',
+    }
+
+    def __init__(self, reason, url=None):
+        self.reason = reason
+        self.url = url
+        super().__init__(f"Invalid YouTube URL: {self.MESSAGES.get(reason, reason)}")
+
+
+class ParsedURL(namedtuple('ParsedURL', ['video_id', 'playlist_id', 'start_time'])):
+    """Canonical parts of a YouTube URL"""
+
+    __slots__ = ()
+
+    @property
+    def watch_url(self):
+        return f'https://www.youtube.com/watch?v={self.video_id}' if self.video_id else None
+
+    @property
+    def playlist_url(self):
+        return f'https://www.youtube.com/playlist?list={self.playlist_id}' if self.playlist_id else None
+
+
+def _parse_time(value):
+    """Convert t=/start= values such as 90, 90s or 1h2m3s to seconds"""
+    match = TIME_RE.fullmatch(value)
+    if not match or not any(match.groups()):
+        return None
+    hours, minutes, seconds = (int(g) if g else 0 for g in match.groups())
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def parse_youtube_url(url, require_video=True):
+    """Parse a YouTube URL into a ParsedURL, raising InvalidURLError on rejection"""
+    if url is not None and not isinstance(url, str):
+        raise InvalidURLError(NOT_STRING, url)
+    if not url or not url.strip():
+        raise InvalidURLError(EMPTY, url)
+
+    match = URL_RE.match(url)
+    if not match:
+        raise InvalidURLError(NOT_YOUTUBE, url)
+
+    video_id = match.group('short_id') or match.group('path_id')
+    playlist_id = None
+    start_time = None
+
+    for part in (match.group('query'), match.group('fragment')):
+        if not part:
+            continue
+        for pair in part.split('&'):
+            key, _, value = pair.partition('=')
+            if key == 'v' and not video_id:
+                video_id = value
+            elif key == 'list' and value:
+                playlist_id = value
+            elif key in ('t', 'start') and value and start_time is None:
+                start_time = _parse_time(value)
+
+    if video_id and not VIDEO_ID_RE.fullmatch(video_id):
+        if require_video or not playlist_id:
+            raise InvalidURLError(BAD_VIDEO_ID, url)
+        video_id = None
+    if not video_id:
+        if playlist_id and not require_video:
+            return ParsedURL(None, playlist_id, start_time)
+        raise InvalidURLError(NO_VIDEO_ID, url)
+
+    return ParsedURL(video_id, playlist_id, start_time)
+
+
+def parse_many(urls, require_video=True):
+    """Parse many URLs; each result is a ParsedURL or the InvalidURLError for that input"""
+    results = []
+    for url in urls:
+        try:
+            results.append(parse_youtube_url(url, require_video))
+        except InvalidURLError as e:
+            results.append(e)
+    return results
+
+
+def extract_video_id(url):
+    """Return the canonical video ID contained in a YouTube URL, or None"""
+    try:
+        return parse_youtube_url(url).video_id
+    except InvalidURLError:
+        return None
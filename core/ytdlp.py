@@ -0,0 +1,100 @@
+"""
+Lazy access to yt-dlp
+
+Importing yt_dlp loads its whole extractor registry, which dominates serverless
+cold starts. Call load_yt_dlp() at the point an extraction actually runs.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+_yt_dlp = None
+_lock = threading.Lock()
+
+
+def load_yt_dlp():
+    """Import yt_dlp on first use and return the module"""
+    global _yt_dlp
+    if _yt_dlp is None:
+        with _lock:
+            if _yt_dlp is None:
+                import yt_dlp
+                _yt_dlp = yt_dlp
+    return _yt_dlp
+
+
+class YoutubeDLPool:
+    """Long-lived YoutubeDL instances per config profile, each used by one caller at a time.
+
+    Building a YoutubeDL parses options, sets up the opener and cookie jar and
+    registers extractors; reusing instances keeps that work and the keep-alive
+    connections across requests and warm serverless invocations.
+    """
+
+    def __init__(self, max_idle_per_profile=4, max_uses=500):
+        self.max_idle_per_profile = max_idle_per_profile
+        self.max_uses = max_uses
+        self._idle = {}  # profile -> [(ydl, uses)]
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build a pool from YDL_POOL_* environment variables"""
+        return cls(
+            max_idle_per_profile=int(os.environ.get('YDL_POOL_SIZE', 4)),
+            max_uses=int(os.environ.get('YDL_POOL_MAX_USES', 500)),
+        )
+
+    @contextmanager
+    def checkout(self, profile, params):
+        """Borrow an instance for profile, building one from params if none is idle"""
+        ydl, uses = None, 0
+        with self._lock:
+            idle = self._idle.get(profile)
+            if idle:
+                ydl, uses = idle.pop()
+                self.reused += 1
+        if ydl is None:
+            ydl = load_yt_dlp().YoutubeDL(params)
+            with self._lock:
+                self.created += 1
+
+        try:
+            yield ydl
+        finally:
+            self._checkin(profile, ydl, uses + 1)
+
+    def _checkin(self, profile, ydl, uses):
+        with self._lock:
+            idle = self._idle.setdefault(profile, [])
+            if uses < self.max_uses and len(idle) < self.max_idle_per_profile:
+                idle.append((ydl, uses))
+                return
+            self.discarded += 1
+        # Recycle instances past their use budget (or surplus to the pool) outside the lock
+        ydl.close()
+
+    def clear(self):
+        """Close every idle instance"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for instances in idle.values():
+            for ydl, _ in instances:
+                ydl.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'created': self.created,
+                'reused': self.reused,
+                'discarded': self.discarded,
+                'idle': {profile: len(instances) for profile, instances in self._idle.items()},
+            }
+
+
+# Shared by every request in this process
+ydl_pool = YoutubeDLPool.from_env()
@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 """
 Simple runner script for the YouTube Video Downloader
+
+    python3 run.py                  # development server (Werkzeug, reloader)
+    python3 run.py --production     # multi-process gunicorn server (or SERVER_MODE=production)
 """
 
 import os
@@ -31,11 +34,104 @@ def check_and_install_dependencies():
             print("  pip install Flask Flask-CORS yt-dlp requests Werkzeug")
             return False
 
+def rss_bytes():
+    """Current resident set size of this process"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        # Peak rather than current RSS where /proc is unavailable; kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+def preload():
+    """Import yt-dlp, its extractors and the app once, before workers are forked"""
+    from core.ytdlp import load_yt_dlp
+    load_yt_dlp()
+    from yt_dlp.extractor import gen_extractor_classes
+    gen_extractor_classes()
+    from app import app
+    return app
+
+def run_production(port):
+    """Serve the app with gunicorn: preloaded, multi-process, threaded, with worker recycling"""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("❌ Production mode requires gunicorn (not available on Windows), listed in requirements-dev.txt:")
+        print("  pip install -r requirements-dev.txt")
+        print("  # or just: pip install 'gunicorn>=21.2.0'")
+        sys.exit(1)
+    
+    workers = int(os.environ.get('WEB_WORKERS', os.cpu_count() or 2))
+    threads = int(os.environ.get('WEB_THREADS', 8))
+    graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 60))
+    max_rss = int(os.environ.get('WEB_MAX_RSS_MB', 512)) * 1024 * 1024
+    max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 1000))
+    
+    def post_request(worker, req, environ, resp):
+        # Let the worker finish its in-flight requests and exit; the arbiter starts a fresh one
+        if max_rss and worker.alive and rss_bytes() > max_rss:
+            worker.log.info(f"Worker {worker.pid} is above {max_rss // (1024 * 1024)} MB RSS, recycling")
+            worker.alive = False
+    
+    def worker_exit(server, worker):
+        # Background jobs are not HTTP requests, so gunicorn does not wait for them
+        from app import jobs
+        if not jobs.drain(graceful_timeout):
+            worker.log.warning(f"Worker {worker.pid} exited with jobs still queued")
+    
+    class ProductionServer(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+        
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+        
+        def load(self):
+            return self.application
+    
+    # Loaded in the master so workers share yt-dlp's modules copy-on-write
+    application = preload()
+    
+    # Job records only reach other workers through a cross-process backend (the download store syncs via its root)
+    from app import shared_backend
+    if workers > 1 and (shared_backend is None or shared_backend.kind == 'memory'):
+        print(f"⚠️  WEB_WORKERS={workers} needs SHARED_BACKEND=sqlite or redis so every worker can answer "
+              f"/api/jobs; using 1 worker")
+        workers = 1
+    options = {
+        'bind': f'0.0.0.0:{port}',
+        'workers': workers,
+        'worker_class': 'gthread',
+        'threads': threads,
+        'preload_app': True,
+        # Extractions that fall back through every configuration can take minutes
+        'timeout': int(os.environ.get('WEB_TIMEOUT', 180)),
+        'graceful_timeout': graceful_timeout,
+        'max_requests': max_requests,
+        'max_requests_jitter': max_requests // 10,
+        'post_request': post_request,
+        'worker_exit': worker_exit,
+        'accesslog': '-',
+    }
+    print(f"🚀 Starting YouTube Video Downloader (production: {workers} workers x {threads} threads) on port {port}")
+    ProductionServer(application, options).run()
+
 if __name__ == '__main__':
     # Check and install dependencies if needed
     if not check_and_install_dependencies():
         sys.exit(1)
     
+    port = int(os.environ.get('PORT', 5000))
+    if '--production' in sys.argv[1:] or os.environ.get('SERVER_MODE', '').lower() == 'production':
+        run_production(port)
+        sys.exit(0)
+    
     # Import after ensuring dependencies are available
     try:
         from app import app
@@ -48,7 +144,6 @@ if __name__ == '__main__':
     app.static_folder = '.'
     app.static_url_path = ''
     
-    port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('DEBUG', 'True').lower() == 'true'
     
     print(f"🚀 Starting YouTube Video Downloader on http://localhost:{port}")